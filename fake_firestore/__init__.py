@@ -18,6 +18,9 @@ except ImportError:  # pragma: no cover
     )
 
 from fake_firestore._helpers import Timestamp
+from fake_firestore._vector import DistanceMeasure
+from fake_firestore.aggregation import AggregationQuery, AggregationResult, FakeAggregationQuery
+from fake_firestore.async_aggregation import AsyncFakeAggregationQuery
 from fake_firestore.async_client import AsyncFakeFirestoreClient
 from fake_firestore.async_collection import AsyncFakeCollectionReference
 from fake_firestore.async_document import AsyncFakeDocumentReference
@@ -27,6 +30,7 @@ from fake_firestore.async_transaction import (
     AsyncFakeWriteBatch,
     async_transactional,
 )
+from fake_firestore.async_vector_query import AsyncFakeVectorQuery
 from fake_firestore.client import FakeFirestoreClient, MockFirestore
 from fake_firestore.collection import CollectionReference, FakeCollectionReference
 from fake_firestore.document import (
@@ -43,6 +47,7 @@ from fake_firestore.transaction import (
     WriteBatch,
     transactional,
 )
+from fake_firestore.vector_query import FakeVectorQuery, VectorQuery
 
 # Backward compatibility alias for async client
 AsyncMockFirestore = AsyncFakeFirestoreClient
@@ -62,6 +67,9 @@ __all__ = [
     "FakeQuery",
     "FakeTransaction",
     "FakeWriteBatch",
+    "FakeAggregationQuery",
+    "AggregationResult",
+    "FakeVectorQuery",
     # Async classes
     "AsyncFakeFirestoreClient",
     "AsyncFakeCollectionReference",
@@ -71,6 +79,8 @@ __all__ = [
     "AsyncFakeTransaction",
     "AsyncFakeWriteBatch",
     "async_transactional",
+    "AsyncFakeAggregationQuery",
+    "AsyncFakeVectorQuery",
     # Backward compatibility aliases
     "MockFirestore",
     "AsyncMockFirestore",
@@ -82,6 +92,9 @@ __all__ = [
     "Transaction",
     "WriteBatch",
     "transactional",
+    "AggregationQuery",
+    "VectorQuery",
     # Helpers
     "Timestamp",
+    "DistanceMeasure",
 ]
@@ -0,0 +1,88 @@
+"""Opt-in cache of query results.
+
+Entries are keyed by a query's fingerprint and carry the write version of
+the collection (or collection group) the query read. Every write to a
+collection gives it a new version, so an entry is only ever returned for
+the exact data it was computed from; stale entries are dropped when they
+are next looked up, or evicted in least-recently-used order.
+"""
+
+from __future__ import annotations
+
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# A cached result: the document reference, its stored fields and version.
+Result = Tuple[Any, Any, int]
+
+# Bytes held per cached result: its tuple and the list slot pointing to it.
+_RESULT_BYTES = sys.getsizeof((None, None, 0)) + 8
+
+
+class QueryCache:
+    """LRU cache of query results, bounded by entry count and estimated bytes.
+
+    Results share the stored documents with the store, so an entry's size
+    counts the cache's own containers only. ``hits``, ``misses`` and
+    ``evictions`` count lookups and removals since the cache was created.
+    """
+
+    __slots__ = ("max_entries", "max_bytes", "_entries", "_bytes", "hits", "misses", "evictions")
+
+    def __init__(self, max_entries: int = 128, max_bytes: Optional[int] = None) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, Tuple[int, List[Result], int]] = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, version: int) -> Optional[List[Result]]:
+        """Return the results cached under ``key`` for data at ``version``, if any."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != version:
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, version: int, results: List[Result]) -> None:
+        nbytes = sys.getsizeof(results) + len(results) * _RESULT_BYTES
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (version, results, nbytes)
+        self._bytes += nbytes
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes is not None and self._bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def info(self) -> Dict[str, int]:
+        """Counters and size of the cache, for ``FakeFirestoreClient.query_cache_info()``."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, nbytes = self._entries.pop(key)
+        self._bytes -= nbytes
@@ -2,14 +2,17 @@ from __future__ import annotations
 
 import random
 import string
+import sys
 from datetime import datetime as dt
 from functools import reduce
-from typing import Any, Dict, Iterator, Sequence, Tuple
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Sequence, Tuple
 
 KeyValuePair = Tuple[str, Dict[str, Any]]
 Document = Dict[str, Any]
-Collection = Dict[str, Document]
-Store = Dict[str, Collection]
+# What the store holds for a document: a ``Document``, or a frozen
+# ``MappingProxyType`` when the client uses frozen storage.
+StoredDocument = Mapping[str, Any]
 
 
 def get_by_path(data: Dict[str, Any], path: Sequence[str], create_nested: bool = False) -> Any:
@@ -38,6 +41,156 @@ def delete_by_path(data: Dict[str, Any], path: Sequence[str]) -> None:
     del get_by_path(data, path[:-1])[path[-1]]
 
 
+def projection_paths(field_paths: Iterable[str]) -> List[Tuple[str, ...]]:
+    """Split ``field_paths`` for ``project``, leaving out those within another one."""
+    paths = set(tuple(field_path.split(".")) for field_path in field_paths)
+    return [path for path in paths if not any(path[:end] in paths for end in range(1, len(path)))]
+
+
+def project(fields: StoredDocument, paths: Iterable[Sequence[str]]) -> Document:
+    """Return a document with only the fields of ``fields`` at the split field ``paths``.
+
+    The maps on the way to a nested field are rebuilt with only the selected
+    keys. The selected values are shared with ``fields``, not copied.
+    """
+    projected: Document = {}
+    for path in paths:
+        value: Any = fields
+        for part in path:
+            if not isinstance(value, Mapping) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = projected
+            for part in path[:-1]:
+                target = target.setdefault(part, {})
+            target[path[-1]] = value
+    return projected
+
+
+class FrozenList(tuple):  # type: ignore[type-arg]
+    """Read-only array value; compares with a list as a list with the same items would."""
+
+    __slots__ = ()
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, list):
+            return list(self) == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other: object) -> bool:
+        return not self == other
+
+    def __lt__(self, other: Any) -> bool:
+        if isinstance(other, list):
+            return list(self) < other
+        return tuple.__lt__(self, other)
+
+    def __le__(self, other: Any) -> bool:
+        if isinstance(other, list):
+            return list(self) <= other
+        return tuple.__le__(self, other)
+
+    def __gt__(self, other: Any) -> bool:
+        if isinstance(other, list):
+            return list(self) > other
+        return tuple.__gt__(self, other)
+
+    def __ge__(self, other: Any) -> bool:
+        if isinstance(other, list):
+            return list(self) >= other
+        return tuple.__ge__(self, other)
+
+    __hash__ = tuple.__hash__
+
+
+def freeze(value: Any) -> Any:
+    """Return a read-only copy of a document value.
+
+    Maps become ``MappingProxyType`` and arrays become ``FrozenList``. Values
+    that are already frozen are returned as-is, so freezing a document whose
+    untouched fields came from a previous version shares them structurally.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return FrozenList(freeze(v) for v in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Return a mutable copy of a frozen value; other values are returned as-is."""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, FrozenList):
+        return [thaw(v) for v in value]
+    return value
+
+
+# Map types a stored document can contain.
+_MAPS = (dict, MappingProxyType)
+
+
+def _string_size(value: str) -> int:
+    return (len(value) if value.isascii() else len(value.encode())) + 1
+
+
+def document_name_size(path: Sequence[str]) -> int:
+    """Storage size of a document name, following Firestore's size calculation."""
+    return sum(_string_size(segment) for segment in path) + 16
+
+
+def measure(value: Any) -> Tuple[int, int]:
+    """Return the Firestore storage size of a field value and the bytes it holds in memory.
+
+    The storage size follows Firestore's size calculation. A map's size is
+    the size of its field names and values, so the size of a whole
+    document's fields is ``measure(fields)[0]``. Both figures are computed in
+    a single pass; scalar entries of maps and arrays are measured inline.
+    """
+    getsizeof = sys.getsizeof
+    nbytes = getsizeof(value)
+    if isinstance(value, _MAPS):
+        size = 0
+        for k, v in value.items():
+            size += (len(k) if k.isascii() else len(k.encode())) + 1
+            nbytes += getsizeof(k)
+            kind = type(v)
+            if kind is str:
+                size += (len(v) if v.isascii() else len(v.encode())) + 1
+                nbytes += getsizeof(v)
+            elif kind is int or kind is float:
+                size += 8
+                nbytes += getsizeof(v)
+            else:
+                item_size, item_bytes = measure(v)
+                size += item_size
+                nbytes += item_bytes
+        return size, nbytes
+    if isinstance(value, (list, tuple)):
+        size = 0
+        for v in value:
+            item_size, item_bytes = measure(v)
+            size += item_size
+            nbytes += item_bytes
+        return size, nbytes
+    if isinstance(value, str):
+        return _string_size(value), nbytes
+    if value is None or isinstance(value, bool):
+        return 1, nbytes
+    if isinstance(value, (int, float)):
+        return 8, nbytes
+    if isinstance(value, bytes):
+        return len(value), nbytes
+    path = getattr(value, "path", None)
+    if isinstance(path, str):
+        return document_name_size(path.split("/")), nbytes
+    if hasattr(value, "latitude"):
+        return 16, nbytes
+    # Timestamps and other scalars.
+    return 8, nbytes
+
+
 def generate_random_string() -> str:
     return "".join(random.choice(string.ascii_letters + string.digits) for _ in range(20))
 
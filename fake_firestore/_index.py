@@ -0,0 +1,571 @@
+"""Single-field indexes over the documents of one collection.
+
+Indexes are built on first use by a query and then kept up to date by the
+store on every write. They only narrow down the candidate documents: queries
+still check every filter against each candidate, so an index may list a
+document that does not match, but never misses one a query should return.
+"""
+
+from __future__ import annotations
+
+import heapq
+import sys
+from bisect import bisect_left
+from copy import copy
+from datetime import datetime, timezone
+from itertools import product
+from math import isnan
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from fake_firestore._helpers import StoredDocument
+from fake_firestore._persistent import PostingLists, SortedKeys
+
+# Tags for the hashable stand-ins of maps and arrays (see ``index_key``).
+_ARRAY = object()
+_MAP = object()
+# Key for documents whose value cannot be hashed; always a candidate.
+_UNHASHABLE = object()
+# Returned by ``field_value`` for fields a document does not have.
+MISSING = object()
+# How many times larger than the smallest lookup a lookup can be for
+# ``intersect`` to read it whole rather than seek in it.
+_DENSE = 8
+
+# A query cursor as an index sees it: the values it gives for the ordered
+# fields, by field path, the ID of the document it was taken from, if any,
+# and whether it includes the documents at its position.
+Cursor = Tuple[Mapping[str, Any], Optional[str], bool]
+# A cursor position among sort keys, and whether it includes the keys at it.
+Bound = Tuple[Tuple[Any, ...], bool]
+
+
+class _Max:
+    """Compares greater than any other value; bounds bisections over index entries."""
+
+    __slots__ = ()
+
+    def __lt__(self, other: object) -> bool:
+        return False
+
+    def __le__(self, other: object) -> bool:
+        return other is self
+
+    def __gt__(self, other: object) -> bool:
+        return other is not self
+
+    def __ge__(self, other: object) -> bool:
+        return True
+
+
+_MAX = _Max()
+# Bytes held by a sort key: a tuple of a type rank and a value.
+_KEY_BYTES = sys.getsizeof((0, 0))
+# Range operators on a descending key, in terms of the ascending one.
+_FLIPPED = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+
+class _Descending:
+    """Wraps a sort key to reverse its order, for descending index fields."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: Any) -> None:
+        self.key = key
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, _Descending) and self.key == other.key
+
+    def __lt__(self, other: object) -> bool:
+        if isinstance(other, _Descending):
+            return bool(other.key < self.key)
+        return NotImplemented
+
+    def __gt__(self, other: object) -> bool:
+        if isinstance(other, _Descending):
+            return bool(other.key > self.key)
+        return NotImplemented
+
+    def __le__(self, other: object) -> bool:
+        if isinstance(other, _Descending):
+            return bool(other.key <= self.key)
+        return NotImplemented
+
+    def __ge__(self, other: object) -> bool:
+        if isinstance(other, _Descending):
+            return bool(other.key >= self.key)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+
+def field_value(fields: StoredDocument, path: Sequence[str], default: Any = None) -> Any:
+    """Return the value at a split field path, or ``default`` if the document has no such field."""
+    value: Any = fields
+    for part in path:
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError):
+            return default
+    return value
+
+
+def index_key(value: Any) -> Hashable:
+    """Return a hashable key that is equal for equal field values.
+
+    Maps and arrays (including frozen ones) are converted recursively. Raises
+    TypeError for values that cannot be hashed.
+    """
+    if isinstance(value, (dict, MappingProxyType)):
+        return (_MAP, frozenset((k, index_key(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return (_ARRAY, tuple(index_key(v) for v in value))
+    key: Hashable = value
+    hash(key)
+    return key
+
+
+def sort_key(value: Any) -> Tuple[Any, ...]:
+    """Return a key that orders field values the way Firestore does.
+
+    Values of different types order by type: null, booleans, NaN, numbers,
+    timestamps, strings, bytes, references, geo points, arrays, vectors and
+    maps. The first item of the key is the type's rank, so keys of
+    different types never compare their values.
+    """
+    if isinstance(value, str):
+        return (5, value)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, 0) if value != value and isnan(value) else (3, value)
+    if value is None:
+        return (0, 0)
+    if isinstance(value, datetime):
+        # Naive datetimes are taken as UTC so that they compare with aware ones.
+        if value.tzinfo is None:
+            return (4, value.replace(tzinfo=timezone.utc))
+        return (4, value)
+    if isinstance(value, bytes):
+        return (6, value)
+    if isinstance(value, (dict, MappingProxyType)):
+        return (11, tuple((k, sort_key(value[k])) for k in sorted(value)))
+    if isinstance(value, (list, tuple)):
+        return (9, tuple(sort_key(v) for v in value))
+    path = getattr(value, "path", None)
+    if isinstance(path, str):
+        return (7, tuple(path.split("/")))
+    if hasattr(value, "latitude"):
+        return (8, (value.latitude, value.longitude))
+    if hasattr(value, "to_map_value"):
+        return (10, (len(value), tuple(value)))
+    # Anything else only needs a consistent place in the index.
+    return (12, type(value).__name__, repr(value))
+
+
+def order_key(
+    fields: StoredDocument, paths: Sequence[Tuple[Sequence[str], bool]], document_id: Any
+) -> Optional[Tuple[Any, ...]]:
+    """Key ordering a document by its values at ``paths``, then by ID.
+
+    ``paths`` are ``(split_field_path, descending)`` pairs. The ID (or the
+    path, when ordering documents of several collections) follows the
+    direction of the last path, as in Firestore. Returns None if the
+    document lacks one of the fields.
+    """
+    keys: List[Any] = []
+    for path, descending in paths:
+        value = field_value(fields, path, MISSING)
+        if value is MISSING:
+            return None
+        key = sort_key(value)
+        keys.append(_Descending(key) if descending else key)
+    keys.append(_Descending(document_id) if paths and paths[-1][1] else document_id)
+    return tuple(keys)
+
+
+def position_key(
+    values: Sequence[Any], paths: Sequence[Tuple[Any, bool]], document_id: Any = MISSING
+) -> Tuple[Any, ...]:
+    """Key of a cursor position, comparable with the ``order_key`` of the same ``paths``.
+
+    ``values`` may cover only the first paths; ``document_id`` is only
+    appended when given.
+    """
+    keys: List[Any] = []
+    for value, (_, descending) in zip(values, paths):
+        key = sort_key(value)
+        keys.append(_Descending(key) if descending else key)
+    if document_id is not MISSING:
+        keys.append(_Descending(document_id) if paths and paths[-1][1] else document_id)
+    return tuple(keys)
+
+
+def cursor_range(
+    bisect_left: Callable[[Tuple[Any, ...]], int],
+    start: int,
+    stop: int,
+    lower: Optional[Bound],
+    upper: Optional[Bound],
+) -> Tuple[int, int]:
+    """Narrow the positions ``start`` to ``stop`` of sorted keys to those between two bounds.
+
+    A bound shorter than the keys compares with their first items: an
+    exclusive ``lower`` bound skips every key that starts with it.
+    """
+    if lower is not None:
+        key, inclusive = lower
+        start = max(start, bisect_left(key if inclusive else key + (_MAX,)))
+    if upper is not None:
+        key, inclusive = upper
+        stop = min(stop, bisect_left(key + (_MAX,) if inclusive else key))
+    return start, stop
+
+
+class FieldIndex:
+    """Base class of the indexes a collection keeps on its fields."""
+
+    __slots__ = ("_entries",)
+
+    _entries: Any
+
+    def add(self, document_id: str, fields: StoredDocument) -> None:
+        raise NotImplementedError
+
+    def remove(self, document_id: str, fields: StoredDocument) -> None:
+        """Remove the entries added for ``document_id`` with the same ``fields``."""
+        raise NotImplementedError
+
+    def nbytes(self) -> int:
+        return int(self._entries.nbytes())
+
+    def fork(self) -> FieldIndex:
+        index = copy(self)
+        index._entries = self._entries.fork()
+        return index
+
+
+class EqualityIndex(FieldIndex):
+    """IDs of a collection's documents by the value of one field, for ``==`` and ``in``.
+
+    Documents without the field are listed under None, matching how queries
+    read missing fields.
+    """
+
+    __slots__ = ("_path",)
+
+    _entries: PostingLists[Hashable]
+
+    def __init__(self, field: str) -> None:
+        self._path = field.split(".")
+        self._entries = PostingLists()
+
+    def add(self, document_id: str, fields: StoredDocument) -> None:
+        self._entries.add(self._key(fields), document_id)
+
+    def remove(self, document_id: str, fields: StoredDocument) -> None:
+        self._entries.remove(self._key(fields), document_id)
+
+    def postings(self, values: Iterable[Any]) -> Optional[Postings]:
+        """The lists of the documents listed under any of ``values``.
+
+        Returns None if a value cannot be looked up.
+        """
+        try:
+            keys = {index_key(value) for value in values}
+        except TypeError:
+            return None
+        keys.add(_UNHASHABLE)
+        return Postings(self._entries, [key for key in keys if self._entries.count(key)])
+
+    def _key(self, fields: StoredDocument) -> Hashable:
+        try:
+            return index_key(field_value(fields, self._path))
+        except TypeError:
+            return _UNHASHABLE
+
+
+class Postings:
+    """The sorted ID lists of an index lookup, read without copying them.
+
+    ``size`` is the number of IDs listed, an upper bound on the number of
+    documents. ``seek()`` finds the first listed ID not below a given one
+    with a bisection of each list, so that ``intersect`` can skip through
+    the longer lookups of a query. ``ids()`` is the sorted union of the
+    lists. ``from_ids`` wraps an already sorted list of IDs.
+    """
+
+    __slots__ = ("_entries", "_keys", "_ids", "size")
+
+    def __init__(self, entries: PostingLists[Hashable], keys: List[Hashable]) -> None:
+        self._entries = entries
+        self._keys = keys
+        self._ids: Optional[List[str]] = None
+        self.size = sum(entries.count(key) for key in keys)
+
+    @classmethod
+    def from_ids(cls, ids: List[str]) -> Postings:
+        postings = cls(PostingLists(), [])
+        postings._ids = ids
+        postings.size = len(ids)
+        return postings
+
+    def ids(self) -> List[str]:
+        if self._ids is None:
+            if len(self._keys) == 1:
+                self._ids = self._entries.get(self._keys[0])
+            else:
+                self._ids = sorted(
+                    {document_id for key in self._keys for document_id in self._entries.get(key)}
+                )
+        return self._ids
+
+    def seek(self, document_id: str) -> Optional[str]:
+        """The first listed ID not below ``document_id``; None if there is none."""
+        if self._ids is not None:
+            position = bisect_left(self._ids, document_id)
+            return self._ids[position] if position < len(self._ids) else None
+        found = [self._entries.ceiling(key, document_id) for key in self._keys]
+        return min((found_id for found_id in found if found_id is not None), default=None)
+
+
+def intersect(lookups: Sequence[Postings]) -> List[str]:
+    """Sorted IDs listed by every one of ``lookups``, by a zig-zag merge.
+
+    The IDs of the smallest lookup are the candidates. Each candidate is
+    sought in the other lookups in turn; when one of them has no such ID,
+    the merge leaps to the next candidate not below the ID it has instead.
+    The cost is proportional to the size of the smallest lookup, times a
+    bisection of each of the others, however long they are. Lookups at most
+    ``_DENSE`` times larger than the smallest are cheaper to read whole, and
+    filter the candidates by membership first.
+    """
+    if not lookups:
+        return []
+    smallest, *others = sorted(lookups, key=lambda postings: postings.size)
+    candidates = smallest.ids()
+    sparse = []
+    for postings in others:
+        if postings.size > _DENSE * len(candidates):
+            sparse.append(postings)
+        elif candidates:
+            listed = set(postings.ids())
+            candidates = [candidate for candidate in candidates if candidate in listed]
+    if not sparse:
+        return candidates
+    matches: List[str] = []
+    position = 0
+    while position < len(candidates):
+        candidate = candidates[position]
+        for postings in sparse:
+            found = postings.seek(candidate)
+            if found is None:
+                return matches
+            if found != candidate:
+                position = bisect_left(candidates, found, position + 1)
+                break
+        else:
+            matches.append(candidate)
+            position += 1
+    return matches
+
+
+class ArrayIndex(EqualityIndex):
+    """IDs of a collection's documents by the elements of an array field.
+
+    Serves ``array_contains`` and ``array_contains_any``, whose lookups are
+    then a single list or a union of lists. Documents are listed once under
+    each distinct element; documents whose field is not an array are not
+    listed.
+    """
+
+    __slots__ = ()
+
+    def add(self, document_id: str, fields: StoredDocument) -> None:
+        for key in self._keys(fields):
+            self._entries.add(key, document_id)
+
+    def remove(self, document_id: str, fields: StoredDocument) -> None:
+        for key in self._keys(fields):
+            self._entries.remove(key, document_id)
+
+    def _keys(self, fields: StoredDocument) -> Set[Hashable]:
+        value = field_value(fields, self._path)
+        if not isinstance(value, (list, tuple)):
+            return set()
+        keys = set()
+        for element in value:
+            try:
+                keys.add(index_key(element))
+            except TypeError:
+                keys.add(_UNHASHABLE)
+        return keys
+
+
+class CompositeIndex(FieldIndex):
+    """A collection's documents ordered by the values of one or more fields.
+
+    ``fields`` are ``(field_path, descending)`` pairs. Entries are the sort
+    keys of the document's values, in that order, followed by the document
+    ID, so documents with equal values follow in ID order, in the direction
+    of the last field as in Firestore. Documents without one of the fields
+    are not listed, as Firestore leaves them out of queries that filter or
+    order on it.
+    """
+
+    __slots__ = ("fields", "_paths", "_descending_ids")
+
+    _entries: SortedKeys[Tuple[Any, ...]]
+
+    def __init__(self, fields: Sequence[Tuple[str, bool]]) -> None:
+        self.fields = tuple(fields)
+        self._paths = [(field.split("."), descending) for field, descending in self.fields]
+        self._descending_ids = self.fields[-1][1]
+        self._entries = SortedKeys()
+
+    def add(self, document_id: str, fields: StoredDocument) -> None:
+        entry = self._entry(document_id, fields)
+        if entry is not None:
+            self._entries.add(entry)
+
+    def remove(self, document_id: str, fields: StoredDocument) -> None:
+        entry = self._entry(document_id, fields)
+        if entry is not None:
+            self._entries.remove(entry)
+
+    def nbytes(self) -> int:
+        entry_bytes = sys.getsizeof((0,) * (len(self.fields) + 1)) + len(self.fields) * _KEY_BYTES
+        return self._entries.nbytes() + len(self._entries) * entry_bytes
+
+    def seek(
+        self,
+        equal: Sequence[Any] = (),
+        bounds: Sequence[Tuple[str, Any]] = (),
+        reverse: bool = False,
+        start_at: Optional[Cursor] = None,
+        end_at: Optional[Cursor] = None,
+    ) -> Iterator[str]:
+        """Lazily yield the IDs of the matching documents, in index order or its reverse.
+
+        ``equal`` holds the values of the first fields, and ``bounds`` the
+        ``(op, value)`` range filters (``<``, ``<=``, ``>`` or ``>=``) on
+        the field after them. As in Firestore, a range only matches values
+        of the same type as its bound. ``start_at`` and ``end_at`` are the
+        query's cursors, positioned with a bisection on the fields after
+        ``equal``. Only the entries in range are visited, and later writes
+        to the index do not affect the iteration.
+        """
+        entries = self._entries
+        depth = len(equal)
+        if reverse:
+            start_at, end_at = end_at, start_at
+        ranges = []
+        for prefix in product(*(self._equal_keys(i, value) for i, value in enumerate(equal))):
+            start, stop = self._range(prefix, bounds)
+            start, stop = cursor_range(
+                entries.bisect_left,
+                start,
+                stop,
+                self._bound(prefix, start_at),
+                self._bound(prefix, end_at),
+            )
+            if start < stop:
+                ranges.append((start, stop))
+        entries = entries.fork()
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            found: Iterator[Tuple[Any, ...]] = entries.islice(start, stop, reverse)
+        else:
+            # Values equal to ``True`` or ``1`` sort apart; merge their runs.
+            runs = [entries.islice(start, stop, reverse) for start, stop in ranges]
+            found = heapq.merge(*runs, key=lambda entry: entry[depth:], reverse=reverse)
+        if self._descending_ids:
+            return (entry[-1].key for entry in found)
+        return (entry[-1] for entry in found)
+
+    def _range(self, prefix: Tuple[Any, ...], bounds: Sequence[Tuple[str, Any]]) -> Tuple[int, int]:
+        """Positions of the entries starting with ``prefix`` whose next key is within ``bounds``."""
+        entries = self._entries
+        start = entries.bisect_left(prefix)
+        stop = entries.bisect_left(prefix + (_MAX,))
+        descending = bool(bounds) and self.fields[len(prefix)][1]
+        rank = None
+        for op, value in bounds:
+            key = sort_key(value)
+            if rank is None:
+                rank = key[0]
+                low: Any = (rank,)
+                high: Any = (rank, _MAX)
+                if descending:
+                    low, high = _Descending(high), _Descending(low)
+                start = max(start, entries.bisect_left(prefix + (low,)))
+                stop = min(stop, entries.bisect_left(prefix + (high,)))
+            elif key[0] != rank:
+                return 0, 0
+            if descending:
+                op = _FLIPPED[op]
+            probe = prefix + (_Descending(key) if descending else key,)
+            if op == ">=":
+                start = max(start, entries.bisect_left(probe))
+            elif op == ">":
+                start = max(start, entries.bisect_left(probe + (_MAX,)))
+            elif op == "<":
+                stop = min(stop, entries.bisect_left(probe))
+            elif op == "<=":
+                stop = min(stop, entries.bisect_left(probe + (_MAX,)))
+        return start, stop
+
+    def _bound(self, prefix: Tuple[Any, ...], cursor: Optional[Cursor]) -> Optional[Bound]:
+        """Position of ``cursor`` among the entries starting with ``prefix``, if it gives one.
+
+        The cursor's values for the fields after ``prefix`` are used up to
+        the first field it has no value for, followed by its document ID
+        when it has a value for every field.
+        """
+        if cursor is None:
+            return None
+        values, document_id, inclusive = cursor
+        paths = self._paths[len(prefix) :]
+        given = []
+        for field, _ in self.fields[len(prefix) :]:
+            if field not in values:
+                break
+            given.append(values[field])
+        if len(given) == len(paths) and document_id is not None:
+            return prefix + position_key(given, paths, document_id), inclusive
+        if not given:
+            return None
+        return prefix + position_key(given, paths), inclusive
+
+    def _equal_keys(self, position: int, value: Any) -> List[Any]:
+        """Keys of the values a query's ``==`` filter matches, which treats ``True`` as ``1``."""
+        keys = [sort_key(value)]
+        if isinstance(value, (bool, int, float)) and value in (0, 1):
+            keys = [(1, bool(value)), (3, int(value))]
+        if self.fields[position][1]:
+            return [_Descending(key) for key in keys]
+        return keys
+
+    def _entry(self, document_id: str, fields: StoredDocument) -> Optional[Tuple[Any, ...]]:
+        return order_key(fields, self._paths, document_id)
+
+
+class RangeIndex(CompositeIndex):
+    """A collection's documents ordered by the value of one field, for ranges and ``order_by``."""
+
+    __slots__ = ()
+
+    def __init__(self, field: str) -> None:
+        super().__init__([(field, False)])
@@ -0,0 +1,369 @@
+"""Copy-on-write containers that can be forked in constant time.
+
+Both containers split their contents into small parts held in a top-level
+array. ``fork()`` returns a second container sharing every part; afterwards
+neither side owns the parts, and the first write to a part copies just that
+part (plus the top-level array), so forks stay independent while sharing
+everything they have not changed.
+"""
+
+from __future__ import annotations
+
+import sys
+from bisect import bisect_left, bisect_right, insort
+from typing import (
+    Any,
+    Dict,
+    Generic,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+# Keys of a ``SortedKeys``: document IDs, path tuples or index entries.
+S = TypeVar("S", str, Tuple[str, ...], Tuple[Any, ...])
+
+
+class PersistentMap(Generic[K, V]):
+    """Hash-array-mapped table: a power-of-two array of dict shards indexed by key hash.
+
+    Lookups cost one hash and two indexing operations. The array grows
+    fourfold once shards average ``MAX_LOAD`` entries, keeping the part
+    copied by a post-fork write small.
+    """
+
+    __slots__ = ("_shards", "_mask", "_size", "_owned")
+
+    INITIAL_SHARDS = 32
+    MAX_LOAD = 64
+
+    def __init__(self) -> None:
+        self._shards: List[Dict[K, V]] = [{} for _ in range(self.INITIAL_SHARDS)]
+        self._mask = self.INITIAL_SHARDS - 1
+        self._size = 0
+        # Which shards this map may mutate in place; None when the shard
+        # array itself is shared with a fork.
+        self._owned: Optional[List[bool]] = [True] * self.INITIAL_SHARDS
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        return self._shards[hash(key) & self._mask].get(key, default)
+
+    def __getitem__(self, key: K) -> V:
+        return self._shards[hash(key) & self._mask][key]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._shards[hash(key) & self._mask]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[K]:
+        for shard in self._shards:
+            yield from shard
+
+    def items(self) -> Iterator[Tuple[K, V]]:
+        for shard in self._shards:
+            yield from shard.items()
+
+    def __setitem__(self, key: K, value: V) -> None:
+        index = hash(key) & self._mask
+        owned = self._owned
+        shard = self._shards[index] if owned and owned[index] else self._writable_shard(index)
+        size = len(shard)
+        shard[key] = value
+        if len(shard) != size:
+            self._size += 1
+            if self._size > len(self._shards) * self.MAX_LOAD:
+                self._grow()
+
+    def __delitem__(self, key: K) -> None:
+        del self._writable_shard(hash(key) & self._mask)[key]
+        self._size -= 1
+
+    def nbytes(self) -> int:
+        """Bytes held by the table itself, not counting its keys and values."""
+        return sys.getsizeof(self._shards) + sum(sys.getsizeof(shard) for shard in self._shards)
+
+    def fork(self) -> PersistentMap[K, V]:
+        other: PersistentMap[K, V] = PersistentMap.__new__(PersistentMap)
+        other._shards = self._shards
+        other._mask = self._mask
+        other._size = self._size
+        other._owned = self._owned = None
+        return other
+
+    def _writable_shard(self, index: int) -> Dict[K, V]:
+        if self._owned is None:
+            self._shards = list(self._shards)
+            self._owned = [False] * len(self._shards)
+        if not self._owned[index]:
+            self._shards[index] = dict(self._shards[index])
+            self._owned[index] = True
+        return self._shards[index]
+
+    def _grow(self) -> None:
+        size = len(self._shards) * 4
+        shards: List[Dict[K, V]] = [{} for _ in range(size)]
+        mask = size - 1
+        for key, value in self.items():
+            shards[hash(key) & mask][key] = value
+        self._shards = shards
+        self._mask = mask
+        self._owned = [True] * size
+
+
+class SortedKeys(Generic[S]):
+    """Sorted list of keys kept in chunks of at most ``2 * LOAD`` items.
+
+    Inserting or removing an item shifts one chunk rather than the whole
+    list, and after a fork copies only that chunk.
+    """
+
+    __slots__ = ("_chunks", "_maxes", "_len", "_owned")
+
+    LOAD = 512
+
+    def __init__(self) -> None:
+        self._chunks: List[List[S]] = []
+        self._maxes: List[S] = []
+        self._len = 0
+        self._owned: Optional[List[bool]] = []
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[S]:
+        for chunk in self._chunks:
+            yield from chunk
+
+    def __contains__(self, key: S) -> bool:
+        index = bisect_left(self._maxes, key)
+        if index == len(self._maxes):
+            return False
+        chunk = self._chunks[index]
+        position = bisect_left(chunk, key)
+        return chunk[position] == key
+
+    def add(self, key: S) -> None:
+        self._own_index()
+        owned = self._owned
+        assert owned is not None
+        maxes = self._maxes
+        if not maxes:
+            self._chunks.append([key])
+            maxes.append(key)
+            owned.append(True)
+            self._len = 1
+            return
+        index = bisect_left(maxes, key)
+        if index == len(maxes):
+            index -= 1
+        chunk = self._chunks[index] if owned[index] else self._own_chunk(index)
+        insort(chunk, key)
+        maxes[index] = chunk[-1]
+        self._len += 1
+        if len(chunk) > 2 * self.LOAD:
+            self._chunks[index : index + 1] = [chunk[: self.LOAD], chunk[self.LOAD :]]
+            maxes[index : index + 1] = [chunk[self.LOAD - 1], chunk[-1]]
+            owned[index : index + 1] = [True, True]
+
+    def remove(self, key: S) -> None:
+        """Remove ``key``, which must be present."""
+        index = bisect_left(self._maxes, key)
+        chunk = self._own_chunk(index)
+        del chunk[bisect_left(chunk, key)]
+        self._len -= 1
+        if chunk:
+            self._maxes[index] = chunk[-1]
+        else:
+            assert self._owned is not None
+            del self._chunks[index], self._maxes[index], self._owned[index]
+
+    def ceiling(self, key: S) -> Optional[S]:
+        """Return the first key not below ``key``, or None if there is none."""
+        index = bisect_left(self._maxes, key)
+        if index == len(self._maxes):
+            return None
+        chunk = self._chunks[index]
+        return chunk[bisect_left(chunk, key)]
+
+    def bisect_left(self, key: S) -> int:
+        index = bisect_left(self._maxes, key)
+        if index == len(self._maxes):
+            return self._len
+        return self._offset(index) + bisect_left(self._chunks[index], key)
+
+    def bisect_right(self, key: S) -> int:
+        index = bisect_right(self._maxes, key)
+        if index == len(self._maxes):
+            return self._len
+        return self._offset(index) + bisect_right(self._chunks[index], key)
+
+    def slice(self, start: int, stop: int) -> List[S]:
+        """Return the keys at positions ``start`` to ``stop``."""
+        result: List[S] = []
+        for chunk in self._chunks:
+            if stop <= 0:
+                break
+            size = len(chunk)
+            if start < size:
+                result.extend(chunk[max(start, 0) : stop])
+            start -= size
+            stop -= size
+        return result
+
+    def islice(self, start: int, stop: int, reverse: bool = False) -> Iterator[S]:
+        """Iterate over the keys at positions ``start`` to ``stop``, last first with ``reverse``.
+
+        Chunks are copied one at a time as the iteration reaches them, so
+        stopping early costs only the keys consumed.
+        """
+        if reverse:
+            stop -= self._len
+            start -= self._len
+            for chunk in reversed(self._chunks):
+                if start >= 0:
+                    break
+                size = len(chunk)
+                if stop > -size:
+                    yield from reversed(chunk[max(start + size, 0) : stop + size])
+                start += size
+                stop += size
+            return
+        for chunk in self._chunks:
+            if stop <= 0:
+                break
+            size = len(chunk)
+            if start < size:
+                yield from chunk[max(start, 0) : stop]
+            start -= size
+            stop -= size
+
+    def nbytes(self) -> int:
+        """Bytes held by the index itself, not counting the keys."""
+        return (
+            sys.getsizeof(self._chunks)
+            + sys.getsizeof(self._maxes)
+            + sum(sys.getsizeof(chunk) for chunk in self._chunks)
+        )
+
+    def fork(self) -> SortedKeys[S]:
+        other: SortedKeys[S] = SortedKeys.__new__(SortedKeys)
+        other._chunks = self._chunks
+        other._maxes = self._maxes
+        other._len = self._len
+        other._owned = self._owned = None
+        return other
+
+    def _offset(self, index: int) -> int:
+        return sum(len(chunk) for chunk in self._chunks[:index])
+
+    def _own_index(self) -> None:
+        if self._owned is None:
+            self._chunks = list(self._chunks)
+            self._maxes = list(self._maxes)
+            self._owned = [False] * len(self._chunks)
+
+    def _own_chunk(self, index: int) -> List[S]:
+        self._own_index()
+        assert self._owned is not None
+        if not self._owned[index]:
+            self._chunks[index] = list(self._chunks[index])
+            self._owned[index] = True
+        return self._chunks[index]
+
+
+class PostingLists(Generic[K]):
+    """Sorted document-ID lists by key, forkable in constant time.
+
+    A key with a single document maps straight to its ID, so indexes over
+    mostly unique values stay small. A fork shares every list until it
+    writes to it; ``_owned`` records the lists this container may modify in
+    place.
+    """
+
+    __slots__ = ("_lists", "_owned", "_entries")
+
+    def __init__(self) -> None:
+        self._lists: PersistentMap[K, Union[str, SortedKeys[str]]] = PersistentMap()
+        self._owned: Set[K] = set()
+        self._entries = 0
+
+    def __len__(self) -> int:
+        return len(self._lists)
+
+    def get(self, key: K) -> List[str]:
+        """Return the sorted IDs listed under ``key``."""
+        ids = self._lists.get(key)
+        if ids is None:
+            return []
+        if isinstance(ids, str):
+            return [ids]
+        return list(ids)
+
+    def count(self, key: K) -> int:
+        ids = self._lists.get(key)
+        if ids is None:
+            return 0
+        return 1 if isinstance(ids, str) else len(ids)
+
+    def ceiling(self, key: K, document_id: str) -> Optional[str]:
+        """Return the first ID under ``key`` not below ``document_id``, without copying the list."""
+        ids = self._lists.get(key)
+        if ids is None:
+            return None
+        if isinstance(ids, str):
+            return ids if ids >= document_id else None
+        return ids.ceiling(document_id)
+
+    def add(self, key: K, document_id: str) -> None:
+        ids = self._lists.get(key)
+        self._entries += 1
+        if ids is None:
+            self._lists[key] = document_id
+            return
+        if isinstance(ids, str):
+            postings: SortedKeys[str] = SortedKeys()
+            postings.add(ids)
+            self._lists[key] = postings
+            self._owned.add(key)
+        elif key not in self._owned:
+            postings = self._lists[key] = ids.fork()
+            self._owned.add(key)
+        else:
+            postings = ids
+        postings.add(document_id)
+
+    def remove(self, key: K, document_id: str) -> None:
+        """Remove ``document_id`` from the list under ``key``, where it must be present."""
+        ids = self._lists[key]
+        self._entries -= 1
+        if isinstance(ids, str):
+            del self._lists[key]
+            return
+        if key not in self._owned:
+            ids = self._lists[key] = ids.fork()
+            self._owned.add(key)
+        ids.remove(document_id)
+        if len(ids) == 1:
+            self._lists[key] = next(iter(ids))
+            self._owned.discard(key)
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by the lists, not counting the keys and IDs."""
+        return self._lists.nbytes() + self._entries * 8
+
+    def fork(self) -> PostingLists[K]:
+        other: PostingLists[K] = PostingLists.__new__(PostingLists)
+        other._lists = self._lists.fork()
+        other._owned = set()
+        other._entries = self._entries
+        self._owned = set()
+        return other
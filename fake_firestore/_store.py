@@ -0,0 +1,591 @@
+from __future__ import annotations
+
+import sys
+import weakref
+from copy import deepcopy
+from itertools import chain, count
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    FrozenSet,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+from fake_firestore._cache import QueryCache
+from fake_firestore._helpers import (
+    StoredDocument,
+    document_name_size,
+    freeze,
+    measure,
+)
+from fake_firestore._index import (
+    ArrayIndex,
+    CompositeIndex,
+    EqualityIndex,
+    FieldIndex,
+    RangeIndex,
+)
+from fake_firestore._persistent import PersistentMap, SortedKeys
+from fake_firestore._vector import VectorIndex
+
+Path = Tuple[str, ...]
+
+ROOT: Path = ()
+
+IndexT = TypeVar("IndexT", EqualityIndex, ArrayIndex, RangeIndex, VectorIndex)
+# Fields of a composite index: ``(field_path, descending)`` pairs.
+IndexFields = Tuple[Tuple[str, bool], ...]
+
+# Write versions of collections and collection groups. Versions come from
+# one process-wide counter, so they are never reused, even by a store that
+# was cleared or forked.
+_versions = count(1)
+
+
+class DocumentNode:
+    """A document in the store: its own ``fields`` and the names of its subcollections.
+
+    Subcollections are kept apart from the fields so that reading a document
+    never has to touch (or copy) the documents nested underneath it.
+    ``fields`` is None for documents that only exist as the parent of a
+    subcollection and were never written. ``version`` counts the writes to
+    the document. ``size`` and ``nbytes`` are the document's estimated
+    Firestore storage size and the bytes its fields hold in memory.
+
+    Nodes are immutable: every write stores a new node, so forked stores can
+    share them.
+    """
+
+    __slots__ = ("fields", "children", "version", "size", "nbytes")
+
+    def __init__(
+        self,
+        fields: Optional[StoredDocument] = None,
+        children: FrozenSet[str] = frozenset(),
+        version: int = 0,
+        size: int = 0,
+        nbytes: int = 0,
+    ) -> None:
+        self.fields = fields
+        self.children = children
+        self.version = version
+        self.size = size
+        self.nbytes = nbytes
+
+
+class CollectionNode:
+    """A collection in the store.
+
+    ``ids`` is kept sorted and lists the written documents, so ordered scans
+    can bisect and slice it instead of sorting the collection on every call.
+    ``missing`` holds the IDs of never-written (or deleted) documents that
+    are still the parent of a subcollection. ``count`` is the number of
+    written documents in the collection and every collection below it, so
+    checking whether anything exists under a path is a single lookup.
+    ``size`` and ``nbytes`` total the sizes of the collection's own documents.
+    ``indexes`` holds the field indexes built so far, by index class and
+    field path. ``version`` changes on every write to the collection's
+    documents.
+
+    A node is only modified in place by the store whose ``owner`` token it
+    carries; any other store clones it first.
+    """
+
+    __slots__ = ("ids", "missing", "count", "size", "nbytes", "indexes", "version", "owner")
+
+    def __init__(self, owner: object) -> None:
+        self.ids: SortedKeys[str] = SortedKeys()
+        self.missing: Set[str] = set()
+        self.count = 0
+        self.size = 0
+        self.nbytes = 0
+        self.indexes: Dict[Tuple[Type[FieldIndex], str], FieldIndex] = {}
+        self.version = 0
+        self.owner = owner
+
+    def clone(self, owner: object) -> CollectionNode:
+        collection = CollectionNode(owner)
+        collection.ids = self.ids.fork()
+        collection.missing = set(self.missing)
+        collection.count = self.count
+        collection.size = self.size
+        collection.nbytes = self.nbytes
+        collection.indexes = {kind: index.fork() for kind, index in self.indexes.items()}
+        collection.version = self.version
+        return collection
+
+
+class CollectionGroupNode:
+    """Sorted paths of the non-empty collections sharing one collection ID.
+
+    ``version`` changes on every write to a document in any of them. Owned
+    like ``CollectionNode``.
+    """
+
+    __slots__ = ("paths", "version", "owner")
+
+    def __init__(self, owner: object) -> None:
+        self.paths: SortedKeys[Path] = SortedKeys()
+        self.version = 0
+        self.owner = owner
+
+    def clone(self, owner: object) -> CollectionGroupNode:
+        group = CollectionGroupNode(owner)
+        group.paths = self.paths.fork()
+        group.version = self.version
+        return group
+
+
+_NO_IDS: SortedKeys[str] = SortedKeys()
+_NO_CHILDREN: FrozenSet[str] = frozenset()
+
+_DOCUMENT_NODE_BYTES = sys.getsizeof(DocumentNode())
+_COLLECTION_NODE_BYTES = (
+    sys.getsizeof(CollectionNode(None)) + sys.getsizeof(SortedKeys()) + sys.getsizeof(set())
+)
+
+
+class Store:
+    """In-memory state shared by a client and every reference created from it.
+
+    Document and collection nodes live in two flat tables keyed by path
+    tuple, so reads and writes cost a single hash lookup instead of a walk
+    down the tree. The ``ROOT`` document node lists the top-level
+    collections. A third table indexes the non-empty collections by
+    collection ID for collection group queries.
+
+    All tables are ``PersistentMap``s, so ``fork()`` copies the store in
+    constant time: afterwards the two stores share every node, and a write
+    copies only the table shards and collection nodes on its own path.
+
+    With ``frozen`` set, documents are stored as read-only values (see
+    ``freeze``) that snapshots can share without copying.
+
+    ``references`` interns the document and collection references bound to
+    the store, so that repeated lookups of a live path reuse one object.
+    ``query_cache`` holds query results when enabled; see ``QueryCache``.
+    ``vector_probes``, when set, makes ``find_nearest()`` approximate; see
+    ``VectorIndex.nearest``.
+    """
+
+    def __init__(self, frozen: bool = False) -> None:
+        self.frozen = frozen
+        self.query_cache: Optional[QueryCache] = None
+        self.vector_probes: Optional[Tuple[int, int]] = None
+        self.references: weakref.WeakValueDictionary[Tuple[Any, ...], Any] = (
+            weakref.WeakValueDictionary()
+        )
+        # Set by ``shared_store`` to the object the store is registered under.
+        self._anchor: Any = None
+        # Declared composite indexes by collection ID; kept by ``clear()``.
+        self._composites: Dict[str, List[IndexFields]] = {}
+        self.clear()
+
+    def exists(self, key: Path) -> bool:
+        node = self._documents.get(key)
+        return node is not None and node.fields is not None
+
+    def get(self, key: Path) -> Optional[StoredDocument]:
+        """Return the stored fields of the document at ``key``, or None if not written.
+
+        The returned value is live store data and must not be mutated.
+        """
+        node = self._documents.get(key)
+        return node.fields if node is not None else None
+
+    def read(self, key: Path) -> Tuple[Optional[StoredDocument], int]:
+        """Return the stored fields of the document at ``key`` and their version."""
+        node = self._documents.get(key)
+        if node is None:
+            return None, 0
+        return node.fields, node.version
+
+    def set(self, key: Path, fields: StoredDocument) -> None:
+        if self.frozen:
+            fields = freeze(fields)
+        size = nbytes = 0
+        if self._measured:
+            size, nbytes = _measure(key, fields)
+        node = self._documents.get(key)
+        collection = self._writable_collection(key[:-1])
+        self._bump(collection, key)
+        if node is None or node.fields is None:
+            collection.ids.add(key[-1])
+            if collection.missing:
+                collection.missing.discard(key[-1])
+            collection.count += 1
+            self._count_under(key, 1)
+            self._document_count += 1
+            if len(collection.ids) == 1:
+                self._writable_group(key[-2]).paths.add(key[:-1])
+        for index in collection.indexes.values():
+            if node is not None and node.fields is not None:
+                index.remove(key[-1], node.fields)
+            index.add(key[-1], fields)
+        if node is None:
+            self._documents[key] = DocumentNode(fields, _NO_CHILDREN, 1, size, nbytes)
+        else:
+            self._documents[key] = DocumentNode(
+                fields, node.children, node.version + 1, size, nbytes
+            )
+            size -= node.size
+            nbytes -= node.nbytes
+        if self._measured:
+            collection.size += size
+            collection.nbytes += nbytes
+            self._size += size
+            self._nbytes += nbytes
+
+    def delete(self, key: Path) -> None:
+        node = self._documents.get(key)
+        if node is None:
+            return
+        collection = self._writable_collection(key[:-1])
+        if node.fields is not None:
+            self._bump(collection, key)
+            collection.ids.remove(key[-1])
+            collection.count -= 1
+            self._count_under(key, -1)
+            self._document_count -= 1
+            if self._measured:
+                collection.size -= node.size
+                collection.nbytes -= node.nbytes
+                self._size -= node.size
+                self._nbytes -= node.nbytes
+            for index in collection.indexes.values():
+                index.remove(key[-1], node.fields)
+            if not collection.ids:
+                self._writable_group(key[-2]).paths.remove(key[:-1])
+        # Subcollections outlive their parent document, as in Firestore.
+        if node.children:
+            collection.missing.add(key[-1])
+            self._documents[key] = DocumentNode(None, node.children, node.version + 1)
+            return
+        del self._documents[key]
+
+    def collection(self, key: Path, create: bool = False) -> Optional[CollectionNode]:
+        """Return the collection at ``key``; with ``create``, make sure it exists.
+
+        The returned node must not be mutated.
+        """
+        if create:
+            return self._writable_collection(key)
+        return self._collections.get(key)
+
+    def document_ids(self, key: Path) -> SortedKeys[str]:
+        """Sorted IDs of the written documents in the collection at ``key``.
+
+        The index is live: callers must not mutate it, and should ``fork()``
+        it before writing to the collection while iterating.
+        """
+        collection = self._collections.get(key)
+        return collection.ids if collection is not None else _NO_IDS
+
+    def all_document_ids(self, key: Path) -> List[str]:
+        """IDs of the collection's documents, including never-written parents of subcollections."""
+        collection = self._collections.get(key)
+        if collection is None:
+            return []
+        if not collection.missing:
+            return list(collection.ids)
+        return sorted(chain(collection.ids, collection.missing))
+
+    def subcollections(self, key: Path) -> List[str]:
+        """Names of the collections directly under the document at ``key``."""
+        node = self._documents.get(key)
+        return sorted(node.children) if node is not None else []
+
+    def has_documents_under(self, key: Path) -> bool:
+        """Whether any written document lives in the collection at ``key`` or below it."""
+        collection = self._collections.get(key)
+        return collection is not None and collection.count > 0
+
+    def collection_version(self, key: Path) -> int:
+        """Write version of the collection at ``key``; see ``CollectionNode``."""
+        collection = self._collections.get(key)
+        return collection.version if collection is not None else 0
+
+    def group_version(self, collection_id: str) -> int:
+        """Write version of the collections named ``collection_id``; see ``CollectionGroupNode``."""
+        group = self._groups.get(collection_id)
+        return group.version if group is not None else 0
+
+    def collection_paths(self, collection_id: str) -> List[Path]:
+        """Sorted paths of the non-empty collections named ``collection_id``, at any depth."""
+        group = self._groups.get(collection_id)
+        return list(group.paths) if group is not None else []
+
+    def field_index(self, key: Path, kind: Type[IndexT], field: str) -> Optional[IndexT]:
+        """Return the ``kind`` index on ``field`` of the collection at ``key``.
+
+        The index is built on first use and kept up to date by later writes.
+        Returns None if the collection does not exist.
+        """
+        collection = self._collections.get(key)
+        if collection is None:
+            return None
+        index = collection.indexes.get((kind, field))
+        if index is None:
+            index = self._build_index(key, (kind, field), kind(field))
+        assert isinstance(index, kind)
+        return index
+
+    def define_index(self, collection_id: str, fields: IndexFields) -> None:
+        """Declare a composite index on the collections named ``collection_id``."""
+        definitions = self._composites.setdefault(collection_id, [])
+        if fields not in definitions:
+            definitions.append(fields)
+
+    def composite_indexes(self, key: Path) -> List[CompositeIndex]:
+        """Return the declared composite indexes of the collection at ``key``.
+
+        Like ``field_index``, each index is built on first use.
+        """
+        definitions = self._composites.get(key[-1])
+        collection = self._collections.get(key)
+        if not definitions or collection is None:
+            return []
+        indexes = []
+        for fields in definitions:
+            name = ", ".join(f"{field} {'desc' if desc else 'asc'}" for field, desc in fields)
+            index = collection.indexes.get((CompositeIndex, name))
+            if index is None:
+                index = self._build_index(key, (CompositeIndex, name), CompositeIndex(fields))
+            assert isinstance(index, CompositeIndex)
+            indexes.append(index)
+        return indexes
+
+    def memory_usage(self, key: Optional[Path] = None) -> Dict[str, int]:
+        """Estimated memory use of the collection at ``key``, or of the whole store.
+
+        ``documents`` counts written documents, ``document_bytes`` is their
+        estimated Firestore storage size and ``data_bytes`` the bytes their
+        fields hold in memory. ``index_bytes`` covers the tables and indexes
+        the store keeps over them. Document figures are kept up to date on
+        every write from the first call on, which measures every document
+        once; index figures are measured from the index containers. Values
+        shared between forks or document versions are counted once per
+        document.
+        """
+        if not self._measured:
+            self._measure_documents()
+        if key is not None:
+            collection = self._collections.get(key)
+            if collection is None:
+                return {"documents": 0, "document_bytes": 0, "data_bytes": 0, "index_bytes": 0}
+            return {
+                "documents": len(collection.ids),
+                "document_bytes": collection.size,
+                "data_bytes": collection.nbytes,
+                "index_bytes": collection.ids.nbytes() + _index_bytes(collection),
+            }
+        index_bytes = (
+            self._documents.nbytes()
+            + self._collections.nbytes()
+            + self._groups.nbytes()
+            + len(self._documents) * _DOCUMENT_NODE_BYTES
+            + len(self._collections) * _COLLECTION_NODE_BYTES
+            # Pointers to the IDs in the sorted ID indexes.
+            + self._document_count * 8
+        )
+        for indexed in self._indexed:
+            collection = self._collections.get(indexed)
+            if collection is not None:
+                index_bytes += _index_bytes(collection)
+        return {
+            "documents": self._document_count,
+            "document_bytes": self._size,
+            "data_bytes": self._nbytes,
+            "index_bytes": index_bytes,
+        }
+
+    def fork(self) -> Store:
+        """Return an independent copy of this store, in constant time."""
+        other = Store(frozen=self.frozen)
+        other._document_count = self._document_count
+        other._size = self._size
+        other._nbytes = self._nbytes
+        other._measured = self._measured
+        other._documents = self._documents.fork()
+        other._collections = self._collections.fork()
+        other._groups = self._groups.fork()
+        other._indexed = set(self._indexed)
+        other._composites = {name: list(fields) for name, fields in self._composites.items()}
+        if self.query_cache is not None:
+            other.query_cache = QueryCache(self.query_cache.max_entries, self.query_cache.max_bytes)
+        other.vector_probes = self.vector_probes
+        # Neither store owns the shared collection nodes any more.
+        self._token = object()
+        return other
+
+    def load(
+        self, data: Mapping[str, Any], written_docs: Optional[Collection[Tuple[str, ...]]] = None
+    ) -> None:
+        """Write the documents of ``data``, in the nested layout clients used to keep.
+
+        ``data`` maps collection names to documents by ID, and each
+        document's fields to their values. A subcollection is a map value
+        under its name, and is told apart from a map field by
+        ``written_docs``, the paths of the documents that exist; documents
+        not in ``written_docs`` are left out, and the ones that are not in
+        ``data`` are written empty. Without ``written_docs``, every
+        document of a top-level collection is written and map values are
+        fields.
+        """
+        written = None if written_docs is None else {tuple(path) for path in written_docs}
+        # Paths of the collections with written documents, at any depth.
+        collections = {path[:end] for path in written or () for end in range(1, len(path), 2)}
+
+        def load_collection(key: Path, documents: Mapping[str, Any]) -> None:
+            for document_id, document in documents.items():
+                if not isinstance(document, Mapping):
+                    continue
+                document_key = key + (document_id,)
+                fields = {}
+                for name, value in document.items():
+                    if isinstance(value, Mapping) and document_key + (name,) in collections:
+                        load_collection(document_key + (name,), value)
+                    else:
+                        fields[name] = value
+                if written is None or document_key in written:
+                    self.set(document_key, deepcopy(fields))
+
+        for name, documents in data.items():
+            if isinstance(documents, Mapping):
+                load_collection((name,), documents)
+        for path in sorted(written or ()):
+            if len(path) % 2 == 0 and not self.exists(path):
+                self.set(path, {})
+
+    def clear(self) -> None:
+        self._token = object()
+        if self.query_cache is not None:
+            self.query_cache.clear()
+        self._document_count: int = 0
+        self._size: int = 0
+        self._nbytes: int = 0
+        # Whether document sizes are being tracked; see ``memory_usage``.
+        self._measured: bool = False
+        self._documents: PersistentMap[Path, DocumentNode] = PersistentMap()
+        self._collections: PersistentMap[Path, CollectionNode] = PersistentMap()
+        self._groups: PersistentMap[str, CollectionGroupNode] = PersistentMap()
+        # Collections with at least one field index.
+        self._indexed: Set[Path] = set()
+        self._documents[ROOT] = DocumentNode()
+
+    def _build_index(
+        self, key: Path, name: Tuple[Type[FieldIndex], str], index: FieldIndex
+    ) -> FieldIndex:
+        collection = self._writable_collection(key)
+        collection.indexes[name] = index
+        for document_id in collection.ids:
+            fields = self._documents[key + (document_id,)].fields
+            assert fields is not None
+            index.add(document_id, fields)
+        self._indexed.add(key)
+        return index
+
+    def _measure_documents(self) -> None:
+        """Compute every document's size and start keeping the totals up to date."""
+        for key in list(self._collections):
+            collection = self._writable_collection(key)
+            collection.size = collection.nbytes = 0
+        self._size = self._nbytes = 0
+        for key, node in list(self._documents.items()):
+            if node.fields is None:
+                continue
+            # Sizes depend only on the path and fields, so nodes shared with
+            # a fork that measured them already can keep theirs. Others are
+            # replaced, as nodes shared with a fork must not change.
+            if not node.size:
+                size, nbytes = _measure(key, node.fields)
+                node = DocumentNode(node.fields, node.children, node.version, size, nbytes)
+                self._documents[key] = node
+            collection = self._writable_collection(key[:-1])
+            collection.size += node.size
+            collection.nbytes += node.nbytes
+            self._size += node.size
+            self._nbytes += node.nbytes
+        self._measured = True
+
+    def _bump(self, collection: CollectionNode, key: Path) -> None:
+        """Give the collection holding the document at ``key``, and its group, a new version."""
+        collection.version = self._writable_group(key[-2]).version = next(_versions)
+
+    def _count_under(self, key: Path, delta: int) -> None:
+        """Add ``delta`` to the count of the collections above the one holding ``key``."""
+        for end in range(len(key) - 3, 0, -2):
+            self._writable_collection(key[:end]).count += delta
+
+    def _writable_group(self, collection_id: str) -> CollectionGroupNode:
+        group = self._groups.get(collection_id)
+        if group is None:
+            group = self._groups[collection_id] = CollectionGroupNode(self._token)
+        elif group.owner is not self._token:
+            group = self._groups[collection_id] = group.clone(self._token)
+        return group
+
+    def _writable_collection(self, key: Path) -> CollectionNode:
+        """Return the collection at ``key`` for writing, creating it and its parents as needed."""
+        collection = self._collections.get(key)
+        if collection is None:
+            collection = self._collections[key] = CollectionNode(self._token)
+            parent_key = key[:-1]
+            parent = self._documents.get(parent_key)
+            if parent is None:
+                self._writable_collection(parent_key[:-1]).missing.add(parent_key[-1])
+                self._documents[parent_key] = DocumentNode(children=frozenset((key[-1],)))
+            else:
+                self._documents[parent_key] = DocumentNode(
+                    parent.fields,
+                    parent.children | {key[-1]},
+                    parent.version,
+                    parent.size,
+                    parent.nbytes,
+                )
+        elif collection.owner is not self._token:
+            collection = self._collections[key] = collection.clone(self._token)
+        return collection
+
+
+def _measure(key: Path, fields: StoredDocument) -> Tuple[int, int]:
+    """Return the Firestore storage size of a document and the bytes its fields hold."""
+    size, nbytes = measure(fields)
+    return document_name_size(key) + size + 32, nbytes
+
+
+def _index_bytes(collection: CollectionNode) -> int:
+    return sum(index.nbytes() for index in collection.indexes.values())
+
+
+# Clients created with the same ``data`` object share one store. The store
+# keeps that object alive (``_anchor``), so its id cannot be reused while the
+# store is registered.
+_shared_stores: weakref.WeakValueDictionary[int, Store] = weakref.WeakValueDictionary()
+
+
+def shared_store(
+    anchor: object,
+    frozen: bool = False,
+    data: Optional[Mapping[str, Any]] = None,
+    written_docs: Optional[Collection[Tuple[str, ...]]] = None,
+) -> Store:
+    """Return the store registered for ``anchor``, creating it on first use.
+
+    A new store is loaded with the documents of ``data`` and ``written_docs``;
+    see ``Store.load``.
+    """
+    store = _shared_stores.get(id(anchor))
+    if store is None:
+        store = _shared_stores[id(anchor)] = Store(frozen=frozen)
+        store._anchor = anchor
+        if data or written_docs:
+            store.load(data or {}, written_docs)
+    return store
@@ -8,6 +8,25 @@ from fake_firestore._helpers import (
 )
 
 
+def _is_transformation(value: Any) -> bool:
+    # Unfortunately, we can't use `isinstance` here because that would require
+    # us to declare google-cloud-firestore as a dependency for this library.
+    # However, it's somewhat strange that the mocked version of the library
+    # requires the library itself, so we'll just leverage this heuristic as a
+    # means of identifying it.
+    #
+    # Furthermore, we don't hardcode the full module name, since the original
+    # library seems to use a thin shim to perform versioning. e.g. at the time
+    # of writing, the full module name is `google.cloud.firestore_v1.transforms`,
+    # and it can evolve to `firestore_v2` in the future.
+    return bool(value.__class__.__module__.startswith("google.cloud.firestore"))
+
+
+def has_transformations(data: Dict[str, Any]) -> bool:
+    """Whether ``data`` contains any special field values like INCREMENT."""
+    return any(_is_transformation(value) for _, value in get_document_iterator(data))
+
+
 def apply_transformations(document: Dict[str, Any], data: Dict[str, Any]) -> None:
     """Handles special fields like INCREMENT."""
     increments: Dict[str, Any] = {}
@@ -22,17 +41,7 @@ def apply_transformations(document: Dict[str, Any], data: Dict[str, Any]) -> Non
             data.pop(k, None)
 
     for key, value in list(get_document_iterator(data)):
-        if not value.__class__.__module__.startswith("google.cloud.firestore"):
-            # Unfortunately, we can't use `isinstance` here because that would require
-            # us to declare google-cloud-firestore as a dependency for this library.
-            # However, it's somewhat strange that the mocked version of the library
-            # requires the library itself, so we'll just leverage this heuristic as a
-            # means of identifying it.
-            #
-            # Furthermore, we don't hardcode the full module name, since the original
-            # library seems to use a thin shim to perform versioning. e.g. at the time
-            # of writing, the full module name is `google.cloud.firestore_v1.transforms`,
-            # and it can evolve to `firestore_v2` in the future.
+        if not _is_transformation(value):
             continue
 
         transformer = value.__class__.__name__
@@ -0,0 +1,328 @@
+"""Nearest-neighbour search over vector fields, for ``find_nearest()``.
+
+A ``VectorIndex`` keeps the vectors of one field of a collection as the
+rows of NumPy matrices, one per dimension, updated on every write like the
+other field indexes. Queries score the rows in blocks and select the
+nearest with ``argpartition``. NumPy is optional: without it the index
+cannot be built, and ``find_nearest()`` raises ImportError.
+"""
+
+from __future__ import annotations
+
+from enum import IntEnum
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from fake_firestore._helpers import StoredDocument
+from fake_firestore._index import FieldIndex, field_value
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore[assignment]
+
+if TYPE_CHECKING:
+    import numpy.typing as npt
+
+    Floats = npt.NDArray[np.float64]
+    Ints = npt.NDArray[np.intp]
+
+# Rows scored at a time, so that a query's temporary arrays stay small.
+_BLOCK_ROWS = 8192
+# Lloyd iterations, and sampled rows per list, when training an IVF index.
+_TRAINING_ROUNDS = 8
+_TRAINING_ROWS_PER_LIST = 64
+
+
+class DistanceMeasure(IntEnum):
+    """The distance measures of ``find_nearest()``, numbered as in the real SDK."""
+
+    EUCLIDEAN = 1
+    COSINE = 2
+    DOT_PRODUCT = 3
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise ImportError(
+            "find_nearest() requires numpy; install it with `pip install fake-firestore[vector]`"
+        )
+
+
+def is_vector(value: Any) -> bool:
+    """Whether a stored value is a ``Vector`` (detected as in ``sort_key``)."""
+    return hasattr(value, "to_map_value") and len(value) > 0
+
+
+class VectorMatrix:
+    """The vectors of one dimension, as the rows of a matrix.
+
+    Rows are allocated by doubling the matrix and reused once their
+    document is removed; ``live`` marks the rows in use. ``norms`` caches
+    each row's length for cosine distances. When trained, ``centroids`` and
+    ``lists`` hold an inverted-file (IVF) partition of the rows by their
+    nearest centroid; see ``probe``.
+
+    The arrays are shared with forks until one of them writes, which then
+    copies them all.
+    """
+
+    __slots__ = (
+        "matrix",
+        "norms",
+        "live",
+        "ids",
+        "rows",
+        "free",
+        "size",
+        "centroids",
+        "lists",
+        "trained_rows",
+        "owned",
+    )
+
+    def __init__(self, dimension: int) -> None:
+        self.matrix: Floats = np.zeros((16, dimension))
+        self.norms: Floats = np.zeros(16)
+        self.live = np.zeros(16, dtype=bool)
+        self.ids: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+        self.free: List[int] = []
+        self.size = 0
+        self.centroids: Optional[Floats] = None
+        self.lists: Ints = np.zeros(16, dtype=np.intp)
+        self.trained_rows = 0
+        self.owned = True
+
+    def add(self, document_id: str, vector: Sequence[float]) -> None:
+        self._own()
+        if self.free:
+            row = self.free.pop()
+            self.ids[row] = document_id
+        else:
+            row = self.size
+            if row == len(self.matrix):
+                self._grow()
+            self.ids.append(document_id)
+            self.size += 1
+        values = np.asarray(tuple(vector), dtype=np.float64)
+        self.matrix[row] = values
+        self.norms[row] = np.linalg.norm(values)
+        self.live[row] = True
+        self.rows[document_id] = row
+        if self.centroids is not None:
+            self.lists[row] = _nearest_centroid(self.centroids, self.matrix[row : row + 1])[0]
+
+    def remove(self, document_id: str) -> None:
+        self._own()
+        row = self.rows.pop(document_id)
+        self.ids[row] = None
+        self.live[row] = False
+        self.free.append(row)
+
+    def probe(self, query: Floats, measure: DistanceMeasure, probes: int) -> Ints:
+        """Rows in the ``probes`` lists whose centroids score best against ``query``.
+
+        The partition is trained on first use, and trained again once the
+        number of vectors has doubled since; rows added in between join the
+        list of their nearest centroid.
+        """
+        live_rows = len(self.rows)
+        if self.centroids is None or live_rows > 2 * self.trained_rows:
+            self._train()
+        assert self.centroids is not None
+        norms = np.linalg.norm(self.centroids, axis=1)
+        keys = _keys(_scores(self.centroids, norms, query, measure), measure)
+        nearest = np.argsort(keys)[:probes]
+        rows: Ints = np.flatnonzero(
+            self.live[: self.size] & np.isin(self.lists[: self.size], nearest)
+        )
+        return rows
+
+    def nbytes(self) -> int:
+        total = self.matrix.nbytes + self.norms.nbytes + self.live.nbytes + self.lists.nbytes
+        if self.centroids is not None:
+            total += self.centroids.nbytes
+        return int(total)
+
+    def fork(self) -> VectorMatrix:
+        other: VectorMatrix = VectorMatrix.__new__(VectorMatrix)
+        for name in self.__slots__:
+            setattr(other, name, getattr(self, name))
+        self.owned = other.owned = False
+        return other
+
+    def _own(self) -> None:
+        if self.owned:
+            return
+        self.matrix = self.matrix.copy()
+        self.norms = self.norms.copy()
+        self.live = self.live.copy()
+        self.lists = self.lists.copy()
+        self.ids = list(self.ids)
+        self.rows = dict(self.rows)
+        self.free = list(self.free)
+        self.owned = True
+
+    def _grow(self) -> None:
+        capacity = 2 * len(self.matrix)
+        matrix = np.zeros((capacity, self.matrix.shape[1]))
+        matrix[: self.size] = self.matrix[: self.size]
+        self.matrix = matrix
+        for name in ("norms", "live", "lists"):
+            array = getattr(self, name)
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[: self.size] = array[: self.size]
+            setattr(self, name, grown)
+
+    def _train(self) -> None:
+        """Partition the rows around about sqrt(n) centroids, by k-means on a sample."""
+        self._own()
+        rows = np.flatnonzero(self.live[: self.size])
+        count = max(1, int(np.sqrt(len(rows))))
+        generator = np.random.default_rng(0)
+        sample = self.matrix[generator.permutation(rows)[: count * _TRAINING_ROWS_PER_LIST]]
+        centroids = sample[:count].copy()
+        for _ in range(_TRAINING_ROUNDS):
+            assigned = _nearest_centroid(centroids, sample)
+            for centroid in range(count):
+                members = sample[assigned == centroid]
+                if len(members):
+                    centroids[centroid] = members.mean(axis=0)
+        for start in range(0, self.size, _BLOCK_ROWS):
+            block = self.matrix[start : start + _BLOCK_ROWS]
+            self.lists[start : start + len(block)] = _nearest_centroid(centroids, block)
+        self.centroids = centroids
+        self.trained_rows = len(rows)
+
+
+class VectorTable:
+    """The ``VectorMatrix`` of each dimension; the entries of a ``VectorIndex``."""
+
+    __slots__ = ("matrices",)
+
+    def __init__(self) -> None:
+        self.matrices: Dict[int, VectorMatrix] = {}
+
+    def nbytes(self) -> int:
+        return sum(matrix.nbytes() for matrix in self.matrices.values())
+
+    def fork(self) -> VectorTable:
+        other = VectorTable()
+        other.matrices = {dimension: m.fork() for dimension, m in self.matrices.items()}
+        return other
+
+
+class VectorIndex(FieldIndex):
+    """A collection's ``Vector`` values of one field, for ``find_nearest()``.
+
+    Documents whose field is not a non-empty vector are not listed.
+    """
+
+    __slots__ = ("_path",)
+
+    _entries: VectorTable
+
+    def __init__(self, field: str) -> None:
+        require_numpy()
+        self._path = field.split(".")
+        self._entries = VectorTable()
+
+    def add(self, document_id: str, fields: StoredDocument) -> None:
+        vector = field_value(fields, self._path)
+        if is_vector(vector):
+            matrix = self._entries.matrices.get(len(vector))
+            if matrix is None:
+                matrix = self._entries.matrices[len(vector)] = VectorMatrix(len(vector))
+            matrix.add(document_id, vector)
+
+    def remove(self, document_id: str, fields: StoredDocument) -> None:
+        vector = field_value(fields, self._path)
+        if is_vector(vector):
+            self._entries.matrices[len(vector)].remove(document_id)
+
+    def nearest(
+        self,
+        query_vector: Sequence[float],
+        limit: int,
+        measure: DistanceMeasure,
+        document_ids: Optional[Sequence[str]] = None,
+        threshold: Optional[float] = None,
+        probes: Optional[Tuple[int, int]] = None,
+    ) -> List[Tuple[float, str]]:
+        """The ``limit`` nearest documents to ``query_vector``, nearest first, with their distance.
+
+        Only vectors of the query's dimension are compared. ``document_ids``
+        restricts the search to those documents, and ``threshold`` to
+        distances at most (dot products at least) that value. Results are
+        ``(distance, document_id)`` pairs, where the distance of
+        ``DOT_PRODUCT`` is the product itself; ties are broken by ID.
+
+        With ``probes``, a ``(min_vectors, lists)`` pair, matrices of at least
+        ``min_vectors`` vectors are searched approximately, in the ``lists``
+        IVF lists nearest to the query.
+        """
+        query = np.asarray(tuple(query_vector), dtype=np.float64)
+        matrix = self._entries.matrices.get(len(query))
+        if matrix is None or limit <= 0:
+            return []
+        rows: Optional[Ints] = None
+        if document_ids is not None:
+            found = [matrix.rows[i] for i in document_ids if i in matrix.rows]
+            rows = np.array(found, dtype=np.intp)
+        if probes is not None and len(matrix.rows) >= probes[0]:
+            probed = matrix.probe(query, measure, probes[1])
+            rows = probed if rows is None else np.intersect1d(rows, probed)
+        elif rows is None:
+            rows = np.flatnonzero(matrix.live[: matrix.size])
+
+        keys = np.empty(len(rows))
+        for start in range(0, len(rows), _BLOCK_ROWS):
+            block = rows[start : start + _BLOCK_ROWS]
+            scores = _scores(matrix.matrix[block], matrix.norms[block], query, measure)
+            keys[start : start + len(block)] = _keys(scores, measure, threshold)
+        candidates = np.flatnonzero(np.isfinite(keys))
+        if len(candidates) > limit:
+            # Keep the rows tied with the last of the nearest, to break ties by ID.
+            selected = keys[candidates]
+            last = selected[np.argpartition(selected, limit - 1)[limit - 1]]
+            candidates = candidates[selected <= last]
+        sign = -1.0 if measure == DistanceMeasure.DOT_PRODUCT else 1.0
+        nearest = sorted((float(keys[i]), matrix.ids[rows[i]] or "") for i in candidates)[:limit]
+        return [(key * sign, document_id) for key, document_id in nearest]
+
+
+def _scores(matrix: Floats, norms: Floats, query: Floats, measure: DistanceMeasure) -> Floats:
+    """Distances (or dot products) of the rows of ``matrix`` to ``query``."""
+    if measure == DistanceMeasure.EUCLIDEAN:
+        difference = matrix - query
+        distances: Floats = np.sqrt(np.einsum("ij,ij->i", difference, difference))
+        return distances
+    products: Floats = matrix @ query
+    if measure == DistanceMeasure.DOT_PRODUCT:
+        return products
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cosine: Floats = 1.0 - products / (norms * np.linalg.norm(query))
+    return cosine
+
+
+def _keys(scores: Floats, measure: DistanceMeasure, threshold: Optional[float] = None) -> Floats:
+    """Scores as keys that sort nearest first; infinite for rows to leave out.
+
+    Rows without a distance (a cosine with a zero vector) and rows beyond
+    ``threshold`` are left out.
+    """
+    keys: Floats = -scores if measure == DistanceMeasure.DOT_PRODUCT else scores.copy()
+    keys[np.isnan(keys)] = np.inf
+    if threshold is not None:
+        bound = -threshold if measure == DistanceMeasure.DOT_PRODUCT else threshold
+        keys[keys > bound] = np.inf
+    return keys
+
+
+def _nearest_centroid(centroids: Floats, vectors: Floats) -> Ints:
+    """Index of the nearest of ``centroids`` to each of ``vectors``, by Euclidean distance."""
+    distances = (
+        np.einsum("ij,ij->i", centroids, centroids)[np.newaxis, :] - 2 * vectors @ centroids.T
+    )
+    nearest: Ints = np.argmin(distances, axis=1)
+    return nearest
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, List, Optional
+
+from fake_firestore.aggregation import AggregationResult, FakeAggregationQuery
+
+
+class AsyncFakeAggregationQuery(FakeAggregationQuery):
+    async def get(  # type: ignore[override]
+        self, transaction: Any = None, timeout: Optional[float] = None
+    ) -> List[List[AggregationResult]]:
+        return [self._results()]
+
+    async def stream(  # type: ignore[override]
+        self, transaction: Any = None, timeout: Optional[float] = None
+    ) -> AsyncIterator[List[AggregationResult]]:
+        yield self._results()
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from typing import Any, AsyncIterator, Iterable, Optional
 
+from fake_firestore._store import ROOT
 from fake_firestore.async_collection import AsyncFakeCollectionReference
 from fake_firestore.async_document import AsyncFakeDocumentReference
 from fake_firestore.async_query import AsyncFakeCollectionGroup
@@ -11,39 +12,26 @@ from fake_firestore.document import FakeDocumentReference, FakeDocumentSnapshot
 
 
 class AsyncFakeFirestoreClient(FakeFirestoreClient):
-    def collection(self, path: str) -> AsyncFakeCollectionReference:
-        path_parts = path.split("/")
-
-        if len(path_parts) % 2 != 1:
-            raise Exception("Cannot create collection at path {}".format(path_parts))
+    _collection_class = AsyncFakeCollectionReference
 
-        name = path_parts[-1]
-        if len(path_parts) > 1:
-            current_position = self._ensure_path(path_parts)
-            if isinstance(current_position, (AsyncFakeFirestoreClient, AsyncFakeDocumentReference)):
-                return current_position.collection(name)
-            raise Exception("Invalid path")  # pragma: no cover
-        else:
-            if name not in self._data:
-                self._data[name] = {}
-            return AsyncFakeCollectionReference(self._data, [name], written_docs=self._written_docs)
+    def collection(self, path: str) -> AsyncFakeCollectionReference:
+        collection = super().collection(path)
+        assert isinstance(collection, AsyncFakeCollectionReference)
+        return collection
 
     def document(self, path: str) -> AsyncFakeDocumentReference:
-        path_parts = path.split("/")
+        document = super().document(path)
+        assert isinstance(document, AsyncFakeDocumentReference)
+        return document
 
-        if len(path_parts) % 2 != 0:
-            raise Exception("Cannot create document at path {}".format(path_parts))
-        current_position = self._ensure_path(path_parts)
-
-        if isinstance(current_position, AsyncFakeCollectionReference):
-            return current_position.document(path_parts[-1])
-        raise Exception("Invalid path")  # pragma: no cover
+    def fork(self) -> AsyncFakeFirestoreClient:
+        client = super().fork()
+        assert isinstance(client, AsyncFakeFirestoreClient)
+        return client
 
     async def collections(self) -> AsyncIterator[AsyncFakeCollectionReference]:  # type: ignore[override]
-        for collection_name in self._data:
-            yield AsyncFakeCollectionReference(
-                self._data, [collection_name], written_docs=self._written_docs
-            )
+        for collection_name in self._store.subcollections(ROOT):
+            yield AsyncFakeCollectionReference._interned(self._store, (collection_name,))
 
     async def get_all(  # type: ignore[override]
         self,
@@ -52,18 +40,15 @@ class AsyncFakeFirestoreClient(FakeFirestoreClient):
         transaction: Optional[Any] = None,
     ) -> AsyncIterator[FakeDocumentSnapshot]:
         for doc_ref in set(references):
-            yield FakeDocumentReference.get(doc_ref)
+            yield FakeDocumentReference.get(doc_ref, field_paths=field_paths)
 
     def collection_group(self, collection_id: str) -> AsyncFakeCollectionGroup:
         if "/" in collection_id:
             raise ValueError(
                 f"Invalid collection_id '{collection_id}'. " "Collection IDs must not contain '/'."
             )
-        paths = self._find_collections_by_name(self._data, collection_id, [])
-        collections = [
-            AsyncFakeCollectionReference(self._data, path, written_docs=self._written_docs)
-            for path in paths
-        ]
+        paths = self._store.collection_paths(collection_id)
+        collections = [AsyncFakeCollectionReference._interned(self._store, path) for path in paths]
         return AsyncFakeCollectionGroup(collections)  # type: ignore[arg-type]
 
     def transaction(self, **kwargs: Any) -> AsyncFakeTransaction:
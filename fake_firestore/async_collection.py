@@ -1,52 +1,25 @@
 from __future__ import annotations
 
-from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
 
-from fake_firestore._helpers import (
-    Timestamp,
-    generate_random_string,
-    get_by_path,
-)
+from fake_firestore._helpers import Timestamp, generate_random_string
+from fake_firestore.async_aggregation import AsyncFakeAggregationQuery
 from fake_firestore.async_document import AsyncFakeDocumentReference
 from fake_firestore.async_query import AsyncFakeQuery
+from fake_firestore.async_vector_query import AsyncFakeVectorQuery
 from fake_firestore.collection import FakeCollectionReference
 from fake_firestore.document import FakeDocumentSnapshot
 
 
 class AsyncFakeCollectionReference(FakeCollectionReference):
-    def _sync_snapshot(self, document_id: str) -> FakeDocumentSnapshot:
-        """Build a snapshot synchronously while preserving the async document reference."""
-        doc_ref = self.document(document_id)
-        if tuple(doc_ref._path) not in self._written_docs:
-            return FakeDocumentSnapshot(doc_ref, None)
-        try:
-            data = get_by_path(self._data, doc_ref._path)
-        except KeyError:
-            data = {}
-        return FakeDocumentSnapshot(doc_ref, data)
-
-    def _sync_stream(self, transaction: Any = None) -> Iterator[FakeDocumentSnapshot]:
-        """Sync stream for use by queries internally."""
-        try:
-            collection = get_by_path(self._data, self._path)
-        except KeyError:
-            return
-        for key in sorted(collection):
-            doc_snapshot = self._sync_snapshot(key)
-            if doc_snapshot.exists:
-                yield doc_snapshot
+    _document_class = AsyncFakeDocumentReference
+
+    __slots__ = ()
 
     def document(self, document_id: Optional[str] = None) -> AsyncFakeDocumentReference:
-        if document_id is None:
-            document_id = generate_random_string()
-        new_path = self._path + [document_id]
-        return AsyncFakeDocumentReference(
-            self._data,
-            new_path,
-            parent=self,
-            written_docs=self._written_docs,
-            _collection_factory=AsyncFakeCollectionReference,
-        )
+        document = super().document(document_id)
+        assert isinstance(document, AsyncFakeDocumentReference)
+        return document
 
     async def add(  # type: ignore[override]
         self,
@@ -57,45 +30,21 @@ class AsyncFakeCollectionReference(FakeCollectionReference):
 
         if document_id is None:
             document_id = document_data.get("id", generate_random_string())
-        new_path = self._path + [document_id]
-        try:
-            collection = get_by_path(self._data, self._path)
-            if document_id in collection:
-                raise AlreadyExists("Document already exists: {}".format(new_path))  # type: ignore[no-untyped-call]
-        except KeyError:
-            pass
-        doc_ref = AsyncFakeDocumentReference(
-            self._data,
-            new_path,
-            parent=self,
-            written_docs=self._written_docs,
-            _collection_factory=AsyncFakeCollectionReference,
-        )
+        doc_ref = self.document(document_id)
+        if self._store.exists(doc_ref._key):
+            raise AlreadyExists("Document already exists: {}".format(doc_ref._path))  # type: ignore[no-untyped-call]
         await doc_ref.set(document_data)
         timestamp = Timestamp.from_now()
         return timestamp, doc_ref
 
     async def stream(self, transaction: Any = None) -> AsyncIterator[FakeDocumentSnapshot]:  # type: ignore[override]
-        try:
-            collection = get_by_path(self._data, self._path)
-        except KeyError:
-            return
-        for key in sorted(collection):
-            doc_snapshot = await self.document(key).get()
-            if doc_snapshot.exists:
-                yield doc_snapshot
+        for doc_snapshot in self._sync_stream(transaction):
+            yield doc_snapshot
 
     async def list_documents(  # type: ignore[override]
         self, page_size: Optional[int] = None
     ) -> List[AsyncFakeDocumentReference]:
-        docs: List[AsyncFakeDocumentReference] = []
-        try:
-            collection = get_by_path(self._data, self._path)
-        except KeyError:
-            return docs
-        for key in collection:
-            docs.append(self.document(key))
-        return docs
+        return [self.document(key) for key in self._store.all_document_ids(self._key)]
 
     def where(
         self,
@@ -105,11 +54,7 @@ class AsyncFakeCollectionReference(FakeCollectionReference):
         *,
         filter: Any = None,
     ) -> AsyncFakeQuery:
-        if filter is not None:
-            field = filter.field_path
-            op = filter.op_string
-            value = filter.value
-        return AsyncFakeQuery(self, field_filters=((field, op, value),))
+        return AsyncFakeQuery(self).where(field, op, value, filter=filter)
 
     def order_by(self, key: str, direction: Optional[str] = None) -> AsyncFakeQuery:
         return AsyncFakeQuery(self, orders=((key, direction),))
@@ -142,3 +87,32 @@ class AsyncFakeCollectionReference(FakeCollectionReference):
 
     def select(self, field_paths: Sequence[str]) -> AsyncFakeQuery:
         return AsyncFakeQuery(self, projection=field_paths)
+
+    def count(self, alias: Optional[str] = None) -> AsyncFakeAggregationQuery:
+        return AsyncFakeAggregationQuery(AsyncFakeQuery(self)).count(alias)
+
+    def sum(self, field_ref: str, alias: Optional[str] = None) -> AsyncFakeAggregationQuery:
+        return AsyncFakeAggregationQuery(AsyncFakeQuery(self)).sum(field_ref, alias)
+
+    def avg(self, field_ref: str, alias: Optional[str] = None) -> AsyncFakeAggregationQuery:
+        return AsyncFakeAggregationQuery(AsyncFakeQuery(self)).avg(field_ref, alias)
+
+    def find_nearest(
+        self,
+        vector_field: str,
+        query_vector: Sequence[float],
+        limit: int,
+        distance_measure: Any,
+        *,
+        distance_result_field: Optional[str] = None,
+        distance_threshold: Optional[float] = None,
+    ) -> AsyncFakeVectorQuery:
+        return AsyncFakeVectorQuery(
+            AsyncFakeQuery(self),
+            vector_field,
+            query_vector,
+            limit,
+            distance_measure,
+            distance_result_field,
+            distance_threshold,
+        )
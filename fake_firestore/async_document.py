@@ -9,6 +9,8 @@ if TYPE_CHECKING:
 
 
 class AsyncFakeDocumentReference(FakeDocumentReference):
+    __slots__ = ()
+
     async def get(  # type: ignore[override]
         self,
         field_paths: Optional[Iterable[str]] = None,
@@ -43,31 +45,17 @@ class AsyncFakeDocumentReference(FakeDocumentReference):
     def collection(self, name: str) -> AsyncFakeCollectionReference:
         from fake_firestore.async_collection import AsyncFakeCollectionReference
 
-        new_path = self._path + [name]
-        return AsyncFakeCollectionReference(
-            self._data, new_path, parent=self, written_docs=self._written_docs
-        )
+        return AsyncFakeCollectionReference._interned(self._store, self._key + (name,), parent=self)
 
     async def collections(self) -> List[AsyncFakeCollectionReference]:  # type: ignore[override]
         from fake_firestore.async_collection import AsyncFakeCollectionReference
 
-        assert self._collection_factory is not None
-        try:
-            from fake_firestore._helpers import get_by_path
-
-            node = get_by_path(self._data, self._path)
-        except (KeyError, TypeError):
-            return []
-        if not isinstance(node, dict):
-            return []
         result: List[AsyncFakeCollectionReference] = []
-        for key, value in node.items():
-            if isinstance(value, dict):
-                child_path = self._path + [key]
-                if any(wp[: len(child_path)] == tuple(child_path) for wp in self._written_docs):
-                    result.append(
-                        AsyncFakeCollectionReference(
-                            self._data, child_path, parent=self, written_docs=self._written_docs
-                        )
+        for key in self._store.subcollections(self._key):
+            if self._store.has_documents_under(self._key + (key,)):
+                result.append(
+                    AsyncFakeCollectionReference._interned(
+                        self._store, self._key + (key,), parent=self
                     )
+                )
         return result
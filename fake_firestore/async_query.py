@@ -11,21 +11,19 @@ from typing import (
     Union,
 )
 
+from fake_firestore.async_aggregation import AsyncFakeAggregationQuery
+from fake_firestore.async_vector_query import AsyncFakeVectorQuery
 from fake_firestore.document import FakeDocumentSnapshot
 from fake_firestore.query import FakeCollectionGroup, FakeQuery
 
 
 class AsyncFakeQuery(FakeQuery):
+    _aggregation_class = AsyncFakeAggregationQuery
+    _vector_query_class = AsyncFakeVectorQuery
+
     def _sync_stream(self) -> Iterator[FakeDocumentSnapshot]:
-        """Run the full query logic synchronously by using the sync parent stream."""
-        # FakeQuery.stream() calls self.parent.stream(), but our parent is async.
-        # Temporarily patch to use the _sync_stream method which uses sync doc refs.
-        original = self.parent.stream
-        self.parent.stream = self.parent._sync_stream  # type: ignore[attr-defined,method-assign]
-        try:
-            return FakeQuery.stream(self)
-        finally:
-            self.parent.stream = original  # type: ignore[method-assign]
+        """Run the full query logic synchronously."""
+        return FakeQuery.stream(self)
 
     async def stream(self, transaction: Any = None) -> AsyncIterator[FakeDocumentSnapshot]:  # type: ignore[override]
         for doc in self._sync_stream():
@@ -43,10 +41,9 @@ class AsyncFakeQuery(FakeQuery):
         filter: Any = None,
     ) -> AsyncFakeQuery:
         if filter is not None:
-            field = filter.field_path
-            op = filter.op_string
-            value = filter.value
-        self._add_field_filter(field, op, value)
+            self._add_filter(filter)
+        else:
+            self._add_field_filter(field, op, value)
         return self
 
     def order_by(self, key: str, direction: Optional[str] = "ASCENDING") -> AsyncFakeQuery:
@@ -91,10 +88,8 @@ class AsyncFakeQuery(FakeQuery):
 
 
 class AsyncFakeCollectionGroup(FakeCollectionGroup):
-    def _get_all_snapshots(self) -> Iterator[FakeDocumentSnapshot]:
-        """Override to use sync collection stream."""
-        for collection in self._collections:
-            yield from collection._sync_stream()  # type: ignore[attr-defined]
+    _aggregation_class = AsyncFakeAggregationQuery
+    _vector_query_class = AsyncFakeVectorQuery
 
     def _sync_stream(self) -> Iterator[FakeDocumentSnapshot]:
         """Call the sync FakeCollectionGroup.stream()."""
@@ -116,10 +111,9 @@ class AsyncFakeCollectionGroup(FakeCollectionGroup):
         filter: Any = None,
     ) -> AsyncFakeCollectionGroup:
         if filter is not None:
-            field = filter.field_path
-            op = filter.op_string
-            value = filter.value
-        self._add_field_filter(field, op, value)
+            self._add_filter(filter)
+        else:
+            self._add_field_filter(field, op, value)
         return self
 
     def order_by(
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, List, Optional
+
+from fake_firestore.document import FakeDocumentSnapshot
+from fake_firestore.vector_query import FakeVectorQuery
+
+
+class AsyncFakeVectorQuery(FakeVectorQuery):
+    async def get(  # type: ignore[override]
+        self, transaction: Any = None, timeout: Optional[float] = None
+    ) -> List[FakeDocumentSnapshot]:
+        return list(super().stream(transaction, timeout))
+
+    async def stream(  # type: ignore[override]
+        self, transaction: Any = None, timeout: Optional[float] = None
+    ) -> AsyncIterator[FakeDocumentSnapshot]:
+        for doc_snapshot in super().stream(transaction, timeout):
+            yield doc_snapshot
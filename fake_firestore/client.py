@@ -1,7 +1,11 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, Mapping, Optional, Sequence, Union
 
+from fake_firestore._cache import QueryCache
+from fake_firestore._store import ROOT, Store, shared_store
 from fake_firestore.collection import FakeCollectionReference
 from fake_firestore.document import FakeDocumentReference, FakeDocumentSnapshot
 from fake_firestore.query import FakeCollectionGroup
@@ -9,41 +13,34 @@ from fake_firestore.transaction import FakeTransaction, FakeWriteBatch
 
 
 class FakeFirestoreClient:
+    _collection_class = FakeCollectionReference
+
     def __init__(
         self,
-        data: Optional[Dict[str, Any]] = None,
-        written_docs: Optional[set[tuple[str, ...]]] = None,
+        data: Optional[Any] = None,
+        written_docs: Optional[Any] = None,
+        frozen: bool = False,
+        indexes: Union[str, os.PathLike[str], Mapping[str, Any], None] = None,
     ) -> None:
-        self._data: Dict[str, Any] = data if data is not None else {}
-        self._written_docs: set[tuple[str, ...]] = (
-            written_docs if written_docs is not None else set()
-        )
-
-    def _ensure_path(
-        self, path: List[str]
-    ) -> Union[FakeFirestoreClient, FakeCollectionReference, FakeDocumentReference]:
-        current_position: Union[
-            FakeFirestoreClient, FakeCollectionReference, FakeDocumentReference
-        ] = self
-
-        for el in path[:-1]:
-            if isinstance(current_position, (FakeFirestoreClient, FakeDocumentReference)):
-                current_position = current_position.collection(el)
-            else:
-                current_position = current_position.document(el)
-
-        return current_position
+        # Clients given the same ``data`` (or ``written_docs``) object share
+        # one store, loaded with the documents they hold when it is created;
+        # later writes are not copied back to them.
+        anchor = data if data is not None else written_docs
+        if anchor is not None:
+            self._store = shared_store(anchor, frozen, data, written_docs)
+        else:
+            self._store = Store(frozen)
+        if indexes is not None:
+            self.load_indexes(indexes)
 
     def document(self, path: str) -> FakeDocumentReference:
         path_parts = path.split("/")
 
         if len(path_parts) % 2 != 0:
             raise Exception("Cannot create document at path {}".format(path_parts))
-        current_position = self._ensure_path(path_parts)
-
-        if isinstance(current_position, FakeCollectionReference):
-            return current_position.document(path_parts[-1])
-        raise Exception("Invalid path")  # pragma: no cover
+        return self._collection_class._document_class._interned(
+            self._store, tuple(path_parts), _collection_factory=self._collection_class
+        )
 
     def collection(self, path: str) -> FakeCollectionReference:
         path_parts = path.split("/")
@@ -51,53 +48,99 @@ class FakeFirestoreClient:
         if len(path_parts) % 2 != 1:
             raise Exception("Cannot create collection at path {}".format(path_parts))
 
-        name = path_parts[-1]
-        if len(path_parts) > 1:
-            current_position = self._ensure_path(path_parts)
-            if isinstance(current_position, (FakeFirestoreClient, FakeDocumentReference)):
-                return current_position.collection(name)
-            raise Exception("Invalid path")  # pragma: no cover
-        else:
-            if name not in self._data:
-                self._data[name] = {}
-            return FakeCollectionReference(self._data, [name], written_docs=self._written_docs)
+        if len(path_parts) == 1:
+            self._store.collection((path_parts[0],), create=True)
+        return self._collection_class._interned(self._store, tuple(path_parts))
 
     def collections(self, timeout: Optional[float] = None) -> Sequence[FakeCollectionReference]:
         return [
-            FakeCollectionReference(self._data, [collection_name], written_docs=self._written_docs)
-            for collection_name in self._data
+            self._collection_class._interned(self._store, (collection_name,))
+            for collection_name in self._store.subcollections(ROOT)
         ]
 
     def reset(self) -> None:
-        self._data.clear()
-        self._written_docs.clear()
-
-    def _find_collections_by_name(
-        self,
-        data: Dict[str, Any],
-        name: str,
-        current_path: List[str],
-        is_collection_level: bool = True,
-    ) -> List[List[str]]:
-        """Recursively find all collection paths with the given name."""
-        paths: List[List[str]] = []
-
-        for key, value in data.items():
-            if is_collection_level:
-                # At collection level
-                new_path = current_path + [key]
-                if key == name:
-                    paths.append(new_path)
-                # Recurse into documents
-                if isinstance(value, dict):
-                    paths.extend(self._find_collections_by_name(value, name, new_path, False))
+        self._store.clear()
+
+    def load_indexes(self, indexes: Union[str, os.PathLike[str], Mapping[str, Any]]) -> None:
+        """Declare the composite indexes of a ``firestore.indexes.json`` file.
+
+        ``indexes`` is the path of the file or its parsed content. Queries
+        whose equality filters, range filter and ``order_by`` fields follow
+        one of the indexes are answered with a seek in it. Indexes on array
+        or vector fields are ignored.
+        """
+        if isinstance(indexes, Mapping):
+            config = indexes
+        else:
+            with open(indexes) as file:
+                config = json.load(file)
+        for definition in config.get("indexes", []):
+            fields = []
+            for field in definition["fields"]:
+                if "order" not in field:
+                    break
+                fields.append((field["fieldPath"], field["order"] == "DESCENDING"))
             else:
-                # At document level - recurse into subcollections
-                if isinstance(value, dict):
-                    new_path = current_path + [key]
-                    paths.extend(self._find_collections_by_name(value, name, new_path, True))
-
-        return paths
+                # Documents with equal values already follow in ID order.
+                if fields and fields[-1][0] == "__name__":
+                    fields.pop()
+                if fields:
+                    self._store.define_index(definition["collectionGroup"], tuple(fields))
+
+    def enable_query_cache(self, max_entries: int = 128, max_bytes: Optional[int] = None) -> None:
+        """Cache the results of queries until the collections they read are written to.
+
+        Repeating a query with the same filters, orders, cursors, limit,
+        offset and projection then returns new snapshots of the cached
+        results instead of running it again. Any write to a collection
+        invalidates the results of the queries on it (or on its collection
+        group). The results of at most ``max_entries`` queries are kept and,
+        with ``max_bytes``, at most that many estimated bytes; the least
+        recently used are evicted first. Clients sharing a store share its
+        cache.
+        """
+        self._store.query_cache = QueryCache(max_entries, max_bytes)
+
+    def disable_query_cache(self) -> None:
+        self._store.query_cache = None
+
+    def query_cache_info(self) -> Dict[str, int]:
+        """Hits, misses, evictions, entries and estimated bytes of the query cache.
+
+        All figures are zero when the cache is disabled.
+        """
+        if self._store.query_cache is None:
+            return {"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}
+        return self._store.query_cache.info()
+
+    def enable_approximate_vector_search(self, min_vectors: int = 10000, probes: int = 8) -> None:
+        """Answer ``find_nearest()`` from an inverted-file (IVF) index on large collections.
+
+        The vectors of a field with at least ``min_vectors`` vectors (of one
+        dimension, in one collection) are then partitioned around about
+        sqrt(n) k-means centroids, and a query only scores the vectors of the
+        ``probes`` partitions whose centroids are nearest to it. This trades
+        exact results for speed: a true neighbour in another partition is
+        missed. Smaller collections are still searched exhaustively.
+        """
+        self._store.vector_probes = (max(1, min_vectors), max(1, probes))
+
+    def disable_approximate_vector_search(self) -> None:
+        self._store.vector_probes = None
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Estimated memory use of the client's data; see ``Store.memory_usage``."""
+        return self._store.memory_usage()
+
+    def fork(self) -> FakeFirestoreClient:
+        """Return a client with an independent copy of this client's data.
+
+        The copy takes constant time: both clients share the stored documents
+        until one of them writes, and a write copies only what it touches.
+        """
+        client = type(self)(frozen=self._store.frozen)
+        client._store = self._store.fork()
+        return client
 
     def collection_group(self, collection_id: str) -> FakeCollectionGroup:
         """Query across all collections with the given name."""
@@ -105,11 +148,8 @@ class FakeFirestoreClient:
             raise ValueError(
                 f"Invalid collection_id '{collection_id}'. " "Collection IDs must not contain '/'."
             )
-        paths = self._find_collections_by_name(self._data, collection_id, [])
-        collections = [
-            FakeCollectionReference(self._data, path, written_docs=self._written_docs)
-            for path in paths
-        ]
+        paths = self._store.collection_paths(collection_id)
+        collections = [self._collection_class._interned(self._store, path) for path in paths]
         return FakeCollectionGroup(collections)
 
     def get_all(
@@ -120,7 +160,7 @@ class FakeFirestoreClient:
         timeout: Optional[float] = None,
     ) -> Iterator[FakeDocumentSnapshot]:
         for doc_ref in set(references):
-            yield doc_ref.get()
+            yield doc_ref.get(field_paths=field_paths)
 
     def transaction(self, **kwargs: Any) -> FakeTransaction:
         return FakeTransaction(self, **kwargs)
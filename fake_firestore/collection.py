@@ -1,47 +1,73 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Type, TypeVar, Union
 
 from fake_firestore import AlreadyExists
-from fake_firestore._helpers import (
-    Store,
-    Timestamp,
-    generate_random_string,
-    get_by_path,
-)
+from fake_firestore._helpers import Timestamp, generate_random_string
+from fake_firestore._store import Path, Store
+from fake_firestore.aggregation import FakeAggregationQuery
 from fake_firestore.document import FakeDocumentReference, FakeDocumentSnapshot
 from fake_firestore.query import FakeQuery
+from fake_firestore.vector_query import FakeVectorQuery
+
+C = TypeVar("C", bound="FakeCollectionReference")
 
 
 class FakeCollectionReference:
+    _document_class = FakeDocumentReference
+
+    __slots__ = ("_store", "_key", "_parent", "__weakref__")
+
     def __init__(
         self,
-        data: Store,
-        path: List[str],
+        store: Store,
+        path: Sequence[str],
         parent: Optional[FakeDocumentReference] = None,
-        written_docs: Optional[set[tuple[str, ...]]] = None,
     ) -> None:
-        self._data = data
-        self._path = path
-        self.parent = parent
-        self._written_docs: set[tuple[str, ...]] = (
-            written_docs if written_docs is not None else set()
-        )
+        self._store = store
+        self._key: Path = tuple(path)
+        self._parent = parent
+
+    @classmethod
+    def _interned(
+        cls: Type[C],
+        store: Store,
+        key: Path,
+        parent: Optional[FakeDocumentReference] = None,
+    ) -> C:
+        """Return the live reference to ``key`` in ``store``, creating it if needed."""
+        cache_key = (cls, key)
+        reference: Optional[C] = store.references.get(cache_key)
+        if reference is None:
+            reference = store.references[cache_key] = cls(store, key, parent)
+        elif reference._parent is None:
+            reference._parent = parent
+        return reference
+
+    @property
+    def _path(self) -> List[str]:
+        return list(self._key)
 
     @property
     def id(self) -> str:
-        return self._path[-1]
+        return self._key[-1]
+
+    @property
+    def parent(self) -> Optional[FakeDocumentReference]:
+        if self._parent is None and len(self._key) > 1:
+            self._parent = self._document_class._interned(
+                self._store, self._key[:-1], _collection_factory=type(self)
+            )
+        return self._parent
 
     def document(self, document_id: Optional[str] = None) -> FakeDocumentReference:
         if document_id is None:
             document_id = generate_random_string()
-        new_path = self._path + [document_id]
-        return FakeDocumentReference(
-            self._data,
-            new_path,
+        return self._document_class._interned(
+            self._store,
+            self._key + (document_id,),
             parent=self,
-            written_docs=self._written_docs,
-            _collection_factory=FakeCollectionReference,
+            _collection_factory=type(self),
         )
 
     def get(self, timeout: Optional[float] = None) -> List[FakeDocumentSnapshot]:
@@ -55,20 +81,9 @@ class FakeCollectionReference:
     ) -> Tuple[Timestamp, FakeDocumentReference]:
         if document_id is None:
             document_id = document_data.get("id", generate_random_string())
-        new_path = self._path + [document_id]
-        try:
-            collection = get_by_path(self._data, self._path)
-            if document_id in collection:
-                raise AlreadyExists("Document already exists: {}".format(new_path))  # type: ignore[no-untyped-call]
-        except KeyError:
-            pass
-        doc_ref = FakeDocumentReference(
-            self._data,
-            new_path,
-            parent=self,
-            written_docs=self._written_docs,
-            _collection_factory=FakeCollectionReference,
-        )
+        doc_ref = self.document(document_id)
+        if self._store.exists(doc_ref._key):
+            raise AlreadyExists("Document already exists: {}".format(doc_ref._path))  # type: ignore[no-untyped-call]
         doc_ref.set(document_data)
         timestamp = Timestamp.from_now()
         return timestamp, doc_ref
@@ -85,12 +100,8 @@ class FakeCollectionReference:
         *,
         filter: Any = None,
     ) -> FakeQuery:
-        if filter is not None:
-            field = filter.field_path
-            op = filter.op_string
-            value = filter.value
-        query = FakeQuery(self, field_filters=((field, op, value),))
-        return query
+        query = FakeQuery(self)
+        return query.where(field, op, value, filter=filter)
 
     def order_by(self, key: str, direction: Optional[str] = None) -> FakeQuery:
         query = FakeQuery(self, orders=((key, direction),))
@@ -128,30 +139,61 @@ class FakeCollectionReference:
         query = FakeQuery(self, end_at=(document_fields_or_snapshot, False))
         return query
 
+    def count(self, alias: Optional[str] = None) -> FakeAggregationQuery:
+        return FakeQuery(self).count(alias)
+
+    def sum(self, field_ref: str, alias: Optional[str] = None) -> FakeAggregationQuery:
+        return FakeQuery(self).sum(field_ref, alias)
+
+    def avg(self, field_ref: str, alias: Optional[str] = None) -> FakeAggregationQuery:
+        return FakeQuery(self).avg(field_ref, alias)
+
+    def find_nearest(
+        self,
+        vector_field: str,
+        query_vector: Sequence[float],
+        limit: int,
+        distance_measure: Any,
+        *,
+        distance_result_field: Optional[str] = None,
+        distance_threshold: Optional[float] = None,
+    ) -> FakeVectorQuery:
+        return FakeQuery(self).find_nearest(
+            vector_field,
+            query_vector,
+            limit,
+            distance_measure,
+            distance_result_field=distance_result_field,
+            distance_threshold=distance_threshold,
+        )
+
     def list_documents(
         self, page_size: Optional[int] = None, timeout: Optional[float] = None
     ) -> Sequence[FakeDocumentReference]:
-        docs: List[FakeDocumentReference] = []
-        try:
-            collection = get_by_path(self._data, self._path)
-        except KeyError:
-            return docs
-        for key in collection:
-            docs.append(self.document(key))
-        return docs
+        return [self.document(key) for key in self._store.all_document_ids(self._key)]
 
     def stream(
         self, transaction: Any = None, timeout: Optional[float] = None
     ) -> Iterator[FakeDocumentSnapshot]:
-        try:
-            collection = get_by_path(self._data, self._path)
-        except KeyError:
-            return
-        for key in sorted(collection):
-            doc_snapshot = self.document(key).get()
+        # Fork the ID index so callers may write to the collection while iterating.
+        for document_id in self._store.document_ids(self._key).fork():
+            doc_snapshot = self._snapshot(document_id)
             if doc_snapshot.exists:
                 yield doc_snapshot
 
+    def memory_usage(self) -> Dict[str, int]:
+        """Estimated memory use of the collection's documents; see ``Store.memory_usage``."""
+        return self._store.memory_usage(self._key)
+
+    def _sync_stream(self, transaction: Any = None) -> Iterator[FakeDocumentSnapshot]:
+        """Stream synchronously, bypassing any async ``stream()`` override."""
+        return FakeCollectionReference.stream(self, transaction)
+
+    def _snapshot(self, document_id: str) -> FakeDocumentSnapshot:
+        """Build a snapshot synchronously, bypassing any async ``get()`` override."""
+        doc_ref = self.document(document_id)
+        return FakeDocumentSnapshot(doc_ref, *self._store.read(doc_ref._key))
+
 
 # Backward compatibility alias
 CollectionReference = FakeCollectionReference
@@ -3,27 +3,47 @@ from __future__ import annotations
 import operator
 from copy import deepcopy
 from functools import reduce
-from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Type, TypeVar
 
 from fake_firestore import AlreadyExists, NotFound
 from fake_firestore._helpers import (
     Document,
-    Store,
+    StoredDocument,
     Timestamp,
-    delete_by_path,
-    get_by_path,
-    set_by_path,
+    freeze,
+    project,
+    projection_paths,
+    thaw,
 )
-from fake_firestore._transformations import apply_transformations
+from fake_firestore._store import Path, Store
+from fake_firestore._transformations import apply_transformations, has_transformations
 
 if TYPE_CHECKING:
     from fake_firestore.collection import FakeCollectionReference
 
+D = TypeVar("D", bound="FakeDocumentReference")
+
 
 class FakeDocumentSnapshot:
-    def __init__(self, reference: FakeDocumentReference, data: Document | None) -> None:
+    """A point-in-time view of a document.
+
+    The snapshot holds the stored value it was read from, together with the
+    document version, and only copies it the first time ``to_dict()`` or
+    ``get()`` is called. The store never mutates a stored value (writes
+    replace it), so an unmaterialized snapshot still sees the document as it
+    was when read, and queries can filter on it without copying.
+    """
+
+    __slots__ = ("reference", "_data", "_version", "_doc")
+
+    def __init__(
+        self, reference: FakeDocumentReference, data: StoredDocument | None, version: int = 0
+    ) -> None:
         self.reference = reference
-        self._doc = deepcopy(data) if data is not None else None
+        self._data = data
+        self._version = version
+        self._doc: Document | None = None
 
     @property
     def id(self) -> str:
@@ -31,9 +51,14 @@ class FakeDocumentSnapshot:
 
     @property
     def exists(self) -> bool:
-        return self._doc is not None
+        return self._data is not None
 
     def to_dict(self) -> Document | None:
+        if self._doc is None and self._data is not None:
+            if isinstance(self._data, MappingProxyType):
+                self._doc = thaw(self._data)
+            else:
+                self._doc = deepcopy(self._data)  # type: ignore[assignment]
         return self._doc
 
     @property
@@ -51,49 +76,82 @@ class FakeDocumentSnapshot:
         return timestamp
 
     def get(self, field_path: str) -> Any:
-        if not self.exists or self._doc is None:
+        document = self.to_dict()
+        if document is None:
             return None
-        return reduce(operator.getitem, field_path.split("."), self._doc)
+        return reduce(operator.getitem, field_path.split("."), document)
+
+    def _get_stored(self, field_path: str) -> Any:
+        """Read a field from the stored value without copying; must not be mutated."""
+        if self._data is None:
+            return None
+        return reduce(operator.getitem, field_path.split("."), self._data)
 
     def _get_by_field_path(self, field_path: str) -> Any:
         try:
-            return self.get(field_path)
+            return self._get_stored(field_path)
         except KeyError:
             return None
 
 
 class FakeDocumentReference:
+    __slots__ = ("_store", "_key", "_parent", "_collection_factory", "__weakref__")
+
     def __init__(
         self,
-        data: Store,
-        path: List[str],
-        parent: FakeCollectionReference,
-        written_docs: set[tuple[str, ...]] | None = None,
-        _collection_factory: Callable[..., FakeCollectionReference] | None = None,
+        store: Store,
+        path: Sequence[str],
+        parent: FakeCollectionReference | None = None,
+        _collection_factory: Type[FakeCollectionReference] | None = None,
     ) -> None:
-        self._data = data
-        self._path = path
-        self.parent = parent
-        self._written_docs: set[tuple[str, ...]] = (
-            written_docs if written_docs is not None else set()
-        )
+        self._store = store
+        self._key: Path = tuple(path)
+        self._parent = parent
         self._collection_factory = _collection_factory
 
+    @classmethod
+    def _interned(
+        cls: Type[D],
+        store: Store,
+        key: Path,
+        parent: FakeCollectionReference | None = None,
+        _collection_factory: Type[FakeCollectionReference] | None = None,
+    ) -> D:
+        """Return the live reference to ``key`` in ``store``, creating it if needed."""
+        cache_key = (cls, _collection_factory, key)
+        reference: D | None = store.references.get(cache_key)
+        if reference is None:
+            reference = store.references[cache_key] = cls(store, key, parent, _collection_factory)
+        elif reference._parent is None:
+            reference._parent = parent
+        return reference
+
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, FakeDocumentReference):
             return NotImplemented
-        return self._path == other._path
+        return self._key == other._key
 
     def __hash__(self) -> int:
-        return hash(tuple(self._path))
+        return hash(self._key)
+
+    @property
+    def _path(self) -> List[str]:
+        return list(self._key)
 
     @property
     def id(self) -> str:
-        return self._path[-1]
+        return self._key[-1]
 
     @property
     def path(self) -> str:
-        return "/".join(self._path)
+        return "/".join(self._key)
+
+    @property
+    def parent(self) -> FakeCollectionReference:
+        if self._parent is None:
+            assert self._collection_factory is not None
+            self._parent = self._collection_factory._interned(self._store, self._key[:-1])
+        return self._parent
 
     def get(
         self,
@@ -102,78 +160,73 @@ class FakeDocumentReference:
         retry: Any = None,
         timeout: Optional[float] = None,
     ) -> FakeDocumentSnapshot:
-        if tuple(self._path) not in self._written_docs:
-            return FakeDocumentSnapshot(self, None)
-        try:
-            data = get_by_path(self._data, self._path)
-        except KeyError:
-            data = {}
-        if field_paths is not None:
-            data = {k: v for k, v in data.items() if k in field_paths}
-        return FakeDocumentSnapshot(self, data)
+        data, version = self._store.read(self._key)
+        if data is not None and field_paths is not None:
+            data = project(data, projection_paths(field_paths))
+            if self._store.frozen:
+                data = freeze(data)
+        return FakeDocumentSnapshot(self, data, version)
 
     def create(self, data: Dict[str, Any], timeout: Optional[float] = None) -> None:
         """Create a new document with the given data.
 
         Raises AlreadyExists if the document already exists.
         """
-        if tuple(self._path) in self._written_docs:
+        if self._store.exists(self._key):
             raise AlreadyExists(f"Document already exists: {self._path}")  # type: ignore[no-untyped-call]
-        set_by_path(self._data, self._path, deepcopy(data))
-        self._written_docs.add(tuple(self._path))
+        # Frozen storage copies the containers as it freezes them.
+        self._store.set(self._key, data if self._store.frozen else deepcopy(data))
 
     def delete(self, timeout: Optional[float] = None) -> None:
-        delete_by_path(self._data, self._path)
-        self._written_docs.discard(tuple(self._path))
+        self._store.delete(self._key)
 
     def set(
         self, data: Dict[str, Any], merge: bool = False, timeout: Optional[float] = None
     ) -> None:
         if merge:
             try:
-                self.update(deepcopy(data))
+                self.update(data if self._store.frozen else deepcopy(data))
             except NotFound:
                 self.set(data)
+        elif self._store.frozen and not has_transformations(data):
+            self._store.set(self._key, data)
         else:
             data = deepcopy(data)
             document: Dict[str, Any] = {}
             apply_transformations(document, data)
-            set_by_path(self._data, self._path, document)
-            self._written_docs.add(tuple(self._path))
+            self._store.set(self._key, document)
 
     def update(self, data: Dict[str, Any], timeout: Optional[float] = None) -> None:
-        if tuple(self._path) not in self._written_docs:
+        document = self._store.get(self._key)
+        if document is None:
             raise NotFound("No document to update: {}".format(self._path))  # type: ignore[no-untyped-call]
-        document = get_by_path(self._data, self._path)
 
-        apply_transformations(document, deepcopy(data))
+        # Documents are replaced rather than mutated, so snapshots of the
+        # previous version stay intact. Only the top-level fields the update
+        # touches are copied; the rest is shared with the previous version.
+        copy_value = thaw if self._store.frozen else deepcopy
+        updated = dict(document)
+        for field in data:
+            if isinstance(field, str):
+                name = field.split(".", 1)[0]
+                if name in updated:
+                    updated[name] = copy_value(updated[name])
+        apply_transformations(updated, copy_value(freeze(data) if self._store.frozen else data))
+        self._store.set(self._key, updated)
 
     def collection(self, name: str) -> FakeCollectionReference:
         assert self._collection_factory is not None
-        new_path = self._path + [name]
-        return self._collection_factory(
-            self._data, new_path, parent=self, written_docs=self._written_docs
-        )
+        return self._collection_factory._interned(self._store, self._key + (name,), parent=self)
 
     def collections(self, timeout: Optional[float] = None) -> List[FakeCollectionReference]:
         assert self._collection_factory is not None
-        try:
-            node = get_by_path(self._data, self._path)
-        except (KeyError, TypeError):
-            return []
-        if not isinstance(node, dict):
-            return []
         result = []
-        for key, value in node.items():
-            if isinstance(value, dict):
-                child_path = self._path + [key]
-                # Only include if any written doc exists under this path
-                if any(wp[: len(child_path)] == tuple(child_path) for wp in self._written_docs):
-                    result.append(
-                        self._collection_factory(
-                            self._data, child_path, parent=self, written_docs=self._written_docs
-                        )
-                    )
+        for key in self._store.subcollections(self._key):
+            # Only include if any written doc exists under this path
+            if self._store.has_documents_under(self._key + (key,)):
+                result.append(
+                    self._collection_factory._interned(self._store, self._key + (key,), parent=self)
+                )
         return result
 
 
@@ -1,27 +1,579 @@
 from __future__ import annotations
 
-from itertools import islice, tee
+import heapq
+import operator
+from bisect import bisect_left
+from functools import partial
+from itertools import chain, islice
+from operator import itemgetter, methodcaller
+from types import MappingProxyType
 from typing import (
     TYPE_CHECKING,
     Any,
     Callable,
     Dict,
+    Hashable,
     Iterable,
     Iterator,
     List,
     Optional,
     Sequence,
+    Set,
     Tuple,
     Union,
 )
 
+from fake_firestore._cache import QueryCache
+from fake_firestore._helpers import StoredDocument, freeze, project, projection_paths
+from fake_firestore._index import (
+    MISSING,
+    ArrayIndex,
+    Bound,
+    Cursor,
+    EqualityIndex,
+    Postings,
+    RangeIndex,
+    cursor_range,
+    field_value,
+    intersect,
+    order_key,
+    position_key,
+    sort_key,
+)
+from fake_firestore._store import Path
+from fake_firestore.aggregation import FakeAggregationQuery
 from fake_firestore.document import FakeDocumentSnapshot
+from fake_firestore.vector_query import FakeVectorQuery
 
 if TYPE_CHECKING:
     from fake_firestore.collection import FakeCollectionReference
 
+# A ``where()`` filter: field path, operator, compiled predicate and value.
+FieldFilter = Tuple[str, str, Callable[[StoredDocument], bool], Any]
+# A cursor positioned by value: the values it gives for the ordered fields,
+# the snapshot it was taken from, if any, and whether it is inclusive.
+Position = Tuple[Dict[str, Any], Optional[FakeDocumentSnapshot], bool]
+Positions = Tuple[Optional[Position], Optional[Position]]
+
+_RANGE_OPS = ("<", "<=", ">", ">=")
+# StructuredQuery.CompositeFilter.Operator.OR, compared by value so that
+# google-cloud-firestore stays optional.
+_OR = 2
+_LISTS = (list, tuple, set, frozenset)
+_SCALARS = (str, bytes, int, float)
+# Stored arrays: lists, or frozen lists (tuples) in frozen storage.
+_ARRAYS = (list, tuple)
+_COMPARISONS: Dict[str, Callable[[Any, Any], bool]] = {
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def _candidates(
+    collection: FakeCollectionReference,
+    field_filters: List[FieldFilter],
+    orders: Sequence[Tuple[str, Optional[str]]] = (),
+    positions: Positions = (None, None),
+) -> Tuple[Iterator[FakeDocumentSnapshot], bool]:
+    """Snapshots of the collection's documents that match ``field_filters``.
+
+    See ``_candidate_ids`` for how the documents are found. Also returns
+    whether the snapshots already follow ``orders``.
+    """
+    document_ids, ordered = _candidate_ids(collection, field_filters, orders, positions)
+    predicates = [predicate for _, _, predicate, _ in field_filters]
+    return _scan(collection, document_ids, predicates), ordered
+
+
+def _scan(
+    collection: FakeCollectionReference,
+    document_ids: Iterable[str],
+    predicates: Sequence[Callable[[StoredDocument], bool]],
+) -> Iterator[FakeDocumentSnapshot]:
+    """Snapshots of the documents with ``document_ids`` whose stored fields pass ``predicates``.
+
+    The predicates test the stored value, so documents that are filtered
+    out are never given a reference or a snapshot.
+    """
+    store = collection._store
+    key = collection._key
+    for document_id in document_ids:
+        fields, version = store.read(key + (document_id,))
+        if fields is None:
+            continue
+        for predicate in predicates:
+            if not predicate(fields):
+                break
+        else:
+            yield FakeDocumentSnapshot(collection.document(document_id), fields, version)
+
+
+def _scan_fields(
+    collection: FakeCollectionReference,
+    document_ids: Iterable[str],
+    predicates: Sequence[Callable[[StoredDocument], bool]],
+) -> Iterator[StoredDocument]:
+    """Like ``_scan``, but yield the stored fields themselves, for aggregations."""
+    store = collection._store
+    key = collection._key
+    for document_id in document_ids:
+        fields = store.get(key + (document_id,))
+        if fields is not None and all(predicate(fields) for predicate in predicates):
+            yield fields
+
+
+def _candidate_ids(
+    collection: FakeCollectionReference,
+    field_filters: List[FieldFilter],
+    orders: Sequence[Tuple[str, Optional[str]]] = (),
+    positions: Positions = (None, None),
+) -> Tuple[Iterable[str], bool]:
+    """IDs of the collection's documents that may match ``field_filters``.
+
+    The index lookups of the filters, intersected, narrow the documents
+    down when there are any, and give them in ID order; see
+    ``_index_lookup``.
+    Otherwise the range index of the first ordered or range-filtered field
+    gives the documents within the range filters on that field, in its
+    order, so that a ``limit`` only reads as far as it needs. The filters
+    themselves still have to be applied to the result.
+
+    A declared composite index that the query follows takes precedence over
+    all of these; see ``_composite_seek``.
+
+    An index that gives the documents in the query's order also skips to
+    the cursor ``positions`` with a bisection, so that a page costs the
+    same however deep it is.
+
+    Also returns whether the IDs already follow ``orders``.
+    """
+    composite = _composite_seek(collection, field_filters, orders, positions)
+    if composite is not None:
+        return composite, True
+
+    best = _index_lookup(collection, [(field, op, value) for field, op, _, value in field_filters])
+    if best is not None:
+        return best, False
+
+    ranged = [name for name, op, _, _ in field_filters if op in _RANGE_OPS]
+    order_field = orders[0][0] if orders else None
+    range_field = ranged[0] if ranged and order_field not in ranged else order_field
+    if range_field is None:
+        # Fork the ID index so callers may write to the collection while iterating.
+        return collection._store.document_ids(collection._key).fork(), not orders
+    range_index = collection._store.field_index(collection._key, RangeIndex, range_field)
+    if range_index is None:
+        return (), True
+    bounds = [
+        (op, value)
+        for name, op, _, value in field_filters
+        if name == range_field and op in _RANGE_OPS
+    ]
+    descending = range_field == order_field and orders[0][1] == "DESCENDING"
+    ordered = not orders or (len(orders) == 1 and range_field == order_field)
+    start_at, end_at = (_index_cursor(collection, position) for position in positions)
+    if not ordered:
+        start_at = end_at = None
+    return range_index.seek((), bounds, descending, start_at, end_at), ordered
+
+
+def _index_lookup(
+    collection: FakeCollectionReference, filters: Iterable[Tuple[str, str, Any]]
+) -> Optional[List[str]]:
+    """Sorted IDs of the documents that may match all of ``filters``, or None if no index applies.
+
+    ``==`` and ``in`` filters are looked up in equality indexes,
+    ``array_contains`` and ``array_contains_any`` filters in array indexes,
+    and ``or`` filters in the indexes of each of their branches; see
+    ``_index_union``. The lookups are merged with ``intersect``, so that
+    several equality filters cost as much as the most selective of them.
+    """
+    lookups: List[Postings] = []
+    for field, op, value in filters:
+        if op == "or":
+            ids = _index_union(collection, value)
+            postings = None if ids is None else Postings.from_ids(ids)
+        else:
+            if op == "==" or op == "array_contains":
+                values: Any = (value,)
+            elif op in ("in", "array_contains_any") and isinstance(value, _LISTS):
+                values = value
+            else:
+                continue
+            kind = ArrayIndex if op.startswith("array_contains") else EqualityIndex
+            index = collection._store.field_index(collection._key, kind, field)
+            if index is None:
+                return []
+            postings = index.postings(values)
+        if postings is not None:
+            lookups.append(postings)
+    if not lookups:
+        return None
+    return intersect(lookups)
+
+
+def _index_union(
+    collection: FakeCollectionReference, branches: Iterable[Iterable[Tuple[str, str, Any]]]
+) -> Optional[List[str]]:
+    """Sorted IDs of the documents that may match any of an ``or`` filter's ``branches``.
+
+    Each branch is looked up with ``_index_lookup``, and a document matched
+    by several branches is listed once. None if a branch has no lookup,
+    since the filter then has to be tested on every document.
+    """
+    matches: Set[str] = set()
+    for branch in branches:
+        ids = _index_lookup(collection, branch)
+        if ids is None:
+            return None
+        matches.update(ids)
+    return sorted(matches)
+
+
+def _composite_seek(
+    collection: FakeCollectionReference,
+    field_filters: List[FieldFilter],
+    orders: Sequence[Tuple[str, Optional[str]]],
+    positions: Positions = (None, None),
+) -> Optional[Iterator[str]]:
+    """IDs from a composite index the query follows, in the query's order; None if none fits.
+
+    An index fits when its first fields all have ``==`` filters and the rest
+    are the query's ``order_by`` fields (other than those with ``==``
+    filters), in the index's directions or all reversed. A range filter is
+    allowed on the first ordered field; without ``order_by``, the
+    range-filtered field is ordered ascending, as in Firestore. Documents
+    with equal values must also follow in ID order in the direction of the
+    last ``order_by`` field, even one with an ``==`` filter.
+    """
+    indexes = collection._store.composite_indexes(collection._key)
+    if not indexes:
+        return None
+    equal: Dict[str, Any] = {}
+    ranged: Dict[str, List[Tuple[str, Any]]] = {}
+    for field, op, _, value in field_filters:
+        if op == "==" and value is not None:
+            equal.setdefault(field, value)
+        elif op in _RANGE_OPS:
+            ranged.setdefault(field, []).append((op, value))
+    ordered = [
+        (field, direction == "DESCENDING") for field, direction in orders if field not in equal
+    ]
+    if not ordered and len(ranged) == 1:
+        ordered = [(next(iter(ranged)), False)]
+    if len(ranged) > 1 or (ranged and ordered[0][0] not in ranged):
+        return None
+    descending_ids = bool(orders) and orders[-1][1] == "DESCENDING"
+    for index in indexes:
+        prefix = len(index.fields) - len(ordered)
+        if prefix < 0 or any(field not in equal for field, _ in index.fields[:prefix]):
+            continue
+        tail = index.fields[prefix:]
+        if [field for field, _ in tail] != [field for field, _ in ordered]:
+            continue
+        flipped = {descending != wanted for (_, descending), (_, wanted) in zip(tail, ordered)}
+        if len(flipped) > 1:
+            continue
+        # The index's IDs follow its last field; reversing it reverses them too.
+        reverse = flipped == {True} if tail else descending_ids != index.fields[-1][1]
+        if (index.fields[-1][1] != reverse) != descending_ids:
+            continue
+        values = [equal[field] for field, _ in index.fields[:prefix]]
+        bounds = ranged.get(tail[0][0], []) if tail else []
+        start_at, end_at = (_index_cursor(collection, position, equal) for position in positions)
+        return index.seek(values, bounds, reverse, start_at, end_at)
+    return None
+
+
+def _index_cursor(
+    collection: FakeCollectionReference,
+    position: Optional[Position],
+    equal: Optional[Dict[str, Any]] = None,
+) -> Optional[Cursor]:
+    """A cursor position as the collection's indexes see it.
+
+    A snapshot from another collection only bounds the values, inclusively,
+    since its ties with this collection's documents are broken by path. A
+    cursor whose value for a field with an ``==`` filter differs from the
+    filter's is not passed on; the documents it skips are skipped later.
+    """
+    if position is None:
+        return None
+    values, snapshot, inclusive = position
+    if equal and any(
+        field in equal and sort_key(value) != sort_key(equal[field])
+        for field, value in values.items()
+    ):
+        return None
+    if snapshot is None:
+        return values, None, inclusive
+    if snapshot.reference._key[:-1] == collection._key:
+        return values, snapshot.id, inclusive
+    return values, None, True
+
+
+def _predicate(field: str, op: str, value: Any) -> Callable[[StoredDocument], bool]:
+    """Compile a ``where()`` filter into a test of a document's stored fields.
+
+    The field path is split and the operator chosen once, when the filter is
+    added. Documents without the field read it as None, except for
+    ``not-in``, which leaves them out as Firestore does. ``in``, ``not-in``
+    and ``array_contains_any`` look values up in a frozenset when they can
+    be hashed. An ``or`` filter, made by ``_conjunction``, has no field; its
+    value holds the filters of each branch.
+    """
+    if op == "or":
+        branches = [[_predicate(*branch_filter) for branch_filter in branch] for branch in value]
+        return lambda fields: any(
+            all(predicate(fields) for predicate in branch) for branch in branches
+        )
+    path = field.split(".")
+    get = _getter(path)
+    if op == "==":
+        return lambda fields: get(fields) == value
+    elif op == "!=":
+        return lambda fields: get(fields) != value
+    elif op in _RANGE_OPS:
+        compare = _COMPARISONS[op]
+        bound = sort_key(value)
+        rank = bound[0]
+        # Values of these types compare as their sort keys do, so skip building keys.
+        scalar = type(value) if type(value) in _SCALARS and value == value else None
+
+        def in_range(fields: StoredDocument) -> bool:
+            x = get(fields)
+            if type(x) is scalar:
+                return compare(x, value)
+            key = sort_key(x)
+            # Range filters only match values of the same type as their bound.
+            return key[0] == rank and compare(key, bound)
+
+        return in_range
+    elif op == "in":
+        contains = _container(value)
+        return lambda fields: contains(get(fields))
+    elif op == "not-in":
+        contains = _container(value)
+        get_or_missing = _getter(path, MISSING)
+
+        def not_in(fields: StoredDocument) -> bool:
+            x = get_or_missing(fields)
+            return x is not MISSING and not contains(x)
+
+        return not_in
+    elif op == "array_contains":
+
+        def array_contains(fields: StoredDocument) -> bool:
+            x = get(fields)
+            return isinstance(x, _ARRAYS) and value in x
+
+        return array_contains
+    elif op == "array_contains_any":
+        contains = _container(value)
+
+        def array_contains_any(fields: StoredDocument) -> bool:
+            x = get(fields)
+            return isinstance(x, _ARRAYS) and any(contains(element) for element in x)
+
+        return array_contains_any
+    else:
+        raise ValueError(f"Unknown operator: {op}")
+
+
+def _conjunction(filter: Any) -> List[Tuple[str, str, Any]]:
+    """The ``where()`` filters that a filter object of the real SDK requires together.
+
+    A ``FieldFilter`` is a single filter and an ``And`` filter the filters
+    of all its parts. An ``Or`` filter becomes a single ``or`` filter, whose
+    value holds the conjunction of each of its parts.
+    """
+    filters = getattr(filter, "filters", None)
+    if filters is None:
+        return [(filter.field_path, filter.op_string, filter.value)]
+    if filter.operator == _OR:
+        return [("", "or", tuple(tuple(_conjunction(part)) for part in filters))]
+    return [field_filter for part in filters for field_filter in _conjunction(part)]
+
+
+def _has_field(field: str) -> Callable[[StoredDocument], bool]:
+    """Test whether a document has ``field``; ordering by it leaves out documents without it."""
+    get = _getter(field.split("."), MISSING)
+    return lambda fields: get(fields) is not MISSING
+
+
+def _getter(path: List[str], default: Any = None) -> Callable[[StoredDocument], Any]:
+    if len(path) == 1:
+        return methodcaller("get", path[0], default)
+    return partial(field_value, path=path, default=default)
+
+
+def _container(values: Any) -> Callable[[Any], bool]:
+    """Membership test in the values of an ``in``-like filter."""
+    if isinstance(values, _LISTS):
+        try:
+            lookup = frozenset(values)
+        except TypeError:
+            return tuple(values).__contains__
+        fallback = tuple(values)
+
+        def contains(x: Any) -> bool:
+            try:
+                return x in lookup
+            except TypeError:
+                return x in fallback
+
+        return contains
+    return lambda x: x in values
+
+
+def _order_paths(orders: Sequence[Tuple[str, Optional[str]]]) -> List[Tuple[List[str], bool]]:
+    return [(field.split("."), direction == "DESCENDING") for field, direction in orders]
+
+
+def _keyed(
+    doc_snapshots: Iterable[FakeDocumentSnapshot], paths: List[Tuple[List[str], bool]]
+) -> Iterator[Tuple[Tuple[Any, ...], FakeDocumentSnapshot]]:
+    for doc_snapshot in doc_snapshots:
+        key = order_key(doc_snapshot._data or {}, paths, doc_snapshot.reference._key)
+        if key is not None:
+            yield key, doc_snapshot
+
+
+def _sorted(
+    doc_snapshots: Iterable[FakeDocumentSnapshot],
+    orders: Sequence[Tuple[str, Optional[str]]],
+    top: Optional[int] = None,
+    lower: Optional[Bound] = None,
+    upper: Optional[Bound] = None,
+) -> List[FakeDocumentSnapshot]:
+    """Sort by all ``orders`` at once, dropping documents without an ordered field.
+
+    Values order as in Firestore, across types, and ties are broken by
+    document path. With ``top``, only that many first results are kept,
+    selected with a heap. The ``lower`` and ``upper`` cursor bounds are
+    found with a bisection of the sorted keys.
+    """
+    keyed = _keyed(doc_snapshots, _order_paths(orders))
+    if top is not None:
+        return [doc_snapshot for _, doc_snapshot in heapq.nsmallest(top, keyed, key=itemgetter(0))]
+    ordered = sorted(keyed, key=itemgetter(0))
+    if lower is not None or upper is not None:
+        keys = [key for key, _ in ordered]
+        start, stop = cursor_range(partial(bisect_left, keys), 0, len(keys), lower, upper)
+        ordered = ordered[start:stop]
+    return [doc_snapshot for _, doc_snapshot in ordered]
+
+
+def _between(
+    doc_snapshots: Iterable[FakeDocumentSnapshot],
+    orders: Sequence[Tuple[str, Optional[str]]],
+    lower: Optional[Bound],
+    upper: Optional[Bound],
+) -> Iterator[FakeDocumentSnapshot]:
+    """Skip the ordered snapshots before ``lower`` and stop at ``upper``."""
+    for key, doc_snapshot in _keyed(doc_snapshots, _order_paths(orders)):
+        if lower is not None:
+            bound, inclusive = lower
+            head = key[: len(bound)]
+            if head < bound or (head == bound and not inclusive):
+                continue
+            lower = None
+        if upper is not None:
+            bound, inclusive = upper
+            head = key[: len(bound)]
+            if head > bound or (head == bound and not inclusive):
+                return
+        yield doc_snapshot
+
+
+def _position(
+    cursor: Optional[Tuple[Union[Dict[str, Any], FakeDocumentSnapshot], bool]],
+    orders: Sequence[Tuple[str, Optional[str]]],
+) -> Optional[Position]:
+    """The position of a cursor among results in ``orders``; None if it gives no values.
+
+    As in Firestore, a snapshot gives its values for every ordered field,
+    followed by its path, and a dict gives the values of the first ordered
+    fields it has.
+    """
+    if cursor is None or not orders:
+        return None
+    document_fields_or_snapshot, before = cursor
+    values: Dict[str, Any] = {}
+    if isinstance(document_fields_or_snapshot, FakeDocumentSnapshot):
+        data = document_fields_or_snapshot._data or {}
+        for field, _ in orders:
+            value = field_value(data, field.split("."), MISSING)
+            if value is MISSING:
+                return None
+            values[field] = value
+        return values, document_fields_or_snapshot, before
+    for field, _ in orders:
+        if field not in document_fields_or_snapshot:
+            break
+        values[field] = document_fields_or_snapshot[field]
+    return (values, None, before) if values else None
+
+
+def _bound(
+    position: Optional[Position], orders: Sequence[Tuple[str, Optional[str]]]
+) -> Optional[Bound]:
+    """A cursor position as a bound on the ``order_key`` of the results."""
+    if position is None:
+        return None
+    values, snapshot, inclusive = position
+    path = MISSING if snapshot is None else snapshot.reference._key
+    return position_key(list(values.values()), _order_paths(orders), path), inclusive
+
+
+def _fingerprint(value: Any) -> Hashable:
+    """Hashable stand-in for a filter or cursor value, telling apart values of different types.
+
+    Raises TypeError for values that cannot be hashed.
+    """
+    if isinstance(value, (dict, MappingProxyType)):
+        return (dict, tuple(sorted((k, _fingerprint(v)) for k, v in value.items())))
+    if isinstance(value, (set, frozenset)):
+        return (frozenset, frozenset(_fingerprint(v) for v in value))
+    if isinstance(value, (list, tuple)):
+        return (list, tuple(_fingerprint(v) for v in value))
+    hash(value)
+    return (type(value), value)
+
+
+def _cursor_fingerprint(
+    cursor: Optional[Tuple[Union[Dict[str, Any], FakeDocumentSnapshot], bool]],
+    orders: Sequence[Tuple[str, Optional[str]]],
+) -> Hashable:
+    """Fingerprint of a cursor: its values, or a snapshot's path and ordered values."""
+    if cursor is None:
+        return None
+    document_fields_or_snapshot, before = cursor
+    if isinstance(document_fields_or_snapshot, FakeDocumentSnapshot):
+        data = document_fields_or_snapshot._data or {}
+        values = [field_value(data, field.split("."), MISSING) for field, _ in orders]
+        return document_fields_or_snapshot.reference._key, _fingerprint(values), before
+    return _fingerprint(document_fields_or_snapshot), before
+
+
+def _at_cursor(
+    document_fields_or_snapshot: Union[Dict[str, Any], FakeDocumentSnapshot],
+    doc_snapshot: FakeDocumentSnapshot,
+) -> bool:
+    """Whether ``doc_snapshot`` is the document a cursor points at."""
+    if isinstance(document_fields_or_snapshot, FakeDocumentSnapshot):
+        return doc_snapshot.id == document_fields_or_snapshot.id
+    return bool(document_fields_or_snapshot) and all(
+        doc_snapshot._get_by_field_path(k) == v for k, v in document_fields_or_snapshot.items()
+    )
+
 
 class FakeQuery:
+    _aggregation_class = FakeAggregationQuery
+    _vector_query_class = FakeVectorQuery
+
     def __init__(
         self,
         parent: FakeCollectionReference,
@@ -36,7 +588,7 @@ class FakeQuery:
     ) -> None:
         self.parent = parent
         self._projection: Optional[List[str]] = list(projection) if projection is not None else None
-        self._field_filters: List[Tuple[str, Callable[[Any, Any], bool], Any]] = []
+        self._field_filters: List[FieldFilter] = []
         self.orders: List[Tuple[str, Optional[str]]] = list(orders)
         self._limit = limit
         self._offset = offset
@@ -51,33 +603,107 @@ class FakeQuery:
     def stream(
         self, transaction: Any = None, timeout: Optional[float] = None
     ) -> Iterator[FakeDocumentSnapshot]:
-        doc_snapshots: Iterable[FakeDocumentSnapshot] = self.parent.stream()
+        store = self.parent._store
+        if store.query_cache is not None:
+            version = store.collection_version(self.parent._key)
+            return self._cached(store.query_cache, (self.parent._key,), version)
+        return self._stream()
 
-        for field, compare, value in self._field_filters:
-            doc_snapshots = [
-                doc_snapshot
-                for doc_snapshot in doc_snapshots
-                if compare(doc_snapshot._get_by_field_path(field), value)
-            ]
+    def _stream(self, project: bool = True) -> Iterator[FakeDocumentSnapshot]:
+        if self._in_document_id_order():
+            page = self._document_id_range()
+            if project and self._projection is not None:
+                return self._apply_projection(page)
+            return page
 
-        if self.orders:
-            for key, direction in self.orders:
-                doc_snapshots = sorted(
-                    doc_snapshots,
-                    key=lambda doc: doc.to_dict()[key],  # type: ignore[index]
-                    reverse=direction == "DESCENDING",
-                )
-        if self._start_at:
+        orders = self._orders()
+        positions = self._positions(orders)
+        candidates, ordered = _candidates(self.parent, self._field_filters, orders, positions)
+        return self._pipeline(candidates, ordered, orders, positions, project)
+
+    def get(self, timeout: Optional[float] = None) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+    def _cached(
+        self, cache: QueryCache, paths: Tuple[Path, ...], version: int
+    ) -> Iterator[FakeDocumentSnapshot]:
+        """Answer the query from ``cache``, running it and caching its results on a miss.
+
+        ``paths`` are the collections the query reads, and ``version`` their
+        write version. Each call returns new snapshots, which share the
+        cached stored values until they are copied.
+        """
+        key = self._fingerprint(paths)
+        if key is None:
+            return self._stream()
+        results = cache.get(key, version)
+        if results is None:
+            doc_snapshots = list(self._stream())
+            results = [(doc.reference, doc._data, doc._version) for doc in doc_snapshots]
+            cache.put(key, version, results)
+            return iter(doc_snapshots)
+        return (
+            FakeDocumentSnapshot(reference, data, doc_version)
+            for reference, data, doc_version in results
+        )
+
+    def _fingerprint(self, paths: Tuple[Path, ...]) -> Optional[Hashable]:
+        """Hashable key identifying the query's results; None if a value cannot be hashed."""
+        orders = self._orders()
+        try:
+            return (
+                type(self),
+                paths,
+                tuple(
+                    (field, op, _fingerprint(value)) for field, op, _, value in self._field_filters
+                ),
+                tuple(self.orders),
+                _cursor_fingerprint(self._start_at, orders),
+                _cursor_fingerprint(self._end_at, orders),
+                self._limit,
+                self._offset,
+                None if self._projection is None else tuple(self._projection),
+            )
+        except TypeError:
+            return None
+
+    def _pipeline(
+        self,
+        candidates: Iterator[FakeDocumentSnapshot],
+        ordered: bool,
+        orders: Sequence[Tuple[str, Optional[str]]],
+        positions: Positions = (None, None),
+        project: bool = True,
+    ) -> Iterator[FakeDocumentSnapshot]:
+        """Chain the stages that follow the candidate scan: filters, ordering,
+        cursors, offset, limit and, unless ``project`` is false, projection.
+
+        Every stage but sorting is a generator, so results that are already
+        in order are read only as far as the caller consumes them, and a
+        ``limit`` stops the scan once it is met. Cursors at ``positions``
+        compare sort keys, as in Firestore; the others, on unordered
+        queries, look for the document they name.
+        """
+        doc_snapshots: Iterator[FakeDocumentSnapshot] = candidates
+
+        lower, upper = (_bound(position, orders) for position in positions)
+        if orders and not ordered:
+            doc_snapshots = iter(_sorted(doc_snapshots, orders, self._top(), lower, upper))
+        elif lower is not None or upper is not None:
+            doc_snapshots = _between(doc_snapshots, orders, lower, upper)
+
+        start_position, end_position = positions
+        if self._start_at and start_position is None:
             document_fields_or_snapshot, before = self._start_at
-            result = self._apply_cursor(document_fields_or_snapshot, doc_snapshots, before, True)
-            if result is not None:
-                doc_snapshots = result
+            doc_snapshots = self._apply_cursor(
+                document_fields_or_snapshot, doc_snapshots, before, True
+            )
 
-        if self._end_at:
+        if self._end_at and end_position is None:
             document_fields_or_snapshot, before = self._end_at
-            result = self._apply_cursor(document_fields_or_snapshot, doc_snapshots, before, False)
-            if result is not None:
-                doc_snapshots = result
+            doc_snapshots = self._apply_cursor(
+                document_fields_or_snapshot, doc_snapshots, before, False
+            )
 
         if self._offset:
             doc_snapshots = islice(doc_snapshots, self._offset, None)
@@ -85,33 +711,165 @@ class FakeQuery:
         if self._limit:
             doc_snapshots = islice(doc_snapshots, self._limit)
 
-        if self._projection is not None:
+        if project and self._projection is not None:
             doc_snapshots = self._apply_projection(doc_snapshots)
 
-        return iter(doc_snapshots)
+        return doc_snapshots
 
-    def get(self, timeout: Optional[float] = None) -> List[FakeDocumentSnapshot]:
-        return list(self.stream())
+    def _sources(self) -> List[FakeCollectionReference]:
+        """The collections the query reads."""
+        return [self.parent]
+
+    def _stored(self) -> Iterator[StoredDocument]:
+        """Stored fields of the query's results, ignoring ``select()``, for aggregations.
+
+        Unless the results have to be put in order first, to apply cursors
+        or an offset or limit to an ordered query, the fields are read
+        straight from the candidate scan, without building snapshots.
+        """
+        orders = self._orders()
+        if self._start_at or self._end_at or (orders and (self._limit or self._offset)):
+            return (doc._data for doc in self._stream(project=False) if doc._data is not None)
+        predicates = [predicate for _, _, predicate, _ in self._field_filters]
+        predicates += [_has_field(field) for field, _ in orders]
+        stored: Iterator[StoredDocument] = chain.from_iterable(
+            _scan_fields(
+                collection, _candidate_ids(collection, self._field_filters, orders)[0], predicates
+            )
+            for collection in self._sources()
+        )
+        if self._offset or self._limit:
+            stop = self._limit + (self._offset or 0) if self._limit else None
+            stored = islice(stored, self._offset or 0, stop)
+        return stored
+
+    def _filtered_ids(self, collection: FakeCollectionReference) -> Optional[List[str]]:
+        """IDs of the collection's documents that pass the filters, for ``find_nearest()``.
+
+        None when the query has no filters.
+        """
+        if not self._field_filters:
+            return None
+        predicates = [predicate for _, _, predicate, _ in self._field_filters]
+        store = collection._store
+        key = collection._key
+        document_ids = []
+        for document_id in _candidate_ids(collection, self._field_filters)[0]:
+            fields = store.get(key + (document_id,))
+            if fields is not None and all(predicate(fields) for predicate in predicates):
+                document_ids.append(document_id)
+        return document_ids
+
+    def _count(self) -> int:
+        """Number of results; a query without filters, orders or cursors counts the ID indexes."""
+        if self._field_filters or self.orders or self._start_at or self._end_at:
+            return sum(1 for _ in self._stored())
+        total = sum(len(c._store.document_ids(c._key)) for c in self._sources())
+        total = max(total - (self._offset or 0), 0)
+        return min(total, self._limit) if self._limit else total
+
+    def _orders(self) -> List[Tuple[str, Optional[str]]]:
+        """The query's ``order_by`` fields or, without any, its range-filtered fields.
+
+        Firestore orders the results of range filters by the filtered fields.
+        """
+        if self.orders:
+            return self.orders
+        ranged = sorted({field for field, op, _, _ in self._field_filters if op in _RANGE_OPS})
+        return [(field, "ASCENDING") for field in ranged]
+
+    def _positions(self, orders: Sequence[Tuple[str, Optional[str]]]) -> Positions:
+        return _position(self._start_at, orders), _position(self._end_at, orders)
+
+    def _top(self) -> Optional[int]:
+        """How many of the sorted results the query can return, if it can tell before sorting."""
+        if not self._limit or self._start_at or self._end_at:
+            return None
+        return self._limit + (self._offset or 0)
+
+    def _in_document_id_order(self) -> bool:
+        """Whether results are the collection's documents in ID order, bounded by ID cursors."""
+        if self._field_filters or self.orders:
+            return False
+        return all(
+            cursor is None or isinstance(cursor[0], FakeDocumentSnapshot)
+            for cursor in (self._start_at, self._end_at)
+        )
+
+    def _document_id_range(self) -> Iterator[FakeDocumentSnapshot]:
+        """Answer an unfiltered query with a bisect and a slice of the sorted ID index.
+
+        Snapshots are read as the slice is consumed, from a fork of the
+        index, so callers may write to the collection while iterating.
+        """
+        ids = self.parent._store.document_ids(self.parent._key).fork()
+        start, end = 0, len(ids)
+        if self._start_at:
+            cursor, before = self._start_at
+            start = (ids.bisect_left if before else ids.bisect_right)(cursor.id)  # type: ignore[union-attr]
+        if self._end_at:
+            cursor, before = self._end_at
+            end = (ids.bisect_right if before else ids.bisect_left)(cursor.id)  # type: ignore[union-attr]
+        if self._offset:
+            start += self._offset
+        if self._limit:
+            end = min(end, start + self._limit)
+        return (self.parent._snapshot(document_id) for document_id in ids.islice(start, end))
 
     def select(self, field_paths: Sequence[str]) -> FakeQuery:
         self._projection = list(field_paths)
         return self
 
+    def count(self, alias: Optional[str] = None) -> FakeAggregationQuery:
+        return self._aggregation_class(self).count(alias)
+
+    def sum(self, field_ref: str, alias: Optional[str] = None) -> FakeAggregationQuery:
+        return self._aggregation_class(self).sum(field_ref, alias)
+
+    def avg(self, field_ref: str, alias: Optional[str] = None) -> FakeAggregationQuery:
+        return self._aggregation_class(self).avg(field_ref, alias)
+
+    def find_nearest(
+        self,
+        vector_field: str,
+        query_vector: Sequence[float],
+        limit: int,
+        distance_measure: Any,
+        *,
+        distance_result_field: Optional[str] = None,
+        distance_threshold: Optional[float] = None,
+    ) -> FakeVectorQuery:
+        return self._vector_query_class(
+            self,
+            vector_field,
+            query_vector,
+            limit,
+            distance_measure,
+            distance_result_field,
+            distance_threshold,
+        )
+
     def _apply_projection(
         self, doc_snapshots: Iterable[FakeDocumentSnapshot]
     ) -> Iterator[FakeDocumentSnapshot]:
-        fields = self._projection or []
+        """Keep only the selected fields, read from the stored documents without copying them."""
+        paths = projection_paths(self._projection or [])
         for snap in doc_snapshots:
-            data = snap.to_dict()
-            if data is None:
+            if snap._data is None:
                 yield snap
-            else:
-                projected = {k: v for k, v in data.items() if k in fields}
-                yield FakeDocumentSnapshot(snap.reference, projected)
+                continue
+            projected = project(snap._data, paths)
+            if isinstance(snap._data, MappingProxyType):
+                projected = freeze(projected)
+            yield FakeDocumentSnapshot(snap.reference, projected, snap._version)
 
     def _add_field_filter(self, field: str, op: str, value: Any) -> None:
-        compare = self._compare_func(op)
-        self._field_filters.append((field, compare, value))
+        self._field_filters.append((field, op, _predicate(field, op, value), value))
+
+    def _add_filter(self, filter: Any) -> None:
+        """Add a ``FieldFilter``, ``And`` or ``Or`` filter from the real SDK."""
+        for field, op, value in _conjunction(filter):
+            self._add_field_filter(field, op, value)
 
     def where(
         self,
@@ -122,10 +880,9 @@ class FakeQuery:
         filter: Any = None,
     ) -> FakeQuery:
         if filter is not None:
-            field = filter.field_path
-            op = filter.op_string
-            value = filter.value
-        self._add_field_filter(field, op, value)
+            self._add_filter(filter)
+        else:
+            self._add_field_filter(field, op, value)
         return self
 
     def order_by(self, key: str, direction: Optional[str] = "ASCENDING") -> FakeQuery:
@@ -167,55 +924,25 @@ class FakeQuery:
     def _apply_cursor(
         self,
         document_fields_or_snapshot: Union[Dict[str, Any], FakeDocumentSnapshot],
-        doc_snapshots: Iterable[FakeDocumentSnapshot],
+        doc_snapshots: Iterator[FakeDocumentSnapshot],
         before: bool,
         start: bool,
-    ) -> Optional[Iterator[FakeDocumentSnapshot]]:
-        docs, doc_snapshot_iter = tee(doc_snapshots)
-        for idx, doc in enumerate(doc_snapshot_iter):
-            index: Optional[int] = None
-            if isinstance(document_fields_or_snapshot, dict):
-                for k, v in document_fields_or_snapshot.items():
-                    if doc.to_dict().get(k, None) == v:  # type: ignore[union-attr]
-                        index = idx
-                    else:
-                        index = None
-                        break
-            elif isinstance(document_fields_or_snapshot, FakeDocumentSnapshot):
-                if doc.id == document_fields_or_snapshot.id:
-                    index = idx
-            if index is not None:
-                if before and start:
-                    return islice(docs, index, None)
-                elif not before and start:
-                    return islice(docs, index + 1, None)
-                elif before and not start:
-                    return islice(docs, 0, index + 1)
-                elif not before and not start:
-                    return islice(docs, 0, index)
-        return None
+    ) -> Iterator[FakeDocumentSnapshot]:
+        """Skip the results before a start cursor, or stop at an end cursor.
 
-    def _compare_func(self, op: str) -> Callable[[Any, Any], bool]:
-        if op == "==":
-            return lambda x, y: x == y
-        elif op == "!=":
-            return lambda x, y: x != y
-        elif op == "<":
-            return lambda x, y: x < y
-        elif op == "<=":
-            return lambda x, y: x <= y
-        elif op == ">":
-            return lambda x, y: x > y
-        elif op == ">=":
-            return lambda x, y: x >= y
-        elif op == "in":
-            return lambda x, y: x in y
-        elif op == "array_contains":
-            return lambda x, y: x is not None and y in x
-        elif op == "array_contains_any":
-            return lambda x, y: x is not None and any(val in y for val in x)
-        else:
-            raise ValueError(f"Unknown operator: {op}")
+        Both pass results through as they come. A start cursor that matches
+        no document leaves no results; an end cursor that matches none
+        leaves all of them.
+        """
+        for doc in doc_snapshots:
+            if _at_cursor(document_fields_or_snapshot, doc):
+                if before:
+                    yield doc
+                if start:
+                    yield from doc_snapshots
+                return
+            if not start:
+                yield doc
 
 
 class FakeCollectionGroup(FakeQuery):
@@ -246,53 +973,49 @@ class FakeCollectionGroup(FakeQuery):
             for field_filter in field_filters:
                 self._add_field_filter(*field_filter)
 
-    def _get_all_snapshots(self) -> Iterator[FakeDocumentSnapshot]:
-        """Iterate over all documents from all collections."""
-        for collection in self._collections:
-            yield from collection.stream()
+    def _get_all_snapshots(
+        self,
+        orders: Sequence[Tuple[str, Optional[str]]] = (),
+        positions: Positions = (None, None),
+    ) -> Tuple[Iterator[FakeDocumentSnapshot], bool]:
+        """Iterate over the candidate documents of all collections.
+
+        When every collection gives its candidates in ``orders``, they are
+        merged lazily, so that a ``limit`` reads only the first few of each.
+        Also returns whether the snapshots follow ``orders``.
+        """
+        runs = [
+            _candidates(collection, self._field_filters, orders, positions)
+            for collection in self._collections
+        ]
+        if not orders or not all(ordered for _, ordered in runs):
+            return chain.from_iterable(snapshots for snapshots, _ in runs), False
+        paths = _order_paths(orders)
+        merged = heapq.merge(
+            *(snapshots for snapshots, _ in runs),
+            key=lambda doc: order_key(doc._data or {}, paths, doc.reference._key) or (),
+        )
+        return merged, True
 
     def stream(
         self, transaction: Any = None, timeout: Optional[float] = None
     ) -> Iterator[FakeDocumentSnapshot]:
-        doc_snapshots: Iterable[FakeDocumentSnapshot] = list(self._get_all_snapshots())
-
-        for field, compare, value in self._field_filters:
-            doc_snapshots = [
-                doc_snapshot
-                for doc_snapshot in doc_snapshots
-                if compare(doc_snapshot._get_by_field_path(field), value)
-            ]
-
-        if self.orders:
-            for key, direction in self.orders:
-                doc_snapshots = sorted(
-                    doc_snapshots,
-                    key=lambda doc: doc.to_dict()[key],  # type: ignore[index]
-                    reverse=direction == "DESCENDING",
-                )
+        if self._collections:
+            store = self._collections[0]._store
+            if store.query_cache is not None:
+                version = store.group_version(self._collections[0].id)
+                paths = tuple(collection._key for collection in self._collections)
+                return self._cached(store.query_cache, paths, version)
+        return self._stream()
 
-        if self._start_at:
-            document_fields_or_snapshot, before = self._start_at
-            result = self._apply_cursor(document_fields_or_snapshot, doc_snapshots, before, True)
-            if result is not None:
-                doc_snapshots = result
+    def _stream(self, project: bool = True) -> Iterator[FakeDocumentSnapshot]:
+        orders = self._orders()
+        positions = self._positions(orders)
+        candidates, ordered = self._get_all_snapshots(orders, positions)
+        return self._pipeline(candidates, ordered, orders, positions, project)
 
-        if self._end_at:
-            document_fields_or_snapshot, before = self._end_at
-            result = self._apply_cursor(document_fields_or_snapshot, doc_snapshots, before, False)
-            if result is not None:
-                doc_snapshots = result
-
-        if self._offset:
-            doc_snapshots = islice(doc_snapshots, self._offset, None)
-
-        if self._limit:
-            doc_snapshots = islice(doc_snapshots, self._limit)
-
-        if self._projection is not None:
-            doc_snapshots = self._apply_projection(doc_snapshots)
-
-        return iter(doc_snapshots)
+    def _sources(self) -> List[FakeCollectionReference]:
+        return self._collections
 
     def select(self, field_paths: Sequence[str]) -> FakeCollectionGroup:
         self._projection = list(field_paths)
@@ -307,10 +1030,9 @@ class FakeCollectionGroup(FakeQuery):
         filter: Any = None,
     ) -> FakeCollectionGroup:
         if filter is not None:
-            field = filter.field_path
-            op = filter.op_string
-            value = filter.value
-        self._add_field_filter(field, op, value)
+            self._add_filter(filter)
+        else:
+            self._add_field_filter(field, op, value)
         return self
 
     def order_by(self, key: str, direction: Optional[str] = "ASCENDING") -> FakeCollectionGroup:
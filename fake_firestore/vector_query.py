@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional, Sequence, Tuple
+
+from fake_firestore._helpers import freeze
+from fake_firestore._vector import DistanceMeasure, VectorIndex, require_numpy
+from fake_firestore.document import FakeDocumentSnapshot
+
+if TYPE_CHECKING:
+    from fake_firestore.collection import FakeCollectionReference
+    from fake_firestore.query import FakeQuery
+
+
+def _measure(distance_measure: Any) -> DistanceMeasure:
+    """The ``DistanceMeasure`` of an SDK enum member, its value or its name."""
+    if isinstance(distance_measure, str):
+        return DistanceMeasure[distance_measure.upper()]
+    return DistanceMeasure(getattr(distance_measure, "value", distance_measure))
+
+
+class FakeVectorQuery:
+    """The documents nearest to a query vector, among the results of a query.
+
+    The query's filters are applied first, as a pre-filter; the distances
+    are then computed from each collection's ``VectorIndex`` on
+    ``vector_field``, which keeps the field's vectors as the rows of a NumPy
+    matrix. Documents whose field is not a vector of the query vector's
+    dimension are left out, as in Firestore. Results are nearest first;
+    for ``DOT_PRODUCT``, that is the largest product first.
+    """
+
+    def __init__(
+        self,
+        nested_query: FakeQuery,
+        vector_field: str,
+        query_vector: Sequence[float],
+        limit: int,
+        distance_measure: Any,
+        distance_result_field: Optional[str] = None,
+        distance_threshold: Optional[float] = None,
+    ) -> None:
+        require_numpy()
+        self._nested_query = nested_query
+        self._vector_field = vector_field
+        self._query_vector = query_vector
+        self._limit = limit
+        self._distance_measure = _measure(distance_measure)
+        self._distance_result_field = distance_result_field
+        self._distance_threshold = distance_threshold
+
+    def get(
+        self, transaction: Any = None, timeout: Optional[float] = None
+    ) -> List[FakeDocumentSnapshot]:
+        return list(self.stream())
+
+    def stream(
+        self, transaction: Any = None, timeout: Optional[float] = None
+    ) -> Iterator[FakeDocumentSnapshot]:
+        for distance, collection, document_id in self._nearest():
+            store = collection._store
+            fields, version = store.read(collection._key + (document_id,))
+            if fields is None:
+                continue
+            if self._distance_result_field is not None:
+                data = dict(fields)
+                data[self._distance_result_field] = distance
+                if isinstance(fields, MappingProxyType):
+                    fields = freeze(data)
+                else:
+                    fields = data
+            yield FakeDocumentSnapshot(collection.document(document_id), fields, version)
+
+    def _nearest(self) -> List[Tuple[float, FakeCollectionReference, str]]:
+        """The ``limit`` nearest documents of all the query's collections, with their distance."""
+        query = self._nested_query
+        measure = self._distance_measure
+        sign = -1.0 if measure == DistanceMeasure.DOT_PRODUCT else 1.0
+        found: List[Tuple[float, str, float, FakeCollectionReference, str]] = []
+        for collection in query._sources():
+            store = collection._store
+            index = store.field_index(collection._key, VectorIndex, self._vector_field)
+            if index is None:
+                continue
+            nearest = index.nearest(
+                self._query_vector,
+                self._limit,
+                measure,
+                query._filtered_ids(collection),
+                self._distance_threshold,
+                store.vector_probes,
+            )
+            path = "/".join(collection._key)
+            found.extend(
+                (sign * distance, f"{path}/{document_id}", distance, collection, document_id)
+                for distance, document_id in nearest
+            )
+        found.sort(key=lambda entry: entry[:2])
+        del found[self._limit :]
+        return [(distance, c, document_id) for _, _, distance, c, document_id in found]
+
+
+# Alias matching the class name in the real SDK
+VectorQuery = FakeVectorQuery
@@ -1,4 +1,7 @@
 import pytest
+from google.cloud.firestore_v1.base_query import FieldFilter, Or
+from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
+from google.cloud.firestore_v1.vector import Vector
 
 from fake_firestore import (
     AlreadyExists,
@@ -176,3 +179,52 @@ async def test_select(fs):
     await fs.collection("foo").document("first").set({"name": "Alice", "age": 30, "city": "Kyiv"})
     docs = [doc async for doc in fs.collection("foo").select(["name", "age"]).stream()]
     assert docs[0].to_dict() == {"name": "Alice", "age": 30}
+
+
+@pytest.mark.asyncio
+async def test_aggregation(fs):
+    await fs.collection("foo").document("first").set({"n": 1})
+    await fs.collection("foo").document("second").set({"n": 2})
+    results = await fs.collection("foo").count().sum("n").avg("n").get(timeout=5.0)
+    assert [result.value for result in results[0]] == [2, 3, 1.5]
+
+    query = fs.collection("foo").where("n", ">", 1).count(alias="big")
+    batches = [batch async for batch in query.stream(timeout=5.0)]
+    assert [(result.alias, result.value) for result in batches[0]] == [("big", 1)]
+
+    results = await fs.collection_group("foo").avg("n").get()
+    assert results[0][0].value == 1.5
+
+
+@pytest.mark.asyncio
+async def test_where_or_filter(fs):
+    await fs.collection("foo").document("first").set({"a": 1})
+    await fs.collection("foo").document("second").set({"a": 2})
+    await fs.collection("foo").document("third").set({"a": 3})
+    either = Or([FieldFilter("a", "==", 1), FieldFilter("a", "==", 3)])
+    docs = [doc async for doc in fs.collection("foo").where(filter=either).stream()]
+    assert [doc.id for doc in docs] == ["first", "third"]
+
+
+@pytest.mark.asyncio
+async def test_find_nearest(fs):
+    pytest.importorskip("numpy")
+    await fs.collection("foo").document("near").set({"embedding": Vector([1.0, 1.0]), "n": 1})
+    await fs.collection("foo").document("far").set({"embedding": Vector([5.0, 5.0]), "n": 2})
+    query = fs.collection("foo").find_nearest(
+        "embedding",
+        Vector([0.0, 0.0]),
+        limit=2,
+        distance_measure=DistanceMeasure.EUCLIDEAN,
+        distance_result_field="distance",
+    )
+    docs = await query.get(timeout=5.0)
+    assert [doc.id for doc in docs] == ["near", "far"]
+    assert docs[0].to_dict()["distance"] == pytest.approx(2**0.5)
+
+    query = (
+        fs.collection("foo")
+        .where("n", ">", 1)
+        .find_nearest("embedding", Vector([1.0, 0.0]), 2, DistanceMeasure.COSINE)
+    )
+    assert [doc.id async for doc in query.stream(timeout=5.0)] == ["far"]
@@ -1,6 +1,11 @@
-from unittest import TestCase
+from datetime import datetime, timezone
+from importlib.util import find_spec
+from unittest import TestCase, skipUnless
 
-from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import And, FieldFilter, Or
+from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
+from google.cloud.firestore_v1.vector import Vector
 
 from fake_firestore import AlreadyExists, DocumentReference, DocumentSnapshot, MockFirestore
 
@@ -136,6 +141,33 @@ class TestCollectionReference(TestCase):
         self.assertEqual({"field": "a1"}, docs[0].to_dict())
         self.assertEqual({"field": "a3"}, docs[1].to_dict())
 
+    def test_collection_whereNotIn(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("first").set({"field": "a1"})
+        fs.collection("foo").document("second").set({"field": ["a2"]})
+        fs.collection("foo").document("third").set({"field": "a3"})
+        fs.collection("foo").document("fourth").set({"other": "a4"})
+
+        docs = list(fs.collection("foo").where("field", "not-in", ["a1", ["a2"]]).stream())
+        self.assertEqual(["third"], [doc.id for doc in docs])
+
+    def test_collection_whereIn_unhashableValues(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("first").set({"field": {"a": 1}})
+        fs.collection("foo").document("second").set({"field": [1, 2]})
+        fs.collection("foo").document("third").set({"field": 1})
+
+        docs = fs.collection("foo").where("field", "!=", None).where("field", "in", [[1, 2], 1])
+        self.assertEqual(["second", "third"], [doc.id for doc in docs.stream()])
+
+    def test_collection_whereNestedField_throughNonMap(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("first").set({"nested": "text"})
+        fs.collection("foo").document("second").set({"nested": {"a": 1}})
+
+        docs = list(fs.collection("foo").where("nested.a", "!=", 2).stream())
+        self.assertEqual(["first", "second"], [doc.id for doc in docs])
+
     def test_collection_whereFieldFilter(self):
         fs = MockFirestore()
         fs.collection("foo").document("first").set({"field": "a1"})
@@ -160,6 +192,38 @@ class TestCollectionReference(TestCase):
         self.assertEqual(len(docs), 1)
         self.assertEqual(docs[0].to_dict()["score"], 20)
 
+    def test_collection_whereOrFilter(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("first").set({"a": 1, "b": 1, "tags": ["x"]})
+        fs.collection("foo").document("second").set({"a": 2, "b": 2})
+        fs.collection("foo").document("third").set({"a": 3, "b": 1, "tags": ["y"]})
+        fs.collection("foo").document("fourth").set({"a": 4})
+
+        either = Or([FieldFilter("a", "==", 2), FieldFilter("b", "==", 1)])
+        docs = fs.collection("foo").where(filter=either).get()
+        self.assertEqual(["first", "second", "third"], [doc.id for doc in docs])
+
+        # Branches without an index lookup are tested on every document.
+        either = Or([FieldFilter("a", ">", 3), FieldFilter("tags", "array_contains", "y")])
+        docs = fs.collection("foo").where(filter=either).get()
+        self.assertEqual(["fourth", "third"], [doc.id for doc in docs])
+
+        docs = fs.collection("foo").where(filter=Or([FieldFilter("a", "==", 5)])).get()
+        self.assertEqual([], docs)
+
+    def test_collection_whereNestedCompositeFilters(self):
+        fs = MockFirestore()
+        for i in range(12):
+            fs.collection("foo").document(f"d{i:02d}").set({"a": i % 3, "b": i % 4, "c": i})
+
+        both = And([FieldFilter("a", "==", 1), FieldFilter("b", "==", 1)])
+        nested = And([Or([FieldFilter("a", "==", 0), both]), FieldFilter("c", "!=", 3)])
+        docs = fs.collection("foo").where(filter=nested).where("b", "in", [0, 1]).get()
+        self.assertEqual(["d00", "d01", "d09"], [doc.id for doc in docs])
+
+        group = fs.collection_group("foo").where(filter=nested).get()
+        self.assertEqual(["d00", "d01", "d06", "d09"], [doc.id for doc in group])
+
     def test_collection_whereArrayContains(self):
         fs = MockFirestore()
         fs.collection("foo").document("first").set({"field": ["val4"]})
@@ -412,6 +476,270 @@ class TestCollectionReference(TestCase):
         self.assertEqual({"order": 1}, docs[0].to_dict())
         self.assertEqual({"order": 2}, docs[1].to_dict())
 
+    def test_collection_paginateByDocumentId(self):
+        fs = MockFirestore()
+        for i in range(10):
+            fs.collection("foo").document(f"doc_{i}").set({"n": i})
+
+        pages = []
+        query = fs.collection("foo").limit(4)
+        while True:
+            page = query.get()
+            if not page:
+                break
+            pages.append([doc.id for doc in page])
+            query = fs.collection("foo").start_after(page[-1]).limit(4)
+
+        self.assertEqual(
+            [
+                ["doc_0", "doc_1", "doc_2", "doc_3"],
+                ["doc_4", "doc_5", "doc_6", "doc_7"],
+                ["doc_8", "doc_9"],
+            ],
+            pages,
+        )
+
+    def test_collection_paginateByValueWithTies(self):
+        fs = MockFirestore()
+        for i in range(10):
+            fs.collection("foo").document(f"doc_{i}").set({"n": i % 3})
+
+        for direction in ("ASCENDING", "DESCENDING"):
+            ordered = fs.collection("foo").order_by("n", direction=direction)
+            expected = [doc.id for doc in ordered.get()]
+            seen = []
+            page = ordered.limit(4).get()
+            while page:
+                seen.extend(doc.id for doc in page)
+                page = ordered.start_after(page[-1]).limit(4).get()
+            self.assertEqual(expected, seen)
+
+    def test_collection_cursorValues_positionBetweenDocuments(self):
+        fs = MockFirestore()
+        for doc_id, n in (("a", 1), ("b", 2), ("c", 2), ("d", 3)):
+            fs.collection("foo").document(doc_id).set({"n": n})
+        b = fs.collection("foo").document("b").get()
+
+        def ordered(direction="ASCENDING"):
+            return fs.collection("foo").order_by("n", direction)
+
+        def run(query):
+            return [doc.id for doc in query.stream()]
+
+        self.assertEqual(["b", "c", "d"], run(ordered().start_at({"n": 1.5})))
+        self.assertEqual(["a", "b", "c"], run(ordered().end_at({"n": 2})))
+        self.assertEqual(["a"], run(ordered().end_before({"n": 2})))
+        self.assertEqual(["c", "d"], run(ordered().start_after(b)))
+        self.assertEqual(["d", "c"], run(ordered("DESCENDING").start_at({"n": 3}).end_before(b)))
+
+    def test_collection_whereEquals_followsWrites(self):
+        fs = MockFirestore()
+        users = fs.collection("users")
+        users.document("a").set({"tenant": "t1", "n": 1})
+        users.document("b").set({"tenant": "t2", "n": 1})
+        users.document("c").set({"tenant": "t1", "n": 2})
+
+        def ids(*where):
+            return [doc.id for doc in users.where(*where).stream()]
+
+        self.assertEqual(["a", "c"], ids("tenant", "==", "t1"))
+
+        users.document("b").update({"tenant": "t1"})
+        users.document("a").update({"n": firestore.Increment(1)})
+        users.document("c").delete()
+        users.document("d").set({"tenant": ["t1"], "n": 2})
+
+        self.assertEqual(["a", "b"], ids("tenant", "==", "t1"))
+        self.assertEqual(["a", "d"], ids("n", "==", 2))
+        self.assertEqual(["d"], ids("tenant", "==", ["t1"]))
+        self.assertEqual(["a", "b", "d"], ids("tenant", "in", ["t1", ["t1"]]))
+        self.assertEqual(["b"], ids("n", "in", [1, 3]))
+
+    def test_collection_whereEquals_combinesWithOtherFilters(self):
+        fs = MockFirestore()
+        for i in range(20):
+            fs.collection("foo").document(f"doc_{i:02d}").set({"even": i % 2 == 0, "n": i})
+
+        docs = (
+            fs.collection("foo")
+            .where("even", "==", True)
+            .where("n", ">", 10)
+            .where("n", "in", [11, 12, 14, 99])
+            .get()
+        )
+
+        self.assertEqual(["doc_12", "doc_14"], [doc.id for doc in docs])
+
+    def test_collection_whereEquals_severalFields(self):
+        fs = MockFirestore()
+        for i in range(3000):
+            fs.collection("foo").document(f"d{i:04d}").set(
+                {"a": i % 2, "b": i % 3, "c": i % 500, "tags": [i % 7]}
+            )
+
+        def ids(query):
+            return [doc.id for doc in query.stream()]
+
+        foo = fs.collection("foo")
+        self.assertEqual(
+            ["d0005", "d1505"], ids(foo.where("a", "==", 1).where("b", "==", 2).where("c", "==", 5))
+        )
+        self.assertEqual(
+            ["d0005", "d2007"], ids(foo.where("c", "in", [5, 7]).where("tags", "array_contains", 5))
+        )
+        self.assertEqual([], ids(foo.where("a", "==", 0).where("c", "==", 5)))
+        self.assertEqual(500, len(foo.where("a", "==", 1).where("b", "==", 0).get()))
+
+        fs.collection("foo").document("d1505").update({"b": 0})
+        fs.collection("foo").document("d0007").update({"b": 2, "c": 5})
+        query = foo.where("c", "==", 5).where("b", "==", 2).where("a", "==", 1)
+        self.assertEqual(["d0005", "d0007"], ids(query))
+
+    def test_collection_whereArrayContains_followsWrites(self):
+        fs = MockFirestore()
+        posts = fs.collection("posts")
+        posts.document("a").set({"labels": ["x", "y", "x"]})
+        posts.document("b").set({"labels": ["y", {"k": 1}]})
+        posts.document("c").set({"labels": "xy"})
+
+        def ids(op, value):
+            return [doc.id for doc in posts.where("labels", op, value).stream()]
+
+        self.assertEqual(["a"], ids("array_contains", "x"))
+        self.assertEqual(["b"], ids("array_contains", {"k": 1}))
+        self.assertEqual(["a", "b"], ids("array_contains_any", ["x", "y"]))
+
+        posts.document("a").update({"labels": ["y"]})
+        posts.document("b").delete()
+        posts.document("d").set({"labels": ["z", "x"]})
+
+        self.assertEqual(["d"], ids("array_contains", "x"))
+        self.assertEqual(["a", "d"], ids("array_contains_any", ["y", "z", "w"]))
+
+    def test_collection_whereRange_orderByLimit_followsWrites(self):
+        fs = MockFirestore()
+        events = fs.collection("events")
+        for i in range(10):
+            events.document(f"e{i}").set({"ts": 10 - i})
+
+        def ids(direction="ASCENDING"):
+            query = events.where("ts", ">=", 3).where("ts", "<", 8).order_by("ts", direction)
+            return [doc.id for doc in query.limit(3).stream()]
+
+        self.assertEqual(["e7", "e6", "e5"], ids())
+        self.assertEqual(["e3", "e4", "e5"], ids("DESCENDING"))
+
+        events.document("e6").update({"ts": 20})
+        events.document("e7").delete()
+        events.document("x").set({"ts": 3})
+
+        self.assertEqual(["x", "e5", "e4"], ids())
+
+    def test_collection_whereLimit_stopsReadingAtTheLimit(self):
+        fs = MockFirestore()
+        for i in range(100):
+            fs.collection("foo").document(f"d{i:03}").set({"tag": "a" if i % 2 else "b"})
+
+        stream = fs.collection("foo").where("tag", "!=", "x").limit(2).stream()
+        first = next(stream)
+        for i in range(2, 100):
+            fs.collection("foo").document(f"d{i:03}").update({"tag": "x"})
+
+        self.assertEqual(["d000", "d001"], [first.id] + [doc.id for doc in stream])
+
+    def test_collection_startAt_endAt_streamLazily(self):
+        fs = MockFirestore()
+        for i in range(10):
+            fs.collection("foo").document(f"d{i}").set({"n": i})
+
+        query = fs.collection("foo").where("n", "!=", -1)
+        ids = [doc.id for doc in query.start_after({"n": 3}).end_before({"n": 6}).stream()]
+        self.assertEqual(["d4", "d5"], ids)
+        ids = [doc.id for doc in query.start_at({"n": 8}).end_at({"n": 42}).stream()]
+        self.assertEqual(["d8", "d9"], ids)
+        self.assertEqual([], list(query.start_at({"n": 42}).stream()))
+
+    def test_collection_whereRange_matchesValuesOfTheSameType(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("a").set({"v": 5})
+        fs.collection("foo").document("b").set({"v": "5"})
+        fs.collection("foo").document("c").set({"v": True})
+        fs.collection("foo").document("d").set({})
+
+        docs = fs.collection("foo").where("v", ">", 0).get()
+        self.assertEqual(["a"], [doc.id for doc in docs])
+        docs = fs.collection("foo").where("v", ">=", "").get()
+        self.assertEqual(["b"], [doc.id for doc in docs])
+
+    def test_collection_whereRange_comparesFirestoreValues(self):
+        for frozen in (False, True):
+            fs = MockFirestore(frozen=frozen)
+            foo = fs.collection("foo")
+            first = {"ts": datetime(2024, 1, 1), "meta": {"n": 1}, "tags": ["a", "b"]}
+            second = {"ts": datetime(2024, 6, 1, tzinfo=timezone.utc), "meta": {"n": 2}}
+            foo.document("a").set({"k": 1, **first})
+            foo.document("b").set({"k": 1, **second, "tags": ["c"]})
+
+            def ids(field, op, value):
+                # The == filter is looked up in its index; the range filter tests each match.
+                return [doc.id for doc in foo.where("k", "==", 1).where(field, op, value).get()]
+
+            self.assertEqual(["b"], ids("ts", ">", datetime(2024, 3, 1, tzinfo=timezone.utc)))
+            self.assertEqual(["a"], ids("ts", "<", datetime(2024, 3, 1)))
+            self.assertEqual(["b"], ids("meta", ">", {"n": 1}))
+            self.assertEqual(["a"], ids("tags", "<", ["b"]))
+            self.assertEqual(["a", "b"], ids("tags", ">=", ["a"]))
+
+    def test_collection_orderBy_mixedTypesAndMissingField(self):
+        fs = MockFirestore()
+        for doc_id, value in [("a", "x"), ("b", 2), ("c", None), ("d", 1.5), ("e", False)]:
+            fs.collection("foo").document(doc_id).set({"v": value})
+        fs.collection("foo").document("f").set({"other": 1})
+
+        docs = fs.collection("foo").order_by("v").get()
+        self.assertEqual(["c", "e", "d", "b", "a"], [doc.id for doc in docs])
+
+    def test_collection_orderBy_multipleFields(self):
+        fs = MockFirestore()
+        rows = [("a", "x", 2), ("b", "y", 1), ("c", "x", 1), ("d", "y", 2), ("e", "x", 1)]
+        for doc_id, group, rank in rows:
+            fs.collection("foo").document(doc_id).set({"group": group, "rank": rank})
+        fs.collection("foo").document("f").set({"group": "x"})
+
+        docs = fs.collection("foo").order_by("group").order_by("rank", direction="DESCENDING").get()
+        self.assertEqual(["a", "e", "c", "d", "b"], [doc.id for doc in docs])
+
+        docs = fs.collection("foo").where("group", "==", "x").where("rank", "<", 3).get()
+        self.assertEqual(["c", "e", "a"], [doc.id for doc in docs])
+
+    def test_collection_startAfter_deletedDocSnapshot(self):
+        fs = MockFirestore()
+        for doc_id in ("a", "b", "c", "d"):
+            fs.collection("foo").document(doc_id).set({"id": doc_id})
+        cursor = fs.collection("foo").document("b").get()
+        fs.collection("foo").document("b").delete()
+
+        docs = (
+            fs.collection("foo")
+            .start_after(cursor)
+            .end_before(fs.collection("foo").document("d").get())
+            .get()
+        )
+        self.assertEqual(["c"], [doc.id for doc in docs])
+
+    def test_collection_stream_deleteWhileIterating(self):
+        fs = MockFirestore()
+        for doc_id in ("a", "b", "c"):
+            fs.collection("foo").document(doc_id).set({"id": doc_id})
+
+        seen = []
+        for doc in fs.collection("foo").stream():
+            seen.append(doc.id)
+            doc.reference.delete()
+
+        self.assertEqual(["a", "b", "c"], seen)
+        self.assertEqual([], fs.collection("foo").get())
+
     def test_collection_listDocuments(self):
         fs = MockFirestore()
         fs.collection("foo").document("first").set({"order": 2})
@@ -499,3 +827,176 @@ class TestCollectionReference(TestCase):
         self.assertEqual(2, len(docs))
         self.assertEqual({"name": "Alice"}, docs[0].to_dict())
         self.assertEqual({"name": "Bob"}, docs[1].to_dict())
+
+    def test_collection_select_nestedFieldPaths(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("first").set(
+            {"id": 1, "meta": {"a": 1, "b": {"c": 2, "d": 3}}, "blob": "x" * 1000}
+        )
+        fs.collection("foo").document("second").set({"id": 2, "meta": "flat"})
+
+        docs = fs.collection("foo").select(["id", "meta.b.c", "meta.a", "missing.x"]).get()
+        self.assertEqual({"id": 1, "meta": {"a": 1, "b": {"c": 2}}}, docs[0].to_dict())
+        self.assertEqual({"id": 2}, docs[1].to_dict())
+        self.assertEqual(2, docs[0].get("meta.b.c"))
+
+        docs = fs.collection("foo").select(["meta.b.c", "meta"]).get()
+        self.assertEqual({"meta": {"a": 1, "b": {"c": 2, "d": 3}}}, docs[0].to_dict())
+
+    def test_collection_select_doesNotShareStoredValues(self):
+        for frozen in (False, True):
+            fs = MockFirestore(frozen=frozen)
+            fs.collection("foo").document("first").set({"meta": {"tags": ["a"]}})
+
+            doc = fs.collection("foo").select(["meta.tags"]).get()[0]
+            doc.to_dict()["meta"]["tags"].append("b")
+
+            stored = fs.collection("foo").document("first").get().to_dict()
+            self.assertEqual({"meta": {"tags": ["a"]}}, stored)
+
+    def test_collection_count(self):
+        fs = MockFirestore()
+        for i in range(5):
+            fs.collection("foo").document(f"d{i}").set({"n": i, "odd": i % 2 == 1})
+
+        self.assertEqual(5, fs.collection("foo").count().get()[0][0].value)
+        self.assertEqual(0, fs.collection("empty").count().get()[0][0].value)
+        self.assertEqual(2, fs.collection("foo").where("odd", "==", True).count().get()[0][0].value)
+        self.assertEqual(2, fs.collection("foo").limit(3).offset(3).count().get()[0][0].value)
+
+        fs.collection("foo").document("d0").delete()
+        result = fs.collection("foo").count(alias="total").get()[0][0]
+        self.assertEqual(("total", 4), (result.alias, result.value))
+
+    def test_collection_sumAndAvg(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("a").set({"n": 1, "x": 1.5, "meta": {"n": 2}})
+        fs.collection("foo").document("b").set({"n": 2, "x": 2})
+        fs.collection("foo").document("c").set({"n": "3", "x": True})
+        fs.collection("foo").document("d").set({"x": None})
+
+        query = fs.collection("foo").count().sum("n").avg("x", alias="avg_x").sum("meta.n")
+        results = query.get()
+        self.assertEqual(1, len(results))
+        self.assertEqual(
+            [("field_1", 4), ("field_2", 3), ("avg_x", 1.75), ("field_4", 2)],
+            [(result.alias, result.value) for result in results[0]],
+        )
+        self.assertIsInstance(results[0][1].value, int)
+        self.assertIsNone(fs.collection("foo").avg("missing").get()[0][0].value)
+        self.assertEqual(0, fs.collection("foo").sum("missing").get()[0][0].value)
+
+    def test_collection_aggregation_followsQuery(self):
+        fs = MockFirestore()
+        for i in range(6):
+            fs.collection("foo").document(f"d{i}").set({"n": i})
+        fs.collection("foo").document("none").set({"other": 1})
+
+        def value(aggregation_query):
+            return aggregation_query.get()[0][0].value
+
+        foo = fs.collection("foo")
+        self.assertEqual(6, value(foo.order_by("n").count()))
+        self.assertEqual(9, value(foo.order_by("n", direction="DESCENDING").limit(2).sum("n")))
+        self.assertEqual(3, value(foo.order_by("n").start_after({"n": 2}).count()))
+        self.assertEqual(12, value(foo.where("n", ">=", 3).sum("n")))
+        self.assertEqual(15, value(foo.select(["other"]).sum("n")))
+        results = list(foo.where("n", "<", 10).count().stream())
+        self.assertEqual([[6]], [[result.value for result in batch] for batch in results])
+
+    def test_collection_group_aggregation(self):
+        fs = MockFirestore()
+        fs.collection("a/x/items").document("1").set({"n": 1})
+        fs.collection("a/y/items").document("2").set({"n": 2})
+        fs.collection("items").document("3").set({"n": 3})
+
+        group = fs.collection_group
+        self.assertEqual(3, group("items").count().get()[0][0].value)
+        self.assertEqual(5, group("items").where("n", ">", 1).sum("n").get()[0][0].value)
+        self.assertEqual(1, group("items").limit(1).sum("n").get()[0][0].value)
+
+
+@skipUnless(find_spec("numpy"), "find_nearest() requires numpy")
+class TestFindNearest(TestCase):
+    def setUp(self):
+        self.fs = MockFirestore()
+        vectors = {"a": [1.0, 0.0], "b": [0.0, 2.0], "c": [3.0, 3.0], "d": [-1.0, 0.0]}
+        for document_id, vector in vectors.items():
+            self.fs.collection("foo").document(document_id).set(
+                {"embedding": Vector(vector), "even": document_id in ("b", "d")}
+            )
+        self.fs.collection("foo").document("none").set({"embedding": "not a vector"})
+        self.fs.collection("foo").document("wide").set({"embedding": Vector([1.0, 0.0, 0.0])})
+
+    def nearest(self, query, measure, limit=10, **kwargs):
+        vector_query = query.find_nearest("embedding", Vector([1.0, 0.0]), limit, measure, **kwargs)
+        return [doc.id for doc in vector_query.get()]
+
+    def test_findNearest_distanceMeasures(self):
+        foo = self.fs.collection("foo")
+        self.assertEqual(["a", "d", "b", "c"], self.nearest(foo, DistanceMeasure.EUCLIDEAN))
+        self.assertEqual(["a", "c", "b", "d"], self.nearest(foo, DistanceMeasure.COSINE))
+        self.assertEqual(["c", "a", "b", "d"], self.nearest(foo, DistanceMeasure.DOT_PRODUCT))
+        self.assertEqual(["a", "d"], self.nearest(foo, DistanceMeasure.EUCLIDEAN, limit=2))
+
+    def test_findNearest_distanceResultFieldAndThreshold(self):
+        vector_query = self.fs.collection("foo").find_nearest(
+            "embedding",
+            Vector([1.0, 0.0]),
+            limit=5,
+            distance_measure=DistanceMeasure.DOT_PRODUCT,
+            distance_result_field="score",
+            distance_threshold=0.0,
+        )
+        docs = vector_query.get()
+        scores = [(doc.id, doc.get("score")) for doc in docs]
+        self.assertEqual([("c", 3.0), ("a", 1.0), ("b", 0.0)], scores)
+        self.assertEqual(Vector([3.0, 3.0]), docs[0].to_dict()["embedding"])
+        self.assertNotIn("score", self.fs.collection("foo").document("c").get().to_dict())
+
+        foo = self.fs.collection("foo")
+        nearest = self.nearest(foo, DistanceMeasure.EUCLIDEAN, distance_threshold=2.5)
+        self.assertEqual(["a", "d", "b"], nearest)
+
+    def test_findNearest_preFilter(self):
+        even = self.fs.collection("foo").where("even", "==", True)
+        self.assertEqual(["d", "b"], self.nearest(even, DistanceMeasure.EUCLIDEAN))
+        self.assertEqual(["d"], self.nearest(even, DistanceMeasure.EUCLIDEAN, limit=1))
+
+    def test_findNearest_followsWrites(self):
+        foo = self.fs.collection("foo")
+        fork = self.fs.fork()
+        foo.document("e").set({"embedding": Vector([1.0, 0.5])})
+        foo.document("a").delete()
+        foo.document("b").update({"embedding": Vector([9.0, 9.0])})
+        self.assertEqual(["e", "d", "c", "b"], self.nearest(foo, DistanceMeasure.EUCLIDEAN))
+        forked = fork.collection("foo")
+        self.assertEqual(["a", "d", "b", "c"], self.nearest(forked, DistanceMeasure.EUCLIDEAN))
+
+    def test_findNearest_otherDimension(self):
+        vector_query = self.fs.collection("foo").find_nearest(
+            "embedding", Vector([1.0, 0.0, 0.0]), 5, DistanceMeasure.EUCLIDEAN
+        )
+        self.assertEqual(["wide"], [doc.id for doc in vector_query.get()])
+        self.assertEqual([], self.nearest(self.fs.collection("bar"), DistanceMeasure.COSINE))
+
+    def test_findNearest_collectionGroup(self):
+        self.fs.collection("foo/a/foo").document("x").set({"embedding": Vector([1.0, 0.1])})
+        group = self.fs.collection_group("foo")
+        self.assertEqual(["a", "x", "d"], self.nearest(group, DistanceMeasure.EUCLIDEAN, limit=3))
+
+    def test_findNearest_approximate(self):
+        fs = MockFirestore()
+        fs.enable_approximate_vector_search(min_vectors=100, probes=2)
+        for i in range(400):
+            center = (i % 4) * 10.0
+            vector = Vector([center + (i % 7) / 10, center - (i % 5) / 10])
+            fs.collection("points").document(f"p{i:03}").set({"embedding": vector})
+        query_vector = Vector([20.0, 20.0])
+        points = fs.collection("points")
+        exact = points.find_nearest("embedding", query_vector, 5, DistanceMeasure.EUCLIDEAN)
+        fs.disable_approximate_vector_search()
+        expected = [doc.id for doc in exact.get()]
+        fs.enable_approximate_vector_search(min_vectors=100, probes=2)
+        approximate = points.find_nearest("embedding", query_vector, 5, DistanceMeasure.EUCLIDEAN)
+        self.assertEqual(expected, [doc.id for doc in approximate.get()])
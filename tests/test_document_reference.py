@@ -83,6 +83,17 @@ class TestDocumentReference(TestCase):
         self.assertTrue(snapshot.exists)
         self.assertEqual({"name": "Alice", "city": "NYC"}, snapshot.to_dict())
 
+    def test_document_get_with_nested_field_paths(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("doc").set(
+            {"name": "Alice", "address": {"city": "NYC", "zip": "10001"}}
+        )
+        snapshot = fs.collection("foo").document("doc").get(field_paths=["address.city"])
+        self.assertEqual({"address": {"city": "NYC"}}, snapshot.to_dict())
+
+        snapshots = list(fs.get_all([fs.document("foo/doc")], field_paths=["name"]))
+        self.assertEqual([{"name": "Alice"}], [snapshot.to_dict() for snapshot in snapshots])
+
     def test_document_get_with_field_paths_missing_doc(self):
         fs = MockFirestore()
         snapshot = fs.collection("foo").document("missing").get(field_paths=["name"])
@@ -237,6 +248,40 @@ class TestDocumentReference(TestCase):
         subcollections = list(doc_ref.collections())
         self.assertEqual(subcollections, [])
 
+    def test_document_collections_nestedBelowMissingDocuments(self):
+        fs = MockFirestore()
+        doc_ref = fs.collection("foo").document("parent")
+        deep = doc_ref.collection("sub").document("missing").collection("deep").document("d")
+        deep.set({"x": 1})
+        doc_ref.collection("emptied").document("e").set({"x": 1})
+        doc_ref.collection("emptied").document("e").delete()
+
+        self.assertEqual(["sub"], [col.id for col in doc_ref.collections()])
+
+        deep.delete()
+        self.assertEqual([], list(doc_ref.collections()))
+
+    def test_document_get_excludesSubcollections(self):
+        fs = MockFirestore()
+        doc_ref = fs.collection("foo").document("parent")
+        doc_ref.set({"name": "parent"})
+        doc_ref.collection("events").document("e1").set({"n": 1})
+
+        self.assertEqual({"name": "parent"}, doc_ref.get().to_dict())
+        self.assertEqual({"name": "parent"}, fs.collection("foo").get()[0].to_dict())
+
+    def test_document_delete_keepsSubcollections(self):
+        fs = MockFirestore()
+        doc_ref = fs.collection("foo").document("parent")
+        doc_ref.set({"name": "parent"})
+        doc_ref.collection("events").document("e1").set({"n": 1})
+
+        doc_ref.delete()
+
+        self.assertFalse(doc_ref.get().exists)
+        self.assertEqual({"n": 1}, doc_ref.collection("events").document("e1").get().to_dict())
+        self.assertEqual(["events"], [col.id for col in doc_ref.collections()])
+
     def test_document_delete_documentDoesNotExistAfterDelete(self):
         fs = MockFirestore()
         fs.collection("foo").document("first").set({"id": 1})
@@ -251,6 +296,31 @@ class TestDocumentReference(TestCase):
         document = coll.document("first")
         self.assertIs(document.parent, coll)
 
+    def test_document_parent_fromClientPath(self):
+        fs = MockFirestore()
+        document = fs.document("a/b/c/d")
+        self.assertEqual("c", document.parent.id)
+        self.assertEqual("a/b", document.parent.parent.path)
+        self.assertIsNone(document.parent.parent.parent.parent)
+        self.assertEqual(fs.collection("a").document("b").collection("c").document("d"), document)
+
+    def test_document_references_areInterned(self):
+        fs = MockFirestore()
+        document = fs.document("a/b/c/d")
+        fs.collection("a").document("b").collection("c").document("d").set({"n": 1})
+
+        self.assertIs(document, fs.collection("a").document("b").collection("c").document("d"))
+        self.assertIs(document, fs.collection("a/b/c").get()[0].reference)
+        self.assertIs(document.parent, fs.collection("a/b/c"))
+        self.assertIsNot(document, fs.fork().document("a/b/c/d"))
+
+    def test_document_references_areReleasedWhenUnused(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("bar").set({"n": 1})
+        fs.collection("foo").get()
+
+        self.assertEqual({}, dict(fs._store.references))
+
     def test_document_create_createsNewDocument(self):
         fs = MockFirestore()
         doc_content = {"id": "bar"}
@@ -95,3 +95,26 @@ class TestDocumentSnapshot(TestCase):
         contact["email"] = "changed@test.com"
         doc2 = fs.collection("foo").document("first").get()
         self.assertEqual(doc2.get("contact"), {"email": "email@test.com"})
+
+    def test_documentSnapshot_unaffected_by_later_update(self):
+        fs = MockFirestore()
+        doc_ref = fs.collection("foo").document("first")
+        doc_ref.set({"id": 1, "contact": {"email": "email@test.com"}})
+        doc = doc_ref.get()
+
+        doc_ref.update({"id": 2, "contact.email": "changed@test.com"})
+
+        self.assertEqual({"id": 1, "contact": {"email": "email@test.com"}}, doc.to_dict())
+        self.assertEqual("changed@test.com", doc_ref.get().get("contact.email"))
+
+    def test_documentSnapshot_copiesDataOnFirstAccess(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("first").set({"id": 1})
+        fs.collection("foo").document("second").set({"id": 2})
+
+        docs = fs.collection("foo").where("id", ">", 1).get()
+
+        self.assertEqual(1, len(docs))
+        self.assertIsNone(docs[0]._doc)
+        self.assertEqual({"id": 2}, docs[0].to_dict())
+        self.assertIs(docs[0].to_dict(), docs[0].to_dict())
@@ -1,3 +1,6 @@
+import json
+import os
+import tempfile
 from unittest import TestCase
 
 from fake_firestore import AsyncFakeFirestoreClient, FakeFirestoreClient, MockFirestore
@@ -89,6 +92,40 @@ class TestMockFirestore(TestCase):
         self.assertEqual(posts[0].to_dict()["title"], "Post B")
         self.assertEqual(posts[1].to_dict()["title"], "Post C")
 
+    def test_collection_group_order_by_limit_across_collections(self):
+        fs = FakeFirestoreClient()
+        for i in range(30):
+            fs.document(f"users/u{i % 4}/posts/p{i:02d}").set({"likes": i % 7, "n": i})
+
+        def ids(query):
+            return [doc.id for doc in query.stream()]
+
+        group = fs.collection_group("posts")
+        self.assertEqual(
+            ["p27", "p06", "p13", "p20"],
+            ids(group.order_by("likes", direction="DESCENDING").limit(4)),
+        )
+        group = fs.collection_group("posts")
+        top = group.order_by("likes", direction="DESCENDING").order_by("n").offset(1).limit(3)
+        self.assertEqual(["p13", "p20", "p27"], ids(top))
+
+    def test_collection_group_tracks_collections_at_any_depth(self):
+        fs = FakeFirestoreClient()
+        fs.document("posts/p1").set({"n": 1})
+        fs.document("users/u1/posts/p2").set({"n": 2})
+        fs.document("users/u2/posts/p3").set({"n": 3})
+        fs.document("a/b/c/d/posts/p4").set({"n": 4})
+
+        fs.document("users/u2/posts/p3").delete()
+        fs.document("users/u2/posts/p5").set({"n": 5})
+        fs.document("users/u1/posts/p2").delete()
+
+        docs = list(fs.collection_group("posts").stream())
+        self.assertEqual(["p4", "p1", "p5"], [doc.id for doc in docs])
+        group = fs.collection_group("posts")
+        paths = ["/".join(collection._path) for collection in group._collections]
+        self.assertEqual(["a/b/c/d/posts", "posts", "users/u2/posts"], paths)
+
     def test_collection_group_invalid_id_with_slash(self):
         fs = FakeFirestoreClient()
         with self.assertRaises(ValueError) as context:
@@ -111,6 +148,42 @@ class TestSharedData(TestCase):
         self.assertTrue(doc.exists)
         self.assertEqual(doc.to_dict(), {"name": "Alice"})
 
+    def test_seed_from_data(self):
+        data = {
+            "users": {
+                "alice": {"name": "Alice", "address": {"city": "Paris"}},
+                "bob": {"name": "Bob"},
+            }
+        }
+        for fs in (MockFirestore(data=data), MockFirestore(data=data, frozen=True)):
+            users = fs.collection("users")
+            self.assertEqual(["alice", "bob"], [doc.id for doc in users.stream()])
+            alice = users.document("alice").get().to_dict()
+            self.assertEqual({"name": "Alice", "address": {"city": "Paris"}}, alice)
+            self.assertEqual(["bob"], [doc.id for doc in users.where("name", "==", "Bob").get()])
+
+        users = MockFirestore(data=data).collection("users")
+        users.document("alice").update({"name": "Ada"})
+        self.assertEqual("Alice", data["users"]["alice"]["name"])
+
+    def test_seed_from_data_and_written_docs(self):
+        data = {
+            "users": {
+                "alice": {"name": "Alice", "friends": {"bob": {"since": 2020}}},
+                "carol": {"name": "Carol"},
+            }
+        }
+        written_docs = {("users", "alice"), ("users", "alice", "friends", "bob"), ("users", "dan")}
+        fs = MockFirestore(data=data, written_docs=written_docs)
+
+        users = fs.collection("users")
+        self.assertEqual(["alice", "dan"], [doc.id for doc in users.stream()])
+        self.assertEqual({"name": "Alice"}, users.document("alice").get().to_dict())
+        self.assertEqual({}, users.document("dan").get().to_dict())
+        friend = fs.document("users/alice/friends/bob").get()
+        self.assertEqual({"since": 2020}, friend.to_dict())
+        self.assertEqual(["friends"], [c.id for c in users.document("alice").collections()])
+
     def test_independent_clients_do_not_share_data_by_default(self):
         fs1 = MockFirestore()
         fs2 = MockFirestore()
@@ -121,6 +194,444 @@ class TestSharedData(TestCase):
         self.assertFalse(doc.exists)
 
 
+class TestFrozenStorage(TestCase):
+    """Clients created with frozen=True share stored documents with snapshots."""
+
+    def test_to_dict_returns_mutable_copy(self):
+        fs = MockFirestore(frozen=True)
+        fs.collection("foo").document("a").set({"tags": ["x"], "nested": {"n": 1}})
+
+        data = fs.collection("foo").document("a").get().to_dict()
+        data["tags"].append("y")
+        data["nested"]["n"] = 2
+
+        self.assertEqual(
+            {"tags": ["x"], "nested": {"n": 1}},
+            fs.collection("foo").document("a").get().to_dict(),
+        )
+
+    def test_set_does_not_alias_input(self):
+        fs = MockFirestore(frozen=True)
+        content = {"nested": {"n": 1}}
+        fs.collection("foo").document("a").set(content)
+        content["nested"]["n"] = 2
+        self.assertEqual({"nested": {"n": 1}}, fs.collection("foo").document("a").get().to_dict())
+
+    def test_snapshot_is_not_affected_by_later_update(self):
+        fs = MockFirestore(frozen=True)
+        doc_ref = fs.collection("foo").document("a")
+        doc_ref.set({"count": 1, "other": {"k": "v"}})
+        snapshot = doc_ref.get()
+
+        doc_ref.update({"count": 2})
+
+        self.assertEqual(1, snapshot.get("count"))
+        self.assertEqual({"count": 2, "other": {"k": "v"}}, doc_ref.get().to_dict())
+
+    def test_update_shares_untouched_fields(self):
+        fs = MockFirestore(frozen=True)
+        doc_ref = fs.collection("foo").document("a")
+        doc_ref.set({"count": 1, "other": {"k": "v"}})
+        before = doc_ref.get()._data
+
+        doc_ref.update({"count": 2})
+
+        after = doc_ref.get()._data
+        self.assertIs(before["other"], after["other"])
+
+    def test_queries_match_frozen_arrays_and_maps(self):
+        fs = MockFirestore(frozen=True)
+        fs.collection("foo").document("a").set({"tags": ["x", "y"], "meta": {"k": 1}})
+        fs.collection("foo").document("b").set({"tags": ["z"], "meta": {"k": 2}})
+
+        by_array = fs.collection("foo").where("tags", "==", ["x", "y"]).get()
+        by_map = fs.collection("foo").where("meta", "==", {"k": 2}).get()
+        contains = fs.collection("foo").where("tags", "array_contains", "z").get()
+
+        self.assertEqual(["a"], [doc.id for doc in by_array])
+        self.assertEqual(["b"], [doc.id for doc in by_map])
+        self.assertEqual(["b"], [doc.id for doc in contains])
+
+    def test_frozen_arrays_order_like_lists(self):
+        fs = MockFirestore(frozen=True)
+        fs.collection("foo").document("a").set({"tags": ["x", "y"]})
+        tags = fs.collection("foo").document("a").get()._data["tags"]
+
+        self.assertTrue(tags < ["x", "z"] and tags <= ["x", "y"])
+        self.assertTrue(tags > ["x"] and tags >= ["x", "y"])
+        self.assertTrue(["y"] > tags and ["w"] < tags)
+        self.assertEqual(sorted([["z"], tags, ["a"]]), [["a"], ["x", "y"], ["z"]])
+
+    def test_where_range_on_frozen_array(self):
+        fs = MockFirestore(frozen=True)
+        fs.collection("foo").document("a").set({"tags": ["x", "y"]})
+        fs.collection("foo").document("b").set({"tags": ["z"]})
+
+        docs = fs.collection("foo").where("tags", "<", ["y"]).get()
+        self.assertEqual(["a"], [doc.id for doc in docs])
+
+
+class TestMemoryUsage(TestCase):
+    def test_document_size_follows_firestore(self):
+        fs = MockFirestore()
+        task = {
+            "type": "Personal",
+            "done": False,
+            "priority": 1,
+            "description": "Learn Cloud Firestore",
+        }
+        fs.collection("users").document("jeff").collection("tasks").document("my_task_id").set(task)
+
+        usage = fs.collection("users/jeff/tasks").memory_usage()
+        self.assertEqual(1, usage["documents"])
+        self.assertEqual(147, usage["document_bytes"])
+        self.assertEqual(0, fs.collection("users").memory_usage()["documents"])
+
+    def test_figures_follow_writes(self):
+        fs = MockFirestore()
+        empty = fs.memory_usage()
+        fs.collection("foo").document("a").set({"s": "x" * 1000})
+        fs.collection("foo").document("b").set({"s": "y"})
+        fs.collection("bar").document("c").set({"n": 1})
+
+        usage = fs.memory_usage()
+        self.assertEqual(3, usage["documents"])
+        self.assertGreater(usage["data_bytes"], 1000)
+        self.assertGreater(usage["index_bytes"], empty["index_bytes"])
+
+        fs.collection("foo").document("a").update({"s": "z"})
+        fs.collection("bar").document("c").delete()
+
+        foo = fs.collection("foo").memory_usage()
+        self.assertEqual(2, fs.memory_usage()["documents"])
+        self.assertEqual(foo["document_bytes"], fs.memory_usage()["document_bytes"])
+        self.assertEqual(foo["data_bytes"], fs.memory_usage()["data_bytes"])
+        self.assertLess(foo["data_bytes"], 1000)
+
+        fs.reset()
+        self.assertEqual(0, fs.memory_usage()["document_bytes"])
+
+    def test_figures_follow_writes_to_documents_with_subcollections(self):
+        fs = MockFirestore()
+        fs.collection("users").document("a").set({"s": "x" * 100})
+        fs.collection("users").document("b").set({"s": "y"})
+        fs.collection("users").document("c").set({"s": "z" * 100})
+        fs.memory_usage()
+
+        for document_id in ("a", "c"):
+            posts = fs.collection("users").document(document_id).collection("posts")
+            posts.document("p").set({"n": 1})
+            posts.document("p").delete()
+        fs.collection("users").document("a").delete()
+        fs.collection("users").document("c").set({"s": "z"})
+
+        expected = MockFirestore()
+        expected.collection("users").document("b").set({"s": "y"})
+        expected.collection("users").document("c").set({"s": "z"})
+        usage = fs.collection("users").memory_usage()
+        self.assertEqual(expected.collection("users").memory_usage(), usage)
+        self.assertEqual(usage["document_bytes"], fs.memory_usage()["document_bytes"])
+        self.assertEqual(usage["data_bytes"], fs.memory_usage()["data_bytes"])
+
+    def test_measuring_leaves_fork_untouched(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("a").set({"s": "x" * 100})
+        forked = fs.fork()
+        shared = forked._store._documents[("foo", "a")]
+
+        usage = fs.memory_usage()
+        self.assertGreater(usage["document_bytes"], 100)
+        self.assertEqual(0, shared.size)
+        self.assertIs(shared, forked._store._documents[("foo", "a")])
+        self.assertEqual(usage, forked.memory_usage())
+
+
+class TestFork(TestCase):
+    """fork() returns a client with an independent copy of the data."""
+
+    def test_fork_sees_existing_data(self):
+        fs = MockFirestore()
+        fs.collection("users").document("alice").set({"name": "Alice"})
+        fs.collection("users").document("alice").collection("posts").document("p").set({"n": 1})
+
+        forked = fs.fork()
+
+        self.assertEqual({"name": "Alice"}, forked.document("users/alice").get().to_dict())
+        self.assertEqual(["p"], [doc.id for doc in forked.collection("users/alice/posts").stream()])
+        self.assertEqual(["users"], [c.id for c in forked.collections()])
+
+    def test_writes_do_not_leak_between_forks(self):
+        fs = MockFirestore()
+        fs.collection("users").document("alice").set({"name": "Alice"})
+        forked = fs.fork()
+
+        forked.collection("users").document("bob").set({"name": "Bob"})
+        forked.collection("users").document("alice").update({"name": "Alicia"})
+        fs.collection("users").document("carol").set({"name": "Carol"})
+        fs.collection("users").document("alice").delete()
+
+        self.assertEqual(["carol"], [doc.id for doc in fs.collection("users").stream()])
+        self.assertEqual(
+            [("alice", "Alicia"), ("bob", "Bob")],
+            [(doc.id, doc.get("name")) for doc in forked.collection("users").stream()],
+        )
+
+    def test_fork_of_fork_and_reset(self):
+        fs = MockFirestore()
+        fs.collection("foo").document("a").set({"n": 1})
+        child = fs.fork()
+        grandchild = child.fork()
+
+        child.reset()
+        grandchild.collection("bar").document("b").set({"n": 2})
+
+        self.assertTrue(fs.document("foo/a").get().exists)
+        self.assertEqual([], list(child.collections()))
+        self.assertEqual(["bar", "foo"], [c.id for c in grandchild.collections()])
+        self.assertEqual(["foo"], [c.id for c in fs.collections()])
+
+    def test_fork_large_collection(self):
+        fs = MockFirestore()
+        for i in range(3000):
+            fs.collection("items").document(f"{i:05d}").set({"n": i})
+        forked = fs.fork()
+
+        for i in range(0, 3000, 7):
+            forked.collection("items").document(f"{i:05d}").delete()
+        forked.collection("items").document("99999").set({"n": -1})
+
+        self.assertEqual(3000, len(fs.collection("items").get()))
+        ids = [doc.id for doc in forked.collection("items").stream()]
+        self.assertEqual(sorted(ids), ids)
+        self.assertEqual(3000 - 429 + 1, len(ids))
+        self.assertEqual("00001", ids[0])
+
+    def test_frozen_fork(self):
+        fs = MockFirestore(frozen=True)
+        fs.collection("foo").document("a").set({"tags": ["x"]})
+        forked = fs.fork()
+
+        forked.collection("foo").document("a").update({"tags": ["y"]})
+
+        self.assertEqual({"tags": ["x"]}, fs.document("foo/a").get().to_dict())
+        self.assertEqual({"tags": ["y"]}, forked.document("foo/a").get().to_dict())
+
+
+class TestQueryCache(TestCase):
+    """enable_query_cache() caches query results until a write invalidates them."""
+
+    def _client(self, **kwargs):
+        fs = MockFirestore()
+        for i in range(5):
+            fs.collection("foo").document(f"d{i}").set({"n": i})
+        fs.enable_query_cache(**kwargs)
+        return fs
+
+    def test_repeated_query_hits(self):
+        fs = self._client()
+        query = fs.collection("foo").where("n", ">=", 2).order_by("n").limit(2)
+
+        first = [doc.id for doc in query.stream()]
+        again = fs.collection("foo").where("n", ">=", 2).order_by("n").limit(2)
+        second = [doc.id for doc in again.stream()]
+
+        self.assertEqual(["d2", "d3"], first)
+        self.assertEqual(first, second)
+        info = fs.query_cache_info()
+        self.assertEqual((1, 1, 1), (info["hits"], info["misses"], info["entries"]))
+
+    def test_different_queries_miss(self):
+        fs = self._client()
+        fs.collection("foo").where("n", ">=", 2).get()
+        fs.collection("foo").where("n", ">=", 3).get()
+        fs.collection("foo").where("n", ">=", 2).limit(1).get()
+
+        self.assertEqual(0, fs.query_cache_info()["hits"])
+        self.assertEqual(3, fs.query_cache_info()["entries"])
+
+    def test_writes_invalidate(self):
+        fs = self._client()
+        query = fs.collection("foo").where("n", ">=", 3)
+        self.assertEqual(["d3", "d4"], [doc.id for doc in query.stream()])
+
+        fs.collection("foo").document("d5").set({"n": 5})
+        self.assertEqual(["d3", "d4", "d5"], [doc.id for doc in query.stream()])
+        fs.collection("foo").document("d3").update({"n": 0})
+        self.assertEqual(["d4", "d5"], [doc.id for doc in query.stream()])
+        fs.collection("foo").document("d4").delete()
+        self.assertEqual(["d5"], [doc.id for doc in query.stream()])
+        batch = fs.batch()
+        batch.set(fs.collection("foo").document("d6"), {"n": 6})
+        batch.commit()
+        self.assertEqual(["d5", "d6"], [doc.id for doc in query.stream()])
+        self.assertEqual(0, fs.query_cache_info()["hits"])
+
+    def test_writes_to_other_collections_keep_entries(self):
+        fs = self._client()
+        fs.collection("foo").where("n", "==", 1).get()
+        fs.collection("bar").document("a").set({"n": 1})
+        fs.collection("foo").document("d1").collection("sub").document("a").set({"n": 1})
+
+        query = fs.collection("foo").where("n", "==", 1)
+        self.assertEqual(["d1"], [doc.id for doc in query.stream()])
+        self.assertEqual(1, fs.query_cache_info()["hits"])
+
+    def test_collection_group_invalidation(self):
+        fs = self._client()
+        fs.collection("a/x/items").document("1").set({"n": 1})
+        fs.collection("b/y/items").document("2").set({"n": 2})
+        group = fs.collection_group("items").where("n", ">", 0)
+        self.assertEqual(["1", "2"], [doc.id for doc in group.stream()])
+
+        fs.collection("b/y/items").document("2").update({"n": 0})
+        self.assertEqual(["1"], [doc.id for doc in group.stream()])
+        self.assertEqual(["1"], [doc.id for doc in group.stream()])
+        self.assertEqual(1, fs.query_cache_info()["hits"])
+
+    def test_cached_snapshots_are_independent(self):
+        fs = self._client()
+        query = fs.collection("foo").select(["n"]).limit(1)
+        query.get()[0].to_dict()["n"] = 100
+
+        self.assertEqual({"n": 0}, query.get()[0].to_dict())
+        self.assertEqual({"n": 0}, fs.document("foo/d0").get().to_dict())
+        self.assertEqual(1, fs.query_cache_info()["hits"])
+
+    def test_lru_eviction(self):
+        fs = self._client(max_entries=2)
+        for n in (1, 2, 1, 3):
+            fs.collection("foo").where("n", "==", n).get()
+
+        info = fs.query_cache_info()
+        self.assertEqual(
+            (1, 3, 1, 2), (info["hits"], info["misses"], info["evictions"], info["entries"])
+        )
+        fs.collection("foo").where("n", "==", 1).get()
+        self.assertEqual(2, fs.query_cache_info()["hits"])
+        fs.collection("foo").where("n", "==", 2).get()
+        self.assertEqual(4, fs.query_cache_info()["misses"])
+
+    def test_max_bytes(self):
+        fs = self._client(max_bytes=1)
+        fs.collection("foo").where("n", ">", 0).get()
+        fs.collection("foo").where("n", ">", 0).get()
+
+        self.assertEqual(0, fs.query_cache_info()["entries"])
+        self.assertEqual(0, fs.query_cache_info()["hits"])
+
+    def test_disable(self):
+        fs = self._client()
+        fs.collection("foo").where("n", ">", 0).get()
+        fs.disable_query_cache()
+        fs.collection("foo").where("n", ">", 0).get()
+
+        info = fs.query_cache_info()
+        self.assertEqual({"hits": 0, "misses": 0, "evictions": 0, "entries": 0, "bytes": 0}, info)
+        with self.assertRaises(ValueError):
+            fs.enable_query_cache(max_entries=0)
+
+    def test_fork_has_own_cache(self):
+        fs = self._client()
+        fs.collection("foo").where("n", "<", 3).get()
+        forked = fs.fork()
+        forked.collection("foo").document("d0").delete()
+
+        self.assertEqual(2, len(forked.collection("foo").where("n", "<", 3).get()))
+        self.assertEqual(3, len(fs.collection("foo").where("n", "<", 3).get()))
+        self.assertEqual(1, fs.query_cache_info()["hits"])
+        self.assertEqual(0, forked.query_cache_info()["hits"])
+
+
+class TestCompositeIndexes(TestCase):
+    """Composite indexes declared in a firestore.indexes.json file."""
+
+    INDEXES = {
+        "indexes": [
+            {
+                "collectionGroup": "events",
+                "queryScope": "COLLECTION",
+                "fields": [
+                    {"fieldPath": "tenant", "order": "ASCENDING"},
+                    {"fieldPath": "ts", "order": "DESCENDING"},
+                ],
+            },
+            {
+                "collectionGroup": "events",
+                "queryScope": "COLLECTION",
+                "fields": [
+                    {"fieldPath": "tenant", "order": "ASCENDING"},
+                    {"fieldPath": "tags", "arrayConfig": "CONTAINS"},
+                ],
+            },
+        ],
+        "fieldOverrides": [],
+    }
+
+    def _seed(self, fs):
+        events = fs.collection("events")
+        for i in range(12):
+            events.document(f"e{i:02d}").set({"tenant": ["a", "b", True][i % 3], "ts": i})
+        events.document("x").set({"tenant": 1, "ts": 5})
+        events.document("y").set({"tenant": "a"})
+        return events
+
+    def _query(self, events):
+        return (
+            events.where("tenant", "==", "a")
+            .where("ts", "<", 10)
+            .order_by("ts", direction="DESCENDING")
+            .limit(2)
+        )
+
+    def test_query_follows_index(self):
+        indexed = self._seed(MockFirestore(indexes=self.INDEXES))
+        plain = self._seed(MockFirestore())
+
+        for events in (indexed, plain):
+            self.assertEqual(["e09", "e06"], [doc.id for doc in self._query(events).stream()])
+            ascending = events.where("tenant", "==", 1).order_by("ts").get()
+            self.assertEqual(["e02", "e05", "x", "e08", "e11"], [doc.id for doc in ascending])
+
+        indexed.document("e09").update({"ts": 20})
+        indexed.document("e06").delete()
+        indexed.document("z").set({"tenant": "a", "ts": 7})
+
+        self.assertEqual(["z", "e03"], [doc.id for doc in self._query(indexed).stream()])
+
+    def test_equality_order_sets_tie_direction(self):
+        results = []
+        for fs in (MockFirestore(indexes=self.INDEXES), MockFirestore()):
+            events = fs.collection("events")
+            for i in range(4):
+                events.document(f"e{i}").set({"tenant": "a", "ts": i // 2})
+
+            def tenant():
+                return events.where("tenant", "==", "a")
+
+            queries = [
+                tenant().order_by("tenant", direction="DESCENDING").limit(2),
+                tenant().where("ts", "==", 1).order_by("tenant", direction="DESCENDING"),
+                tenant().order_by("ts", direction="DESCENDING").order_by("tenant"),
+                tenant().order_by("ts", direction="DESCENDING"),
+            ]
+            results.append([[doc.id for doc in query.get()] for query in queries])
+
+        expected = [["e3", "e2"], ["e3", "e2"], ["e2", "e3", "e0", "e1"], ["e3", "e2", "e1", "e0"]]
+        self.assertEqual([expected, expected], results)
+
+    def test_load_indexes_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "firestore.indexes.json")
+            with open(path, "w") as file:
+                json.dump(self.INDEXES, file)
+            fs = MockFirestore()
+            fs.load_indexes(path)
+
+        events = self._seed(fs)
+        self.assertEqual(["e09", "e06"], [doc.id for doc in self._query(events).stream()])
+        self.assertEqual(1, len(fs._store.composite_indexes(("events",))))
+
+
 async def test_sync_write_visible_to_async():
     shared_data: dict = {}
     shared_written_docs: set = set()
@@ -173,3 +684,15 @@ async def test_async_mock_firestore_alias():
     doc = await async_db.collection("items").document("x").get()
     assert doc.exists
     assert doc.to_dict() == {"val": 42}
+
+
+async def test_async_fork():
+    db = AsyncFakeFirestoreClient()
+    await db.collection("items").document("x").set({"val": 1})
+
+    forked = db.fork()
+    await forked.collection("items").document("x").set({"val": 2})
+
+    assert isinstance(forked, AsyncFakeFirestoreClient)
+    assert (await db.collection("items").document("x").get()).to_dict() == {"val": 1}
+    assert (await forked.collection("items").document("x").get()).to_dict() == {"val": 2}